@@ -43,10 +43,16 @@ class Config(object):
             "cover_spacing": 5000,
             "orientation_decimate": 1,
             "contact_decimate": 5,
+            "contact_spacing": 250,
             "intrusion_mode": 0,
             "interpolation_spacing": 500,
             "misorientation": 30,
             "interpolation_scheme": "scipy_rbf",
+            "interpolation_memory_limit": 1024,
+            "interpolation_neighbours": 32,
+            "interpolation_seed": 1,
+            "interpolation_cache_path": "",
+            "n_workers": 1,
             "fault_decimate": 5,
             "min_fault_length": 5000,
             "fault_dip": 90,
@@ -132,6 +138,7 @@ class Config(object):
                 self.run_flags["contact_orientation_decimate"], 1
             )
             self.run_flags["fold_decimate"] = max(self.run_flags["fold_decimate"], 1)
+            self.run_flags["n_workers"] = max(self.run_flags["n_workers"], 1)
         else:
             print(
                 "run_flags must be a dictionary, setting config run flags to the defaults."
@@ -1,11 +1,11 @@
 from shapely.geometry import (
     Polygon,
-    MultiLineString,
     LineString,
     Point,
     MultiPolygon,
 )
 import geopandas as gpd
+import shapely
 import pandas as pd
 from math import (
     acos,
@@ -17,8 +17,6 @@ from math import (
     fabs,
     atan2,
     fmod,
-    isnan,
-    atan,
     asin,
 )
 from . import m2l_utils
@@ -27,6 +25,8 @@ from . import m2l_interpolation
 import numpy as np
 import os
 import random
+import shutil
+import tempfile
 import networkx as nx
 import statistics
 from shapely.ops import snap
@@ -34,6 +34,7 @@ import beartype
 from .m2l_enums import Datatype, VerboseLevel
 from .config import Config
 from .mapdata import MapData
+from concurrent.futures import ProcessPoolExecutor
 from osgeo import ogr
 from shapely.wkt import loads
 
@@ -71,7 +72,7 @@ def save_orientations(config: Config, map_data: MapData, workflow):
         cover_map ([boolean]): [availability of cover map]
     """
     structures = map_data.get_map_data(Datatype.STRUCTURE)
-    dtm = map_data.get_map_data(Datatype.DTM).open()
+    dtm = map_data.get_map_data(Datatype.DTM)
     dtb = map_data.dtb
     dtb_null = map_data.dtb_null
     is_bed = structures["STRUCTURE_TYPE"].str.contains(
@@ -81,8 +82,7 @@ def save_orientations(config: Config, map_data: MapData, workflow):
     structure_clip = structures[is_bed]
     # print(structure_clip.columns)
     i = 0
-    f = open(os.path.join(config.output_path, "orientations.csv"), "w")
-    f.write("X,Y,Z,azimuth,dip,polarity,formation\n")
+    rows = []
     for indx, apoint in structure_clip.iterrows():
         if not str(apoint["ROCKTYPE1"]) == "None":
             if not str(apoint["ROCKTYPE1"]) == "nan":
@@ -98,27 +98,33 @@ def save_orientations(config: Config, map_data: MapData, workflow):
                             and apoint["geometry"].y > dtm.bounds[1]
                             and apoint["geometry"].y < dtm.bounds[3]
                         ):
-                            height = m2l_utils.value_from_dtm_dtb(
-                                dtm, dtb, dtb_null, workflow["cover_map"], locations
-                            )
                             dipdir = apoint["DIPDIR"]
                             if apoint["POLARITY"] != config.c_l["btype"]:
                                 polarity = 1
                             else:
                                 polarity = 0
-                            ostr = "{},{},{},{},{},{},{}\n".format(
-                                apoint["geometry"].x,
-                                apoint["geometry"].y,
-                                height,
-                                dipdir,
-                                apoint["DIP"],
-                                polarity,
-                                apoint["UNIT_NAME"].replace(" ", "_").replace("-", "_"),
+                            rows.append(
+                                (
+                                    locations[0],
+                                    dipdir,
+                                    apoint["DIP"],
+                                    polarity,
+                                    apoint["UNIT_NAME"]
+                                    .replace(" ", "_")
+                                    .replace("-", "_"),
+                                )
                             )
-                            # ostr = str(apoint['geometry'].x)+","+str(apoint['geometry'].y)+","+height+","+str(dipdir)+","+str(apoint['DIP'])+",1,"+str(apoint['UNIT_NAME'].replace(" ","_").replace("-","_"))+"\n"
-                            f.write(ostr)
                     i = i + 1
 
+    # sample heights for all retained orientations in one pass over the dtm
+    heights = m2l_utils.values_from_dtm_dtb(
+        dtm, dtb, dtb_null, workflow["cover_map"], [row[0] for row in rows]
+    )
+    f = open(os.path.join(config.output_path, "orientations.csv"), "w")
+    f.write("X,Y,Z,azimuth,dip,polarity,formation\n")
+    for row, height in zip(rows, heights):
+        ostr = "{},{},{},{},{},{},{}\n".format(row[0][0], row[0][1], height, *row[1:])
+        f.write(ostr)
     f.close()
 
     # try:
@@ -140,8 +146,7 @@ def save_orientations(config: Config, map_data: MapData, workflow):
             "F4",
             "F5",
         ]
-        f = open(os.path.join(config.output_path, "secondary_orientations.csv"), "w")
-        f.write("X,Y,Z,type,azimuth,dip,polarity,formation\n")
+        rows = []
         for indx, apoint in structures.iterrows():
             if not str(apoint["ROCKTYPE1"]) == "None":
                 if not str(apoint["ROCKTYPE1"]) == "nan":
@@ -157,9 +162,6 @@ def save_orientations(config: Config, map_data: MapData, workflow):
                                 and apoint["geometry"].y > dtm.bounds[1]
                                 and apoint["geometry"].y < dtm.bounds[3]
                             ):
-                                height = m2l_utils.value_from_dtm_dtb(
-                                    dtm, dtb, dtb_null, workflow["cover_map"], locations
-                                )
                                 dipdir = apoint["DIPDIR"]
                                 polarity = 1
                                 index = 0
@@ -173,20 +175,28 @@ def save_orientations(config: Config, map_data: MapData, workflow):
                                         break
                                     index = index + 1
                                 if not sl_code_found == "":
-                                    ostr = "{},{},{},{},{},{},{},{}\n".format(
-                                        apoint["geometry"].x,
-                                        apoint["geometry"].y,
-                                        height,
-                                        sl_code_found,
-                                        dipdir,
-                                        apoint["DIP"],
-                                        polarity,
-                                        apoint["UNIT_NAME"],
+                                    rows.append(
+                                        (
+                                            locations[0],
+                                            sl_code_found,
+                                            dipdir,
+                                            apoint["DIP"],
+                                            polarity,
+                                            apoint["UNIT_NAME"],
+                                        )
                                     )
-                                    # ostr = str(apoint['geometry'].x)+","+str(apoint['geometry'].y)+","+height+","+str(dipdir)+","+str(apoint['DIP'])+",1,"+str(apoint['UNIT_NAME'].replace(" ","_").replace("-","_"))+"\n"
-                                    f.write(ostr)
                         i = i + 1
 
+        heights = m2l_utils.values_from_dtm_dtb(
+            dtm, dtb, dtb_null, workflow["cover_map"], [row[0] for row in rows]
+        )
+        f = open(os.path.join(config.output_path, "secondary_orientations.csv"), "w")
+        f.write("X,Y,Z,type,azimuth,dip,polarity,formation\n")
+        for row, height in zip(rows, heights):
+            ostr = "{},{},{},{},{},{},{},{}\n".format(
+                row[0][0], row[0][1], height, *row[1:]
+            )
+            f.write(ostr)
         f.close()
     else:
         if config.verbose_level != VerboseLevel.NONE:
@@ -287,7 +297,7 @@ def create_orientations(config: Config, map_data: MapData, workflow: dict):
     f.write("X,Y,Z,azimuth,dip,polarity,formation\n")
     # f.write("X,Y,Z,DipDirection,dip,dippolarity,formation\n")
 
-    dtm = map_data.get_map_data(Datatype.DTM).open()
+    dtm = map_data.get_map_data(Datatype.DTM)
     for i in range(0, ngroups):
         if groups[i][1] == 0:
             for indx, ageol in geology.iterrows():
@@ -410,58 +420,52 @@ def save_basal_contacts(
     geology = map_data.get_map_data(Datatype.GEOLOGY).copy()
     # Remove intrusions for geology
     geology = geology[~geology["ROCKTYPE1"].str.contains(config.c_l["intrusive"])]
-    geology = geology.dissolve(by="UNIT_NAME", as_index=False)
-    units = geology["UNIT_NAME"].unique()
-    column_names = ["UNIT_NAME_1", "UNIT_NAME_2", "geometry"]
-    contacts = gpd.GeoDataFrame(crs=geology.crs, columns=column_names, data=None)
-    while len(units) > 1:
-        unit1 = units[0]
-        units = units[1:]
-        for unit2 in units:
-            if unit1 != unit2:
-                join = gpd.overlay(
-                    geology[geology["UNIT_NAME"] == unit1],
-                    geology[geology["UNIT_NAME"] == unit2],
-                    keep_geom_type=False,
-                )[column_names]
-                join["geometry"] = join.buffer(1)
-                buffered = geology[geology["UNIT_NAME"] == unit2][["geometry"]].copy()
-                buffered["geometry"] = buffered.boundary
-                end = gpd.overlay(buffered, join, keep_geom_type=False)
-                if len(end):
-                    contacts = pd.concat([contacts, end], ignore_index=True)
-
-    # get stratigraphic column from (all_sorts.csv)
-    units = pd.read_csv(os.path.join(config.tmp_path, "all_sorts.csv"))["code"].tolist()
-    groups = pd.read_csv(os.path.join(config.tmp_path, "all_sorts.csv"))[
-        "group"
-    ].tolist()
+    geology = geology.dissolve(by="UNIT_NAME", as_index=False).reset_index(drop=True)
+
+    # only pairs of units whose polygons touch can share a contact, so find them all in
+    # one spatial index query rather than overlaying every pair of units
+    unit1, unit2 = geology.sindex.query(geology.geometry, predicate="intersects")
+    is_pair = unit1 < unit2
+    unit1 = unit1[is_pair]
+    unit2 = unit2[is_pair]
+    pair_order = np.lexsort((unit2, unit1))
+    unit1 = unit1[pair_order]
+    unit2 = unit2[pair_order]
+
+    # the contact is the part of unit2's boundary within 1m of where the two units meet
+    polygons1 = gpd.GeoSeries(geology.geometry.values[unit1])
+    polygons2 = gpd.GeoSeries(geology.geometry.values[unit2])
+    join = polygons1.intersection(polygons2).buffer(1)
+    contacts = gpd.GeoDataFrame(
+        {
+            "UNIT_NAME_1": geology["UNIT_NAME"].to_numpy()[unit1],
+            "UNIT_NAME_2": geology["UNIT_NAME"].to_numpy()[unit2],
+        },
+        geometry=polygons2.boundary.intersection(join).values,
+        crs=geology.crs,
+    )
+    contacts = contacts[~contacts.is_empty].reset_index(drop=True)
+
+    # get stratigraphic column from (all_sorts.csv) as a lookup from unit name to its
+    # position in the column, keeping the first position of any repeated unit name
+    all_sorts = pd.read_csv(os.path.join(config.tmp_path, "all_sorts.csv"))
+    units = all_sorts["code"].to_numpy()
+    groups = all_sorts["group"].to_numpy()
+    unit_rank = pd.Series(np.arange(len(units)), index=units)
+    unit_rank = unit_rank[~unit_rank.index.duplicated()]
+    rank1 = unit_rank.loc[contacts["UNIT_NAME_1"]].to_numpy()
+    rank2 = unit_rank.loc[contacts["UNIT_NAME_2"]].to_numpy()
 
     # assign contact as basal based on its location in the column
     # also if it's adjacent indicate it's a basal contact otherwise indicate it
     # has skipped a unit with the abnormal contact type
     basal_contacts = contacts.copy()
-    basal_contacts["ID"] = basal_contacts.apply(
-        lambda row: min(
-            units.index(row["UNIT_NAME_1"]),
-            units.index(row["UNIT_NAME_2"]),
-        ),
-        axis=1,
-    )
-    basal_contacts["UNIT_NAME"] = basal_contacts.apply(
-        lambda row: units[row["ID"]], axis=1
-    )
-    basal_contacts["GROUP"] = basal_contacts.apply(
-        lambda row: groups[row["ID"]], axis=1
-    )
-    basal_contacts["distance"] = basal_contacts.apply(
-        lambda row: abs(
-            units.index(row["UNIT_NAME_1"]) - units.index(row["UNIT_NAME_2"])
-        ),
-        axis=1,
-    )
-    basal_contacts["type"] = basal_contacts.apply(
-        lambda row: "ABNORMAL" if abs(row["distance"]) > 1 else "BASAL", axis=1
+    basal_contacts["ID"] = np.minimum(rank1, rank2)
+    basal_contacts["UNIT_NAME"] = units[basal_contacts["ID"]]
+    basal_contacts["GROUP"] = groups[basal_contacts["ID"]]
+    basal_contacts["distance"] = np.abs(rank1 - rank2)
+    basal_contacts["type"] = np.where(
+        basal_contacts["distance"] > 1, "ABNORMAL", "BASAL"
     )
     basal_contacts = basal_contacts[["geometry", "ID", "UNIT_NAME", "GROUP", "type"]]
 
@@ -622,45 +626,26 @@ def save_basal_contacts_csv(
     contacts: gpd.GeoDataFrame, config: Config, map_data: MapData, workflow: dict
 ):
     # sample points along the boundary of polygons or lines
-    spacing = 250
-    schema = {"ID": str, "X": float, "Y": float}
-    df = pd.DataFrame(columns=schema.keys()).astype(schema)
-    for _, row in contacts.iterrows():
-        if type(row.geometry) == MultiPolygon:
-            targets = row.geometry.boundary.geoms
-        elif type(row.geometry) == Polygon:
-            targets = [row.geometry.boundary]
-        elif type(row.geometry) == MultiLineString:
-            targets = row.geometry.geoms
-        elif type(row.geometry) == LineString:
-            targets = [row.geometry]
-        else:
-            targets = []
-
-        # For the main cases Polygon and LineString the list 'targets' has one element
-        for target in targets:
-            df2 = pd.DataFrame(columns=schema.keys()).astype(schema)
-            distances = np.arange(0, target.length, spacing)[:-1]
-            points = [target.interpolate(distance) for distance in distances]
-            df2["X"] = [point.x for point in points]
-            df2["Y"] = [point.y for point in points]
-            # df2["ID"] = row["ID"]
-            df2["GROUP"] = row["GROUP"]
-            df2["UNIT_NAME"] = row["UNIT_NAME"]
-            df = pd.concat([df, df2])
-    df.reset_index(drop=True, inplace=True)
+    x, y, index = m2l_utils.resample_lines(
+        contacts.geometry.to_numpy(), config.run_flags["contact_spacing"]
+    )
+    df = pd.DataFrame(
+        {
+            "X": x,
+            "Y": y,
+            "GROUP": contacts["GROUP"].to_numpy()[index],
+            "UNIT_NAME": contacts["UNIT_NAME"].to_numpy()[index],
+        }
+    )
 
     # get "Z" height value for contact points
-    dtm = map_data.get_map_data(Datatype.DTM).open()
-    df["Z"] = df.apply(
-        lambda row: m2l_utils.value_from_dtm_dtb(
-            dtm,
-            map_data.dtb,
-            map_data.dtb_null,
-            workflow["cover_map"],
-            [(row["X"], row["Y"])],
-        ),
-        axis=1,
+    dtm = map_data.get_map_data(Datatype.DTM)
+    df["Z"] = m2l_utils.values_from_dtm_dtb(
+        dtm,
+        map_data.dtb,
+        map_data.dtb_null,
+        workflow["cover_map"],
+        df[["X", "Y"]].to_numpy(),
     )
 
     # decimate by config.run_flags["contact_decimate"] for contacts output
@@ -781,25 +766,61 @@ def save_contacts_with_faults_removed(
 
 @beartype.beartype
 def save_faults(config: Config, map_data: MapData, workflow: dict):
-    dtm = map_data.get_map_data(Datatype.DTM).open()
+    dtm = map_data.get_map_data(Datatype.DTM)
     faults = map_data.get_map_data(Datatype.FAULT)
-    f = open(os.path.join(config.output_path, "faults.csv"), "w")
-    f.write("X,Y,Z,formation\n")
-    fo = open(os.path.join(config.output_path, "fault_orientations.csv"), "w")
-    fo.write("X,Y,Z,DipDirection,dip,DipPolarity,formation\n")
-    # fo.write("X,Y,Z,azimuth,dip,polarity,formation\n")
-    fd = open(os.path.join(config.output_path, "fault_dimensions.csv"), "w")
-    fd.write(
-        "Fault,HorizontalRadius,VerticalRadius,InfluenceDistance,incLength,colour\n"
+    fault_points = pd.DataFrame(columns=["X", "Y", "Z", "formation"])
+    fault_orientations = pd.DataFrame(
+        columns=["X", "Y", "Z", "DipDirection", "dip", "DipPolarity", "formation"]
+    )
+    fault_dimensions = pd.DataFrame(
+        columns=[
+            "Fault",
+            "HorizontalRadius",
+            "VerticalRadius",
+            "InfluenceDistance",
+            "incLength",
+            "colour",
+        ]
     )
-    # fd.write("Fault_ID,strike,dip_direction,down_dip\n")
     if faults is not None:
-        local_faults = faults.copy()
-        local_faults = local_faults.dropna(subset=["geometry"])
+        local_faults = faults.dropna(subset=["geometry"])
+        # multipart faults are exploded when the fault map is checked
+        local_faults = local_faults[
+            local_faults["FEATURE"]
+            .astype(str)
+            .str.lower()
+            .str.contains(config.c_l["fault"].lower(), regex=False)
+            & (local_faults.geom_type == "LineString")
+            & ~local_faults.is_empty
+        ]
+        geometry = local_faults.geometry.values
+        start = shapely.get_coordinates(shapely.get_point(geometry, 0))
+        end = shapely.get_coordinates(shapely.get_point(geometry, -1))
+        dlsx = start[:, 0] - end[:, 0]
+        dlsy = start[:, 1] - end[:, 1]
+        strike = np.sqrt((dlsx * dlsx) + (dlsy * dlsy))
+        long_enough = strike > config.run_flags["min_fault_length"]
+        local_faults = local_faults[long_enough]
+        geometry = geometry[long_enough]
+        dlsx = dlsx[long_enough]
+        dlsy = dlsy[long_enough]
+        strike = strike[long_enough]
+        azimuth_fault = np.degrees(np.arctan2(dlsy, -dlsx)) % 180
+        # closed traces have no strike direction so no points are saved for them
+        closed = (dlsx == 0.0) & (dlsy == 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lsx = dlsx / strike
+            lsy = dlsy / strike
+        fault_name = (
+            "Fault_" + local_faults["GEOMETRY_OBJECT_ID"].astype(str)
+        ).to_numpy()
 
         # convert text dips to equally spaced angles
         split = config.c_l["fdipest_vals"].split(",")
         fault_dip_choices = np.linspace(0, 90, len(split) + 1)
+        dip_estimates = {
+            choice: int(fault_dip_choices[i + 1]) for i, choice in enumerate(split)
+        }
         dip_dirs = {
             "north": (0.0, 1.0),
             "northeast": (0.707, 0.707),
@@ -820,426 +841,172 @@ def save_faults(config: Config, map_data: MapData, workflow: dict):
             "Unknown": (0.0, 1.0),
             "Vertical": (0.707, 0.707),
         }
-        random.seed(1)
-        for indx, flt in local_faults.iterrows():
-            if config.c_l["fault"].lower() in flt["FEATURE"].lower():
-                fault_name = "Fault_" + str(flt["GEOMETRY_OBJECT_ID"])
-                # display(flt.geometry.geom_type)
-                if flt.geometry.geom_type == "LineString":
-                    flt_ls = LineString(flt.geometry)
-                    dlsx = (
-                        flt_ls.coords[0][0] - flt_ls.coords[len(flt_ls.coords) - 1][0]
-                    )
-                    dlsy = (
-                        flt_ls.coords[0][1] - flt_ls.coords[len(flt_ls.coords) - 1][1]
-                    )
-                    strike = sqrt((dlsx * dlsx) + (dlsy * dlsy))
-                    azimuth_fault = degrees(atan2(dlsy, -dlsx)) % 180
-                    if strike > config.run_flags["min_fault_length"]:
-                        i = 0
-                        saved = 0
-                        fault_dip = 90.0
-                        # null specifc dip defined
-                        # print(config.c_l['fdipdir_flag'] ,str(flt["DIPDIR"]), int(flt["DIP"]) , int(config.c_l['fdipnull']),str(flt["DIP_ESTIMATE"]),config.run_flags['fault_dip'])
-                        if int(float(flt["DIP"])) == int(float(config.c_l["fdipnull"])):
-                            # dip estimate defined
-                            if not str(flt["DIP_ESTIMATE"]) == "-999":
-                                i = 0
-                                for choice in split:
-                                    if flt["GEOMETRY_OBJECT_ID"] == "-1":
-                                        print(choice)
-                                    if choice == flt["DIP_ESTIMATE"]:
-                                        fault_dip = int(fault_dip_choices[i + 1])
-                                        if flt["GEOMETRY_OBJECT_ID"] == "-1":
-                                            print("found_dip", fault_dip)
-                                    i = i + 1
-                            else:
-                                if (
-                                    flt["DIP"] == -999
-                                    or config.run_flags["fault_dip"] == -999
-                                ):  # random flag
-                                    fault_dip = random.randint(60, 90)
-                                else:
-                                    fault_dip = config.run_flags["fault_dip"]
-                        else:
-                            # specific dip defined
-                            fault_dip = int(float(flt["DIP"]))
-
-                        # numeric dip direction defined
-                        if config.c_l["fdipdir_flag"] == "num":
-                            if pd.notna(flt["DIPDIR"]) and str(flt["DIPDIR"]) != "-999":
-                                azimuth = flt["DIPDIR"]
-                            else:
-                                azimuth = azimuth_fault
-
-                        # alpha dip direction defined or no numeric dd defined
-                        elif (
-                            flt["DIP"] == -999 or config.run_flags["fault_dip"] == -999
-                        ):
-                            # print('az_before',fault_name,azimuth_fault)
-                            azimuth = (
-                                azimuth_fault + (180 * random.randint(0, 1))
-                            ) % 360
-                            # print('az_after',fault_name,azimuth)
-                            # TODO: Fix comparison of str version of two floats are comparing floats is very inaccurate
-                            #       Also if this logic works 'lsx' is not defined at this point
-                        elif (
-                            not str(flt["DIPDIR"]) == "None"
-                            and not str(float(flt["DIP"]))
-                            == str(float(config.c_l["fdipnull"]))
-                            and flt["DIPDIR"] != "-999"
-                        ):
-                            dotprod = degrees(
-                                acos(
-                                    (-dlsx * dip_dirs[flt["DIPDIR"]][0])
-                                    + (dlsy * dip_dirs[flt["DIPDIR"]][1])
-                                )
-                            )
-                            if dotprod > 45:
-                                fault_dip = -fault_dip
-                        else:
-                            azimuth = azimuth_fault
-                        # print("indx,azimuth,azimuth_fault,flt["DIPDIR"],pd.notna( flt["DIPDIR"]),fault_dip_var, c_l['fdipnull'],flt["DIP"]")
-                        # print( indx,azimuth,azimuth_fault,flt["DIPDIR"],pd.notna( flt["DIPDIR"]),fault_dip_var, c_l['fdipnull'],flt["DIP"])
-                        l, m, n = m2l_utils.ddd2dircos((90 - fault_dip), azimuth)
-                        # print('fault_name,l,m,n,azimuth_fault,dip',fault_name,l,m,n,azimuth,fault_dip)
-                        first = True
-                        incLength = 0
-                        for afs in flt_ls.coords:
-                            if dlsx == 0.0 and dlsy == 0.0:
-                                continue
-                            lsx = dlsx / sqrt((dlsx * dlsx) + (dlsy * dlsy))
-                            lsy = dlsy / sqrt((dlsx * dlsx) + (dlsy * dlsy))
-                            # normal to line segment
-                            # azimuth = degrees(atan2(lsy, -lsx)) % 180
-
-                            # if(flt[config."GEOMETRY_OBJECT_ID"] == '-1'):
-                            # print(flt[config."GEOMETRY_OBJECT_ID"],  int(flt["DIP"]), config.c_l['fdipnull'],str(flt["DIP_ESTIMATE"]))
-
-                            if first:
-                                incLength = 0
-                                lastx = afs[0]
-                                lasty = afs[1]
-                                first = False
-                            else:
-                                incLength = incLength + m2l_utils.ptsdist(
-                                    afs[0], afs[1], lastx, lasty
-                                )
-                                lastx = afs[0]
-                                lasty = afs[1]
-                                # print(fault_name,incLength)
-                            # decimate to reduce number of points, but also take mid and end points of a series to keep some shape
-                            if (
-                                i % config.run_flags["fault_decimate"] == 0
-                                or i == int((len(flt_ls.coords) - 1) / 2)
-                                or i == len(flt_ls.coords) - 1
-                            ):
-                                if saved == 0:
-                                    p1x = afs[0]
-                                    p1y = afs[1]
-                                elif saved == 1:
-                                    p2x = afs[0]
-                                    p2y = afs[1]
-                                elif saved == 2:
-                                    p3x = afs[0]
-                                    p3y = afs[1]
-                                    # avoids narrow angles in fault traces which geomodeller refuses to solve
-                                    # should really split fault in two at apex, but life is too short
-                                    if (
-                                        m2l_utils.tri_angle(
-                                            p2x, p2y, p1x, p1y, p3x, p3y
-                                        )
-                                        < 45.0
-                                    ):
-                                        break
-                                elif saved > 2:
-                                    p1x = p2x
-                                    p1y = p2y
-                                    p2x = p3x
-                                    p2y = p3y
-                                    p3x = afs[0]
-                                    p3y = afs[1]
-                                    # avoids narrow angles in fault traces which geomodeller refuses to solve
-                                    # should really split fault in two at apex, but life is too short
-                                    if (
-                                        m2l_utils.tri_angle(
-                                            p2x, p2y, p1x, p1y, p3x, p3y
-                                        )
-                                        < 45.0
-                                    ):
-                                        break
-                                saved = saved + 1
-                                locations = [(afs[0], afs[1])]
-                                height = m2l_utils.value_from_dtm_dtb(
-                                    dtm,
-                                    map_data.dtb,
-                                    map_data.dtb_null,
-                                    workflow["cover_map"],
-                                    locations,
-                                )
-                                # slightly randomise first and last points to avoid awkward quadruple junctions etc.
-                                # if(i == 0 or i == len(flt_ls.coords)-1):
-                                #    ostr = str(afs[0]+np.random.ranf())+","+str(afs[1]+np.random.ranf())+","+str(height)+","+fault_name+"\n"
-                                # else:
-                                ostr = "{},{},{},{}\n".format(
-                                    afs[0], afs[1], height, fault_name
-                                )
-                                # ostr = str(afs[0])+","+str(afs[1])+","+str(height)+","+fault_name+"\n"
-                                f.write(ostr)
-                                # dip projection equivalent of surface fault
-                                proj_scale = -(
-                                    (config.bbox_3d["base"] - float(height)) / n
-                                )
-                                ostr = "{},{},{},{}\n".format(
-                                    afs[0] + (l * proj_scale) + 1,
-                                    afs[1] + (m * proj_scale) + 1,
-                                    float(height) - (n * proj_scale) + 1,
-                                    fault_name,
-                                )
-                                # ostr = str(afs[0])+","+str(afs[1])+","+str(height)+","+fault_name+"\n"
-                                f.write(ostr)
-                            i = i + 1
-
-                        strike = strike * 1.25
-                        r = random.randint(1, 256) - 1
-                        g = random.randint(1, 256) - 1
-                        b = random.randint(1, 256) - 1
-                        hex_rgb = m2l_utils.intstohex((r, g, b))
-                        ostr = "{},{},{},{},{},{}\n".format(
-                            fault_name,
-                            strike / 2,
-                            strike / 2,
-                            strike / 4.0,
-                            incLength,
-                            hex_rgb,
-                        )
-                        # ostr = fault_name+","+str(strike/2)+","+str(strike)+","+str(strike/4.0)+"\n"
-                        fd.write(ostr)
-
-                        locations = [
-                            (
-                                flt_ls.coords[int((len(afs) - 1) / 2)][0],
-                                flt_ls.coords[int((len(afs) - 1) / 2)][1],
-                            )
-                        ]
-                        height = m2l_utils.value_from_dtm_dtb(
-                            dtm,
-                            map_data.dtb,
-                            map_data.dtb_null,
-                            workflow["cover_map"],
-                            locations,
-                        )
-                        ostr = "{},{},{},{},{},{},{}\n".format(
-                            flt_ls.coords[int((len(flt_ls.coords) - 1) / 2)][0],
-                            flt_ls.coords[int((len(flt_ls.coords) - 1) / 2)][1],
-                            height,
-                            azimuth,
-                            fault_dip,
-                            1,
-                            fault_name,
-                        )
-                        # ostr = str(flt_ls.coords[int((len(flt_ls.coords)-1)/2)][0])+","+str(flt_ls.coords[int((len(flt_ls.coords)-1)/2)][1])+","+height+","+str(azimuth)+","+str(fault_dip)+",1,"+fault_name+"\n"
-                        fo.write(ostr)
-
-                        locations = [(flt_ls.coords[0][0], flt_ls.coords[0][1])]
-                        height = m2l_utils.value_from_dtm_dtb(
-                            dtm,
-                            map_data.dtb,
-                            map_data.dtb_null,
-                            workflow["cover_map"],
-                            locations,
-                        )
-                        ostr = "{},{},{},{},{},{},{}\n".format(
-                            flt_ls.coords[0][0],
-                            flt_ls.coords[0][1],
-                            height,
-                            azimuth,
-                            fault_dip,
-                            1,
-                            fault_name,
-                        )
-                        # ostr = str(flt_ls.coords[int((len(flt_ls.coords)-1)/2)][0])+","+str(flt_ls.coords[int((len(flt_ls.coords)-1)/2)][1])+","+height+","+str(azimuth)+","+str(fault_dip)+",1,"+fault_name+"\n"
-                        fo.write(ostr)
-
-                        locations = [
-                            (
-                                flt_ls.coords[len(flt_ls.coords) - 1][0],
-                                flt_ls.coords[len(flt_ls.coords) - 1][1],
-                            )
-                        ]
-                        height = m2l_utils.value_from_dtm_dtb(
-                            dtm,
-                            map_data.dtb,
-                            map_data.dtb_null,
-                            workflow["cover_map"],
-                            locations,
-                        )
-                        ostr = "{},{},{},{},{},{},{}\n".format(
-                            flt_ls.coords[len(flt_ls.coords) - 1][0],
-                            flt_ls.coords[len(flt_ls.coords) - 1][1],
-                            height,
-                            azimuth,
-                            fault_dip,
-                            1,
-                            fault_name,
-                        )
-                        # ostr = str(flt_ls.coords[int((len(flt_ls.coords)-1)/2)][0])+","+str(flt_ls.coords[int((len(flt_ls.coords)-1)/2)][1])+","+height+","+str(azimuth)+","+str(fault_dip)+",1,"+fault_name+"\n"
-                        fo.write(ostr)
+        dip = local_faults["DIP"].astype(float)
+        dip_estimate = local_faults["DIP_ESTIMATE"]
+        dipdir = local_faults["DIPDIR"]
+        random_flag = (
+            (local_faults["DIP"] == -999) | (config.run_flags["fault_dip"] == -999)
+        ).to_numpy()
+        # specific dip defined, else dip estimate defined, else run flag or random dip
+        dip_null = (dip.astype(int) == int(float(config.c_l["fdipnull"]))).to_numpy()
+        no_estimate = (dip_estimate.astype(str) == "-999").to_numpy()
+        fault_dip = np.where(
+            dip_null,
+            np.where(
+                no_estimate,
+                config.run_flags["fault_dip"],
+                dip_estimate.map(dip_estimates).fillna(90).astype(int).astype(object),
+            ),
+            dip.astype(int).astype(object),
+        )
+        random_dip = dip_null & no_estimate & random_flag
+
+        # numeric dip direction defined
+        if config.c_l["fdipdir_flag"] == "num":
+            azimuth = np.where(
+                dipdir.notna() & (dipdir.astype(str) != "-999"),
+                dipdir.to_numpy(dtype=object),
+                azimuth_fault.astype(object),
+            )
+            random_azimuth = np.zeros(len(local_faults), dtype=bool)
+        # alpha dip direction defined or no numeric dd defined
+        else:
+            azimuth = azimuth_fault.astype(object)
+            random_azimuth = random_flag
+            # flip dip of faults dipping away from the alpha dip direction
+            alpha_dipdir = (
+                ~random_flag
+                & (dipdir.astype(str) != "None").to_numpy()
+                & (dip != float(config.c_l["fdipnull"])).to_numpy()
+                & (dipdir != "-999").to_numpy()
+            )
+            dip_dir = dipdir.map(dip_dirs)
+            dip_dir_x = dip_dir.str[0].fillna(0.0).to_numpy(dtype=float)
+            dip_dir_y = dip_dir.str[1].fillna(0.0).to_numpy(dtype=float)
+            dotprod = np.degrees(
+                np.arccos(np.clip((-lsx * dip_dir_x) + (lsy * dip_dir_y), -1, 1))
+            )
+            flipped = alpha_dipdir & dip_dir.notna().to_numpy() & (dotprod > 45)
+            fault_dip[flipped] = -fault_dip[flipped]
 
-                # shouldn't happen any more
-                elif (
-                    flt.geometry.geom_type == "MultiLineString"
-                    or flt.geometry.geom_type == "GeometryCollection"
-                ):
-                    sum_strike = 0
-                    first = True
-                    for pline in flt.geometry:
-                        flt_ls = LineString(pline)
-                        dlsx = (
-                            flt_ls.coords[0][0]
-                            - flt_ls.coords[len(flt_ls.coords) - 1][0]
-                        )
-                        dlsy = (
-                            flt_ls.coords[0][1]
-                            - flt_ls.coords[len(flt_ls.coords) - 1][1]
-                        )
-                        sum_strike = sum_strike + sqrt((dlsx * dlsx) + (dlsy * dlsy))
-                        r = random.randint(1, 256) - 1
-                        g = random.randint(1, 256) - 1
-                        b = random.randint(1, 256) - 1
-                        if first:
-                            firstx = flt_ls.coords[0][0]
-                            firsty = flt_ls.coords[0][1]
-                        lastx = flt_ls.coords[0][0]
-                        lasty = flt_ls.coords[0][1]
-                    ostr = "{},{},{},{},{},{}\n".format(
-                        fault_name,
-                        sum_strike / 2,
-                        sum_strike,
-                        sum_strike / 4.0,
-                        incLength,
-                        hex_rgb,
-                    )
-                    # ostr = fault_name+","+str(sum_strike/2)+","+str(sum_strike)+","+str(sum_strike/4.0)+"\n"
-                    fd.write(ostr)
+        # random draws are made fault by fault so the seeded sequence is reproducible
+        random.seed(1)
+        colour = []
+        for k in range(len(local_faults)):
+            if random_dip[k]:
+                fault_dip[k] = random.randint(60, 90)
+            if random_azimuth[k]:
+                azimuth[k] = (azimuth_fault[k] + (180 * random.randint(0, 1))) % 360
+            r = random.randint(1, 256) - 1
+            g = random.randint(1, 256) - 1
+            b = random.randint(1, 256) - 1
+            colour.append(m2l_utils.intstohex((r, g, b)))
+        random.seed()
+        l, m, n = m2l_utils.ddd2dircos_arr(
+            90 - fault_dip.astype(float), azimuth.astype(float)
+        )
 
-                    dlsx = firstx - lastx
-                    dlsy = firsty - lasty
-                    if dlsx == 0.0 or dlsy == 0.0:
-                        continue
+        # decimate to reduce number of points, but also take mid and end points of a series to keep some shape
+        xy, vertex_fault = shapely.get_coordinates(geometry, return_index=True)
+        nvertex = np.bincount(vertex_fault, minlength=len(local_faults))
+        first_vertex = np.cumsum(nvertex) - nvertex
+        mid_vertex = first_vertex + (nvertex - 1) // 2
+        last_vertex = first_vertex + nvertex - 1
+        vertex = np.arange(len(xy)) - first_vertex[vertex_fault]
+        saved = np.flatnonzero(
+            (
+                (vertex % config.run_flags["fault_decimate"] == 0)
+                | (vertex == (nvertex[vertex_fault] - 1) // 2)
+                | (vertex == nvertex[vertex_fault] - 1)
+            )
+            & ~closed[vertex_fault]
+        )
+        saved_fault = vertex_fault[saved]
+        # avoids narrow angles in fault traces which geomodeller refuses to solve
+        # should really split fault in two at apex, but life is too short
+        narrow = np.zeros(len(saved), dtype=bool)
+        narrow[2:] = (saved_fault[2:] == saved_fault[:-2]) & (
+            m2l_utils.tri_angle_arr(xy[saved[1:-1]], xy[saved[:-2]], xy[saved[2:]])
+            < 45.0
+        )
+        narrow_fault, first_narrow = np.unique(saved_fault[narrow], return_index=True)
+        stop_vertex = last_vertex + 1
+        stop_vertex[narrow_fault] = saved[narrow][first_narrow]
+        saved = saved[saved < stop_vertex[saved_fault]]
+        saved_fault = vertex_fault[saved]
+
+        # trace length up to the vertex where saving stopped
+        segment = np.zeros(len(xy))
+        segment[1:] = np.sqrt(np.sum((xy[1:] - xy[:-1]) ** 2, axis=1))
+        segment[first_vertex] = 0.0
+        inc_length = np.add.reduceat(
+            np.append(segment, 0.0),
+            np.column_stack(
+                (first_vertex, np.minimum(stop_vertex, last_vertex) + 1)
+            ).ravel(),
+        )[::2].astype(object)
+        inc_length[closed] = 0
+
+        heights = m2l_utils.values_from_dtm_dtb(
+            dtm,
+            map_data.dtb,
+            map_data.dtb_null,
+            workflow["cover_map"],
+            np.concatenate(
+                (xy[saved], xy[mid_vertex], xy[first_vertex], xy[last_vertex])
+            ),
+        )
+        height = heights[: len(saved)]
+        # dip projection equivalent of surface fault
+        proj_scale = -((config.bbox_3d["base"] - height) / n[saved_fault])
+        fault_points = pd.DataFrame(
+            {
+                "X": np.column_stack(
+                    (xy[saved, 0], xy[saved, 0] + (l[saved_fault] * proj_scale) + 1)
+                ).ravel(),
+                "Y": np.column_stack(
+                    (xy[saved, 1], xy[saved, 1] + (m[saved_fault] * proj_scale) + 1)
+                ).ravel(),
+                "Z": np.column_stack(
+                    (height, height - (n[saved_fault] * proj_scale) + 1)
+                ).ravel(),
+                "formation": np.repeat(fault_name[saved_fault], 2),
+            }
+        )
 
-                    lsx = dlsx / sqrt((dlsx * dlsx) + (dlsy * dlsy))
-                    lsy = dlsy / sqrt((dlsx * dlsx) + (dlsy * dlsy))
-                    # normal to line segment
-                    azimuth = degrees(atan2(lsy, -lsx)) % 180
-                    # should be mid-fault not mid fault segemnt but probs doesnt matter
-                    locations = [
-                        (
-                            flt_ls.coords[int((len(afs) - 1) / 2)][0],
-                            flt_ls.coords[int((len(afs) - 1) / 2)][1],
-                        )
-                    ]
-                    height = m2l_utils.value_from_dtm_dtb(
-                        dtm,
-                        map_data.dtb,
-                        map_data.dtb_null,
-                        workflow["cover_map"],
-                        locations,
-                    )
-                    ostr = "{},{},{},{},{},{},{},\n".format(
-                        flt_ls.coords[int((len(flt_ls.coords) - 1) / 2)][0],
-                        flt_ls.coords[int((len(flt_ls.coords) - 1) / 2)][1],
-                        height,
-                        azimuth,
-                        fault_dip,
-                        1,
-                        fault_name,
-                    )
-                    # ostr = str(flt_ls.coords[int((len(flt_ls.coords)-1)/2)][0])+","+str(flt_ls.coords[int((len(flt_ls.coords)-1)/2)][1])+","+height+","+str(azimuth)+","+str(fault_dip)+",1,"+fault_name+"\n"
-                    fo.write(ostr)
-
-                    for pline in flt.geometry:
-                        # display(pline)
-                        # display(flt)
-                        flt_ls = LineString(pline)
-                        dlsx = (
-                            flt_ls.coords[0][0]
-                            - flt_ls.coords[len(flt_ls.coords) - 1][0]
-                        )
-                        dlsy = (
-                            flt_ls.coords[0][1]
-                            - flt_ls.coords[len(flt_ls.coords) - 1][1]
-                        )
-                        if dlsx == 0.0 or dlsy == 0.0:
-                            continue
+        # nominal orientations at the mid, start and end points of each trace
+        ends = np.column_stack((mid_vertex, first_vertex, last_vertex)).ravel()
+        fault_orientations = pd.DataFrame(
+            {
+                "X": xy[ends, 0],
+                "Y": xy[ends, 1],
+                "Z": heights[len(saved) :].reshape(3, -1).T.ravel(),
+                "DipDirection": np.repeat(azimuth, 3),
+                "dip": np.repeat(fault_dip, 3),
+                "DipPolarity": 1,
+                "formation": np.repeat(fault_name, 3),
+            }
+        )
 
-                        if sum_strike > config.run_flags["min_fault_length"]:
-                            i = 0
-                            saved = 0
-                            for afs in flt_ls.coords:
-                                # decimate to reduce number of points, but also take mid and end points of a series to keep some shape
-                                if (
-                                    i % config.run_flags["fault_decimate"] == 0
-                                    or i == int((len(flt_ls.coords) - 1) / 2)
-                                    or i == len(flt_ls.coords) - 1
-                                ):
-                                    if saved == 0:
-                                        p1x = afs[0]
-                                        p1y = afs[1]
-                                    elif saved == 1:
-                                        p2x = afs[0]
-                                        p2y = afs[1]
-                                    elif saved == 2:
-                                        p3x = afs[0]
-                                        p3y = afs[1]
-                                        # avoids narrow angles in fault traces which geomodeller refuses to solve
-                                        # should really split fault in two at apex, but life is too short
-                                        if (
-                                            m2l_utils.tri_angle(
-                                                p2x, p2y, p1x, p1y, p3x, p3y
-                                            )
-                                            < 45.0
-                                        ):
-                                            break
-                                    elif saved > 2:
-                                        p1x = p2x
-                                        p1y = p2y
-                                        p2x = p3x
-                                        p2y = p3y
-                                        p3x = afs[0]
-                                        p3y = afs[1]
-                                        # avoids narrow angles in fault traces which geomodeller refuses to solve
-                                        # should really split fault in two at apex, but life is too short
-                                        if (
-                                            m2l_utils.tri_angle(
-                                                p2x, p2y, p1x, p1y, p3x, p3y
-                                            )
-                                            < 45.0
-                                        ):
-                                            break
-                                    saved = saved + 1
-                                    locations = [(afs[0], afs[1])]
-                                    height = m2l_utils.value_from_dtm_dtb(
-                                        dtm,
-                                        map_data.dtb,
-                                        map_data.dtb_null,
-                                        workflow["cover_map"],
-                                        locations,
-                                    )
-                                    # slightly randomise first and last points to avoid awkward quadruple junctions etc.
-                                    # if(i == 0 or i == len(flt_ls.coords)-1):
-                                    #    ostr = str(afs[0]+np.random.ranf())+","+str(afs[1]+np.random.ranf())+","+str(height)+","+fault_name+"\n"
-                                    # else:
-                                    ostr = "{},{},{},{}\n".format(
-                                        afs[0], afs[1], height, fault_name
-                                    )
-                                    # ostr = str(afs[0])+","+str(afs[1])+","+str(height)+","+fault_name+"\n"
-                                    f.write(ostr)
-                                i = i + 1
+        strike = strike * 1.25
+        fault_dimensions = pd.DataFrame(
+            {
+                "Fault": fault_name,
+                "HorizontalRadius": strike / 2,
+                "VerticalRadius": strike / 2,
+                "InfluenceDistance": strike / 4.0,
+                "incLength": inc_length,
+                "colour": colour,
+            }
+        )
 
-    f.close()
-    fo.close()
-    fd.close()
+    fault_points.to_csv(os.path.join(config.output_path, "faults.csv"), index=False)
+    fault_orientations.to_csv(
+        os.path.join(config.output_path, "fault_orientations.csv"), index=False
+    )
+    fault_dimensions.to_csv(
+        os.path.join(config.output_path, "fault_dimensions.csv"), index=False
+    )
     if config.verbose_level != VerboseLevel.NONE:
         print(
             "fault orientations saved as",
@@ -1252,7 +1019,6 @@ def save_faults(config: Config, map_data: MapData, workflow: dict):
             "fault dimensions saved as",
             os.path.join(config.output_path, "fault_dimensions.csv"),
         )
-    random.seed()
 
 
 ########################################
@@ -1273,7 +1039,7 @@ def save_faults(config: Config, map_data: MapData, workflow: dict):
 @beartype.beartype
 def save_fold_axial_traces(config: Config, map_data: MapData, workflow: dict):
     folds_clip = map_data.get_map_data(Datatype.FOLD).copy()
-    dtm = map_data.get_map_data(Datatype.DTM).open()
+    dtm = map_data.get_map_data(Datatype.DTM)
     # folds_clip = gpd.read_file(path_folds)
     fo = open(os.path.join(config.output_path, "fold_axial_traces.csv"), "w")
     fo.write("X,Y,Z,code,type\n")
@@ -1367,65 +1133,87 @@ def save_fold_axial_traces(config: Config, map_data: MapData, workflow: dict):
 def create_basal_contact_orientations(
     contacts, structures, output_path, dtm, dtb, dtb_null, cover_map, dist_buffer, c_l
 ):
-    f = open(os.path.join(output_path, "projected_dip_contacts2.csv"), "w")
-    f.write("X,Y,Z,azimuth,dip,polarity,formation\n")
-    # print("len = ",len(contacts))
-    i = 0
-    for indx, acontact in contacts.iterrows():  # loop through distinct linestrings
-        # display(acontact[1].geometry)
-        thegroup = acontact["GROUP"].replace("_", " ")
-        # print("thegroup = ",thegroup)
-        # subset orientations to just those with this group
-        is_gp = structures["GROUP"] == thegroup
-        all_structures = structures[is_gp]
-
-        for ind, astr in all_structures.iterrows():  # loop through valid orientations
-            orig = Point(astr["geometry"])
-            np = acontact.geometry.interpolate(acontact.geometry.project(orig))
-            if np.distance(orig) < dist_buffer:
-                for line in acontact.geometry:  # loop through line segments
-                    # loop through line segments
-                    for pair in m2l_utils.pairs(list(line.coords)):
-                        segpair = LineString((pair[0], pair[1]))
-                        # line segment closest to close point
-                        if segpair.distance(np) < 0.0001:
-                            ddx = sin(radians(astr["DIP"]))
-                            ddy = cos(radians(astr["DIP"]))
-                            dlsx = pair[0][0] - pair[1][0]
-                            dlsy = pair[0][1] - pair[1][1]
-                            lsx = dlsx / sqrt((dlsx * dlsx) + (dlsy * dlsy))
-                            lsy = dlsy / sqrt((dlsx * dlsx) + (dlsy * dlsy))
-                            angle = degrees(acos((ddx * lsx) + (ddy * lsy)))
-
-                            # dip_dir normal and contact are close enough to parallel
-                            if fabs(angle - 90) < 30.0:
-                                locations = [(np.x, np.y)]
-                                height = m2l_utils.value_from_dtm_dtb(
-                                    dtm, dtb, dtb_null, cover_map, locations
-                                )
-                                # normal to line segment
-                                ls_ddir = degrees(atan2(lsy, -lsx))
-
-                                if (ddx * lsy) + (
-                                    -ddy * lsx
-                                ) < 0:  # dot product tests right quadrant
-                                    ls_ddir = (ls_ddir - 180) % 360
-                                ostr = "{},{},{},{},{},{},{}\n".format(
-                                    np.x,
-                                    np.y,
-                                    height,
-                                    ls_ddir,
-                                    astr["DIP"],
-                                    1,
-                                    acontact["UNIT_NAME"]
-                                    .replace(" ", "_")
-                                    .replace("-", "_"),
-                                )
-                                # ostr = str(np.x)+","+str(np.y)+","+height+","+str(ls_ddir)+","+str(astr["DIP"])+",1,"+acontact["UNIT_NAME"].replace(" ","_").replace("-","_")+"\n"
-                                f.write(ostr)
-                                i = i + 1
+    contact_geometry = contacts.geometry.to_numpy()
+    origins = structures.geometry.to_numpy()
 
-    f.close()
+    # pair each orientation with the contacts of its group close enough to project onto
+    pair_str, pair_contact = shapely.STRtree(contact_geometry).query(
+        origins, predicate="dwithin", distance=dist_buffer
+    )
+    thegroup = contacts["GROUP"].str.replace("_", " ").to_numpy()
+    is_gp = thegroup[pair_contact] == structures["GROUP"].to_numpy()[pair_str]
+    pair_str = pair_str[is_gp]
+    pair_contact = pair_contact[is_gp]
+    order = np.lexsort((pair_str, pair_contact))
+    pair_str = pair_str[order]
+    pair_contact = pair_contact[order]
+    closest = shapely.line_interpolate_point(
+        contact_geometry[pair_contact],
+        shapely.line_locate_point(contact_geometry[pair_contact], origins[pair_str]),
+    )
+    is_close = shapely.distance(closest, origins[pair_str]) < dist_buffer
+    pair_str = pair_str[is_close]
+    pair_contact = pair_contact[is_close]
+    closest = closest[is_close]
+
+    # line segments of every contact, and the ones the projected points lie on
+    parts, part_contact = shapely.get_parts(contact_geometry, return_index=True)
+    coords, coord_part = shapely.get_coordinates(parts, return_index=True)
+    is_segment = coord_part[:-1] == coord_part[1:]
+    seg_start = coords[:-1][is_segment]
+    seg_end = coords[1:][is_segment]
+    seg_contact = part_contact[coord_part[:-1][is_segment]]
+    segments = shapely.linestrings(np.stack([seg_start, seg_end], axis=1))
+    near_pair, near_seg = shapely.STRtree(segments).query(
+        closest, predicate="dwithin", distance=0.0001
+    )
+    on_segment = (seg_contact[near_seg] == pair_contact[near_pair]) & (
+        shapely.distance(segments[near_seg], closest[near_pair]) < 0.0001
+    )
+    near_pair = near_pair[on_segment]
+    near_seg = near_seg[on_segment]
+    order = np.lexsort((near_seg, near_pair))
+    near_pair = near_pair[order]
+    near_seg = near_seg[order]
+
+    dip = structures["DIP"].to_numpy()[pair_str[near_pair]]
+    ddx = np.sin(np.radians(dip.astype(float)))
+    ddy = np.cos(np.radians(dip.astype(float)))
+    dlsx = seg_start[near_seg, 0] - seg_end[near_seg, 0]
+    dlsy = seg_start[near_seg, 1] - seg_end[near_seg, 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lsx = dlsx / np.sqrt((dlsx * dlsx) + (dlsy * dlsy))
+        lsy = dlsy / np.sqrt((dlsx * dlsx) + (dlsy * dlsy))
+        angle = np.degrees(np.arccos((ddx * lsx) + (ddy * lsy)))
+
+    # dip_dir normal and contact are close enough to parallel
+    parallel = np.abs(angle - 90) < 30.0
+    # normal to line segment, dot product tests right quadrant
+    ls_ddir = np.degrees(np.arctan2(lsy, -lsx))
+    ls_ddir = np.where((ddx * lsy) + (-ddy * lsx) < 0, (ls_ddir - 180) % 360, ls_ddir)
+    x, y = shapely.get_coordinates(closest[near_pair]).T
+    formation = contacts["UNIT_NAME"].str.replace(" ", "_").str.replace("-", "_")
+
+    contact_orientations = pd.DataFrame(
+        {
+            "X": x[parallel],
+            "Y": y[parallel],
+            "Z": m2l_utils.values_from_dtm_dtb(
+                dtm,
+                dtb,
+                dtb_null,
+                cover_map,
+                np.column_stack((x[parallel], y[parallel])),
+            ),
+            "azimuth": ls_ddir[parallel],
+            "dip": dip[parallel],
+            "polarity": 1,
+            "formation": formation.to_numpy()[pair_contact[near_pair]][parallel],
+        }
+    )
+    contact_orientations.to_csv(
+        os.path.join(output_path, "projected_dip_contacts2.csv"), index=False
+    )
     print(
         "basal contact orientations saved as",
         os.path.join(output_path, "projected_dip_contacts2.csv"),
@@ -1505,7 +1293,7 @@ def process_plutons(config: Config, map_data, workflow: dict):
     ls_dict = {}
     ls_dict_decimate = {}
     id = 0
-    dtm = map_data.get_map_data(Datatype.DTM).open()
+    dtm = map_data.get_map_data(Datatype.DTM)
     geology = map_data.get_map_data(Datatype.GEOLOGY)
     geol_clip = geology[geology.area > config.run_flags["min_pluton_area"]]
     for indx, ageol in geol_clip.iterrows():
@@ -2636,200 +2424,352 @@ def calc_thickness(tmp_path, output_path, buffer, max_thickness_allowed, c_l):
     )
 
 
-@beartype.beartype
-def calc_thickness_with_grid(config: Config, map_data: MapData):
-    contact_points_file = os.path.join(config.tmp_path, "raw_contacts.csv")
-    dtm = map_data.get_map_data(Datatype.DTM).open()
-    # load basal contacts as geopandas dataframe
-    contact_lines = gpd.read_file(
-        os.path.join(config.tmp_path, "basal_contacts.shp.zip")
-    )
-    all_sorts = pd.read_csv(os.path.join(config.tmp_path, "all_sorts.csv"))
-    all_sorts["index2"] = all_sorts.index
-    # all_sorts.set_index('code',inplace=True)
-    geol = map_data.get_map_data(Datatype.GEOLOGY).copy()
-    # geol=gpd.read_file(os.path.join(config.tmp_path, 'geol_clip.shp'))
-    geol.drop_duplicates(subset="UNIT_NAME", inplace=True)
-    # geol.set_index('UNIT_NAME',inplace=True)
-    drops = geol[
-        geol["DESCRIPTION"].str.contains(config.c_l["sill"])
-        & geol["ROCKTYPE1"].str.contains(config.c_l["intrusive"])
-    ]
-    for ind, drop in drops.iterrows():
-        all_sorts.drop(labels=drop.name, inplace=True, errors="ignore")
-    all_sorts["code"] = all_sorts.index
-    all_sorts["index"] = all_sorts["index2"]
-    # all_sorts.set_index('index2',inplace=True)
+####################################################
+# Build the normal transect through each contact point used to estimate thickness
+#
+# thickness_transects(config,map_data,contacts)
+# Args:
+# contacts dataframe of contact points and 2D direction cosines (raw_contacts.csv)
+# Returns:
+# dataframe of contact point, transect end points and interpolated dip for each contact point
+#
+# Each transect runs thickness_buffer either side of the contact point normal to the contact
+####################################################
 
-    contacts = pd.read_csv(contact_points_file)
 
-    clength = len(contacts)
-    cx = contacts["X"].to_numpy()
-    cy = contacts["Y"].to_numpy()
+def thickness_transects(config: Config, map_data: MapData, contacts: pd.DataFrame):
+    cx = contacts["X"].to_numpy(dtype=float)
+    cy = contacts["Y"].to_numpy(dtype=float)
     cl = contacts["lsx"].to_numpy(dtype=float)
     cm = contacts["lsy"].to_numpy(dtype=float)
-    ctextcode = contacts["formation"].to_numpy()
-
-    fth = open(os.path.join(config.output_path, "formation_thicknesses.csv"), "w")
-    fth.write(
-        "X,Y,formation,appar_th,thickness,cl,cm,p1x,p1y,p2x,p2y,dip,type,slope_dip,slope_length,delz,zbase,zcross\n"
+    r = ((cy - config.bbox[1]) / config.run_flags["interpolation_spacing"]).astype(int)
+    c = ((cx - config.bbox[0]) / config.run_flags["interpolation_spacing"]).astype(int)
+    dx1 = -cm * config.run_flags["thickness_buffer"]
+    dy1 = cl * config.run_flags["thickness_buffer"]
+    return pd.DataFrame(
+        {
+            "X": cx,
+            "Y": cy,
+            "formation": contacts["formation"].to_numpy(),
+            "cl": cl,
+            "cm": cm,
+            "p1x": dx1 + cx,
+            "p1y": dy1 + cy,
+            "p2x": -dx1 + cx,
+            "p2y": -dy1 + cy,
+            "dip": map_data.dip_grid[r, c],
+        }
     )
 
-    # np.savetxt(os.path.join(config.tmp_path,'dist.csv'),dist,delimiter = ',')
-    # display("ppp",cx.shape,cy.shape,ox.shape,oy.shape,dip.shape,azimuth.shape,dist.shape)
-    n_est = 0
-    for k in range(0, clength):  # loop through all contact segments
-        r = int((cy[k] - config.bbox[1]) / config.run_flags["interpolation_spacing"])
-        c = int((cx[k] - config.bbox[0]) / config.run_flags["interpolation_spacing"])
-
-        dip_mean = map_data.dip_grid[r, c]
-
-        dx1 = -cm[k] * config.run_flags["thickness_buffer"]
-        dy1 = cl[k] * config.run_flags["thickness_buffer"]
-        dx2 = -dx1
-        dy2 = -dy1
-        p1 = Point((dx1 + cx[k], dy1 + cy[k]))
-        p2 = Point((dx2 + cx[k], dy2 + cy[k]))
-        ddline = LineString((p1, p2))
-        orig = Point((cx[k], cy[k]))
-
-        crossings = np.zeros((1000, 5))
-
-        g = 0
-        for indx, apair in all_sorts.iterrows():  # loop through all basal contacts
-            if ctextcode[k] == apair["code"]:
-                # subset contacts to just those with 'a' code
-                is_contacta = (
-                    contact_lines["UNIT_NAME"] == all_sorts.iloc[g - 1]["code"]
-                )
-                acontacts = contact_lines[is_contacta]
-                i = 0
-                for (
-                    ind,
-                    acontact,
-                ) in (
-                    acontacts.iterrows()
-                ):  # loop through distinct linestrings for upper contact
-                    # if(bboxes_intersect(ddline.bounds,acontact[1].geometry.bounds)):
-                    if not str(acontact.geometry) == "None":
-                        if ddline.intersects(acontact.geometry):
-                            isects = ddline.intersection(acontact.geometry)
-                            if isects.geom_type == "MultiPoint":
-                                for pt in isects:
-                                    if (
-                                        pt.distance(orig)
-                                        < config.run_flags["thickness_buffer"] * 2
-                                    ):
-                                        # print(i,",", pt.x, ",",pt.y,",",apair[1]['code'],",",apair[1]['group'])
-                                        crossings[i, 0] = i
-                                        crossings[i, 1] = int(apair["index"])
-                                        crossings[i, 2] = 0
-                                        crossings[i, 3] = pt.x
-                                        crossings[i, 4] = pt.y
-                                        i = i + 1
-                            else:
-                                if (
-                                    isects.distance(orig)
-                                    < config.run_flags["thickness_buffer"] * 2
-                                ):
-                                    # print(i,",", isects.x,",", isects.y,",",apair[1]['code'],",",apair[1]['group'])
-                                    crossings[i, 0] = i
-                                    crossings[i, 1] = int(apair["index"])
-                                    crossings[i, 2] = 0
-                                    crossings[i, 3] = isects.x
-                                    crossings[i, 4] = isects.y
-                                    i = i + 1
 
-                            if (
-                                i > 0
-                            ):  # if we found any intersections with base of next higher unit
-                                min_dist = 1e8
-                                # min_pt = 0
-                                for f in range(0, i):  # find closest hit
-                                    this_dist = m2l_utils.ptsdist(
-                                        crossings[f, 3], crossings[f, 4], cx[k], cy[k]
-                                    )
-                                    if this_dist < min_dist:
-                                        min_dist = this_dist
-                                        # min_pt = f
-                                        crossx = crossings[f, 3]
-                                        crossy = crossings[f, 4]
-                                # if not too far, add to output
-                                if (
-                                    min_dist < config.run_flags["max_thickness_allowed"]
-                                    and min_dist > 0
-                                ):
-                                    locations = [(cx[k], cy[k])]
-                                    zbase = float(
-                                        m2l_utils.value_from_dtm_dtb(
-                                            dtm, "", "", False, locations
-                                        )
-                                    )
-                                    locations = [(crossx, crossy)]
-                                    zcross = float(
-                                        m2l_utils.value_from_dtm_dtb(
-                                            dtm, "", "", False, locations
-                                        )
-                                    )
-                                    delz = fabs(zcross - zbase)
-                                    slope_dip = degrees(atan(delz / min_dist))
-                                    slope_length = sqrt(
-                                        (min_dist * min_dist) + (delz * delz)
-                                    )
-                                    if slope_dip < dip_mean and zbase > zcross:
-                                        surf_dip = dip_mean - slope_dip
-                                    elif slope_dip < dip_mean and zbase < zcross:
-                                        surf_dip = dip_mean + slope_dip
-                                    elif slope_dip > dip_mean and zbase > zcross:
-                                        surf_dip = slope_dip - dip_mean
-                                    else:
-                                        surf_dip = 180 - (dip_mean + slope_dip)
+####################################################
+# Pair each contact point with the units it is measured against
+#
+# thickness_jobs(formations,codes)
+# Args:
+# formations array of formation of each contact point
+# codes array of unit codes in stratigraphic order (all_sorts.csv)
+# Returns:
+# job_point index of the contact point of each job
+# job_upper code of the unit above the contact point's formation for each job
+#
+# A contact point gets one job for every time its formation appears in codes, ordered by
+# contact point and then by position in codes. The minimum thickness pass skips contacts
+# of job_upper; before these jobs it always skipped the last unit in codes instead, as its
+# unit counter was never advanced
+####################################################
 
-                                    true_thick = slope_length * sin(radians(surf_dip))
-                                    if (
-                                        not isnan(true_thick)
-                                        and true_thick > 0
-                                        and true_thick
-                                        < config.run_flags["max_thickness_allowed"]
-                                    ):
-                                        ostr = "{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{}\n".format(
-                                            cx[k],
-                                            cy[k],
-                                            ctextcode[k],
-                                            min_dist,
-                                            int(true_thick),
-                                            cl[k],
-                                            cm[k],
-                                            p1.x,
-                                            p1.y,
-                                            p2.x,
-                                            p2.y,
-                                            dip_mean,
-                                            "full",
-                                            slope_dip,
-                                            slope_length,
-                                            delz,
-                                            zbase,
-                                            zcross,
-                                        )
-                                        # ostr = str(cx[k])+','+str(cy[k])+','+ctextcode[k]+','+str(int(true_thick))+\
-                                        #    ','+str(cl[k])+','+str(cm[k])+','+str(lm)+','+str(mm)+','+str(nm)+','+\
-                                        #    str(p1.x)+','+str(p1.y)+','+str(p2.x)+','+str(p2.y)+','+str(dip_mean)+'\n'
-                                        fth.write(ostr)
-                                        n_est = n_est + 1
 
-            g = g + 1
-    if config.verbose_level != VerboseLevel.NONE:
-        print(
-            n_est,
-            "thickness estimates saved as",
-            os.path.join(config.output_path, "formation_thicknesses.csv"),
+def thickness_jobs(formations, codes):
+    positions = {}
+    for g, code in enumerate(codes):
+        positions.setdefault(code, []).append(g)
+    unique_formations, inverse = np.unique(formations, return_inverse=True)
+    job_point = [np.zeros(0, dtype=np.int64)]
+    job_rank = [np.zeros(0, dtype=np.int64)]
+    for f, formation in enumerate(unique_formations):
+        points = np.flatnonzero(inverse == f)
+        for g in positions.get(formation, []):
+            job_point.append(points)
+            job_rank.append(np.full(len(points), g))
+    job_point = np.concatenate(job_point)
+    job_rank = np.concatenate(job_rank)
+    order = np.lexsort((job_rank, job_point))
+    job_upper = np.asarray(codes, dtype=object)[job_rank[order] - 1]
+    return (job_point[order], job_upper)
+
+
+####################################################
+# Find the closest crossing of each transect with every basal contact it intersects
+#
+# transect_crossings(transects,line_geometry,tree,buffer)
+# Args:
+# transects dataframe from thickness_transects()
+# line_geometry array of basal contact geometries
+# tree shapely STRtree built over line_geometry
+# buffer thickness_buffer, crossings further than twice this from the contact point are ignored
+# Returns:
+# pair_point,pair_line index of the transect and basal contact of each intersecting pair
+# ncross number of point crossings of each pair
+# pair_dist,pair_x,pair_y distance to, and location of, the closest crossing of each pair
+#
+# Pairs are ordered by transect and then basal contact. A transect running along a contact
+# has no point crossings, and pairs without a crossing closer than 1e8 get an infinite distance
+####################################################
+
+
+def transect_crossings(transects, line_geometry, tree, buffer):
+    cx = transects["X"].to_numpy()
+    cy = transects["Y"].to_numpy()
+    transect_lines = shapely.linestrings(
+        np.stack(
+            [
+                transects[["p1x", "p1y"]].to_numpy(),
+                transects[["p2x", "p2y"]].to_numpy(),
+            ],
+            axis=1,
         )
+    )
 
+    # candidate (transect, basal contact) pairs from one query of the spatial index
+    pair_point, pair_line = tree.query(transect_lines, predicate="intersects")
+    order = np.lexsort((pair_line, pair_point))
+    pair_point = pair_point[order]
+    pair_line = pair_line[order]
+
+    isects = shapely.intersection(transect_lines[pair_point], line_geometry[pair_line])
+    is_points = np.isin(shapely.get_type_id(isects), [0, 4])
+    parts, part_pair = shapely.get_parts(isects[is_points], return_index=True)
+    part_pair = np.flatnonzero(is_points)[part_pair]
+    part_point = pair_point[part_pair]
+    px, py = shapely.get_coordinates(parts).T
+    part_dist = np.sqrt((px - cx[part_point]) ** 2 + (py - cy[part_point]) ** 2)
+    near = part_dist < buffer * 2
+    part_pair = part_pair[near]
+    part_dist = part_dist[near]
+    px = px[near]
+    py = py[near]
+
+    # closest crossing on each basal contact, the first one wins a tie
+    ncross = np.bincount(part_pair, minlength=len(pair_point))
+    pair_dist = np.full(len(pair_point), np.inf)
+    pair_x = np.zeros(len(pair_point))
+    pair_y = np.zeros(len(pair_point))
+    closest = np.lexsort((part_dist, part_pair))
+    closest = closest[np.unique(part_pair[closest], return_index=True)[1]]
+    pair_dist[part_pair[closest]] = part_dist[closest]
+    pair_x[part_pair[closest]] = px[closest]
+    pair_y[part_pair[closest]] = py[closest]
+    pair_dist[pair_dist >= 1e8] = np.inf
+    return (pair_point, pair_line, ncross, pair_dist, pair_x, pair_y)
 
-@beartype.beartype
-def calc_min_thickness_with_grid(config: Config, map_data: MapData):
-    dtm = map_data.get_map_data(Datatype.DTM).open()
+
+####################################################
+# Find transect crossings, optionally in a pool of worker processes
+#
+# find_transect_crossings(transects,line_geometry,buffer,n_workers)
+# Args:
+# as for transect_crossings() without the tree
+# n_workers number of worker processes, 1 or less runs everything in this process
+# Returns:
+# as for transect_crossings()
+#
+# Transects are split by formation, each worker builds its own spatial index once, and the
+# results are merged back into transect order so the output does not depend on n_workers
+####################################################
+
+
+def find_transect_crossings(transects, line_geometry, buffer, n_workers=1):
+    if n_workers <= 1:
+        tree = shapely.STRtree(line_geometry)
+        return transect_crossings(transects, line_geometry, tree, buffer)
+
+    _, formation = np.unique(transects["formation"].to_numpy(), return_inverse=True)
+    order = np.argsort(formation, kind="stable")
+    tasks = np.split(order, np.flatnonzero(np.diff(formation[order])) + 1)
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        initializer=init_thickness_worker,
+        initargs=(transects, line_geometry, buffer),
+    ) as pool:
+        results = list(pool.map(transect_crossings_task, tasks))
+
+    crossings = [np.concatenate(columns) for columns in zip(*results)]
+    order = np.lexsort((crossings[1], crossings[0]))
+    return tuple(column[order] for column in crossings)
+
+
+_thickness_worker = None
+
+
+def init_thickness_worker(transects, line_geometry, buffer):
+    global _thickness_worker
+    tree = shapely.STRtree(line_geometry)
+    _thickness_worker = (transects, line_geometry, tree, buffer)
+
+
+def transect_crossings_task(points):
+    transects, line_geometry, tree, buffer = _thickness_worker
+    pair_point, *crossings = transect_crossings(
+        transects.iloc[points], line_geometry, tree, buffer
+    )
+    return (points[pair_point], *crossings)
+
+
+####################################################
+# Select the closest crossing for each thickness job
+#
+# closest_crossings(crossings,line_units,job_point,job_upper,same_unit)
+# Args:
+# crossings tuple from transect_crossings()
+# line_units array of unit name of each basal contact
+# job_point,job_upper jobs from thickness_jobs()
+# same_unit True to only cross basal contacts of job_upper, False to cross all other basal contacts
+# Returns:
+# job index of the job of each estimate
+# point index of the contact point of each estimate
+# min_dist,crossx,crossy distance to, and location of, the closest crossing so far
+#
+# Every basal contact a job's transect intersects, taken in file order, gives one estimate
+# from the closest crossing over that contact and all earlier contacts of the same job
+####################################################
+
+
+def closest_crossings(crossings, line_units, job_point, job_upper, same_unit):
+    pair_point, pair_line, ncross, pair_dist, pair_x, pair_y = crossings
+
+    # repeat each contact point's pairs for every one of its jobs
+    first = np.searchsorted(pair_point, job_point, side="left")
+    npairs = np.searchsorted(pair_point, job_point, side="right") - first
+    job = np.repeat(np.arange(len(job_point)), npairs)
+    pair = np.repeat(first, npairs) + (
+        np.arange(npairs.sum()) - np.repeat(np.cumsum(npairs) - npairs, npairs)
+    )
+    keep = (line_units[pair_line[pair]] == job_upper[job]) == same_unit
+    job = job[keep]
+    pair = pair[keep]
+    dist = pair_dist[pair]
+
+    # closest crossing so far within each job, only a strictly closer crossing replaces it
+    run_dist = pd.Series(dist).groupby(job).cummin().to_numpy()
+    prev_dist = np.full(len(job), np.inf)
+    prev_dist[1:] = run_dist[:-1]
+    prev_dist[np.diff(job, prepend=-1) != 0] = np.inf
+    best = pd.Series(np.where(dist < prev_dist, pair, np.nan)).groupby(job).ffill()
+    crossed = pd.Series(ncross[pair]).groupby(job).cumsum().to_numpy() > 0
+    found = crossed & best.notna().to_numpy()
+    best = best.to_numpy()[found].astype(np.int64)
+    job = job[found]
+    return (job, job_point[job], run_dist[found], pair_x[best], pair_y[best])
+
+
+####################################################
+# Convert apparent thicknesses along transects into true thickness estimates
+#
+# thickness_estimates(transects,dtm,point,min_dist,crossx,crossy,min_dist_floor,max_thickness_allowed,estimate_type)
+# Args:
+# transects dataframe from thickness_transects()
+# dtm rasterio format elevation grid
+# point,min_dist,crossx,crossy crossings from closest_crossings()
+# min_dist_floor apparent thicknesses must be greater than this
+# max_thickness_allowed apparent and true thicknesses must be less than this
+# estimate_type label for the type column
+# Returns:
+# dataframe with the columns of formation_thicknesses.csv
+#
+# Corrects the apparent thickness for the slope between the contact point and crossing
+# and the interpolated dip
+####################################################
+
+
+def thickness_estimates(
+    transects,
+    dtm,
+    point,
+    min_dist,
+    crossx,
+    crossy,
+    min_dist_floor,
+    max_thickness_allowed,
+    estimate_type,
+):
+    # if not too far, add to output
+    keep = (min_dist < max_thickness_allowed) & (min_dist > min_dist_floor)
+    point = point[keep]
+    min_dist = min_dist[keep]
+    crossx = crossx[keep]
+    crossy = crossy[keep]
+    estimates = transects.iloc[point].reset_index(drop=True)
+    dip_mean = estimates["dip"].to_numpy()
+
+    zbase = m2l_utils.values_from_dtm_dtb(
+        dtm, "", "", False, estimates[["X", "Y"]].to_numpy()
+    )
+    zcross = m2l_utils.values_from_dtm_dtb(
+        dtm, "", "", False, np.column_stack((crossx, crossy))
+    )
+    delz = np.abs(zcross - zbase)
+    slope_dip = np.degrees(np.arctan(delz / min_dist))
+    slope_length = np.sqrt((min_dist * min_dist) + (delz * delz))
+    surf_dip = np.select(
+        [
+            (slope_dip < dip_mean) & (zbase > zcross),
+            (slope_dip < dip_mean) & (zbase < zcross),
+            (slope_dip > dip_mean) & (zbase > zcross),
+        ],
+        [dip_mean - slope_dip, dip_mean + slope_dip, slope_dip - dip_mean],
+        180 - (dip_mean + slope_dip),
+    )
+    true_thick = slope_length * np.sin(np.radians(surf_dip))
+
+    estimates["appar_th"] = min_dist
+    estimates["thickness"] = true_thick
+    estimates["type"] = estimate_type
+    estimates["slope_dip"] = slope_dip
+    estimates["slope_length"] = slope_length
+    estimates["delz"] = delz
+    estimates["zbase"] = zbase
+    estimates["zcross"] = zcross
+    estimates = estimates[
+        ~np.isnan(true_thick) & (true_thick > 0) & (true_thick < max_thickness_allowed)
+    ].astype({"thickness": int})
+    return estimates[
+        [
+            "X",
+            "Y",
+            "formation",
+            "appar_th",
+            "thickness",
+            "cl",
+            "cm",
+            "p1x",
+            "p1y",
+            "p2x",
+            "p2y",
+            "dip",
+            "type",
+            "slope_dip",
+            "slope_length",
+            "delz",
+            "zbase",
+            "zcross",
+        ]
+    ]
+
+
+####################################################
+# Load the inputs shared by the full and minimum thickness estimates
+#
+# thickness_inputs(config,map_data)
+# Returns:
+# transects dataframe from thickness_transects() for raw_contacts.csv
+# line_units array of unit name of each basal contact in basal_contacts.shp.zip
+# all_sorts stratigraphic column (all_sorts.csv)
+# crossings tuple from transect_crossings()
+####################################################
+
+
+def thickness_inputs(config: Config, map_data: MapData):
     contact_points_file = os.path.join(config.tmp_path, "raw_contacts.csv")
     # load basal contacts as geopandas dataframe
     contact_lines = gpd.read_file(
@@ -2838,238 +2778,345 @@ def calc_min_thickness_with_grid(config: Config, map_data: MapData):
     all_sorts = pd.read_csv(os.path.join(config.tmp_path, "all_sorts.csv"))
     contacts = pd.read_csv(contact_points_file)
 
-    sum_thick = pd.read_csv(
-        os.path.join(config.output_path, "formation_thicknesses.csv")
+    transects = thickness_transects(config, map_data, contacts)
+    crossings = find_transect_crossings(
+        transects,
+        contact_lines.geometry.to_numpy(),
+        config.run_flags["thickness_buffer"],
+        config.run_flags["n_workers"],
     )
-    found_codes = sum_thick["formation"].unique()
-    if config.verbose_level != VerboseLevel.NONE:
-        print(found_codes, "already processed")
-    clength = len(contacts)
-    cx = contacts["X"].to_numpy()
-    cy = contacts["Y"].to_numpy()
-    cl = contacts["lsx"].to_numpy(dtype=float)
-    cm = contacts["lsy"].to_numpy(dtype=float)
-    ctextcode = contacts["formation"].to_numpy()
+    return (transects, contact_lines["UNIT_NAME"].to_numpy(), all_sorts, crossings)
 
-    fth = open(os.path.join(config.output_path, "formation_thicknesses.csv"), "a+")
-    # fth.write('X,Y,formation,appar_th,thickness,cl,cm,p1x,p1y,p2x,p2y,dip\n')
 
-    # np.savetxt(os.path.join(config.tmp_path,'dist.csv'),dist,delimiter = ',')
-    # display("ppp",cx.shape,cy.shape,ox.shape,oy.shape,dip.shape,azimuth.shape,dist.shape)
-    n_est = 0
-    for k in range(0, clength):  # loop through all contact segments
-        if not (ctextcode[k] in found_codes):
-            # print(ctextcode[k])
-            r = int(
-                (cy[k] - config.bbox[1]) / config.run_flags["interpolation_spacing"]
-            )
-            c = int(
-                (cx[k] - config.bbox[0]) / config.run_flags["interpolation_spacing"]
-            )
+def full_thickness_estimates(
+    config: Config, map_data: MapData, transects, line_units, all_sorts, crossings
+):
+    dtm = map_data.get_map_data(Datatype.DTM)
+    all_sorts = all_sorts.copy()
+    all_sorts["index2"] = all_sorts.index
+    # all_sorts.set_index('code',inplace=True)
+    geol = map_data.get_map_data(Datatype.GEOLOGY).copy()
+    # geol=gpd.read_file(os.path.join(config.tmp_path, 'geol_clip.shp'))
+    geol.drop_duplicates(subset="UNIT_NAME", inplace=True)
+    # geol.set_index('UNIT_NAME',inplace=True)
+    drops = geol[
+        geol["DESCRIPTION"].str.contains(config.c_l["sill"])
+        & geol["ROCKTYPE1"].str.contains(config.c_l["intrusive"])
+    ]
+    for ind, drop in drops.iterrows():
+        all_sorts.drop(labels=drop.name, inplace=True, errors="ignore")
+    all_sorts["code"] = all_sorts.index
+    all_sorts["index"] = all_sorts["index2"]
+    # all_sorts.set_index('index2',inplace=True)
 
-            dip_mean = map_data.dip_grid[r, c]
+    # cross each normal with the basal contacts of the next higher unit
+    job_point, job_upper = thickness_jobs(
+        transects["formation"].to_numpy(), all_sorts["code"].to_numpy()
+    )
+    job, point, min_dist, crossx, crossy = closest_crossings(
+        crossings, line_units, job_point, job_upper, True
+    )
+    return thickness_estimates(
+        transects,
+        dtm,
+        point,
+        min_dist,
+        crossx,
+        crossy,
+        0,
+        config.run_flags["max_thickness_allowed"],
+        "full",
+    )
 
-            dx1 = -cm[k] * config.run_flags["thickness_buffer"]
-            dy1 = cl[k] * config.run_flags["thickness_buffer"]
-            dx2 = -dx1
-            dy2 = -dy1
-            p1 = Point((dx1 + cx[k], dy1 + cy[k]))
-            p2 = Point((dx2 + cx[k], dy2 + cy[k]))
-            ddline = LineString((p1, p2))
-            orig = Point((cx[k], cy[k]))
 
-            crossings = np.zeros((1000, 5))
+def min_thickness_estimates(
+    config: Config,
+    map_data: MapData,
+    transects,
+    line_units,
+    all_sorts,
+    crossings,
+    found_codes,
+):
+    dtm = map_data.get_map_data(Datatype.DTM)
 
-            g = 0
-            for indx, apair in all_sorts.iterrows():  # loop through all basal contacts
-                if ctextcode[k] == apair["code"]:
-                    # subset contacts to just those with 'a' code
-                    is_contacta = (
-                        contact_lines["UNIT_NAME"] != all_sorts.iloc[g - 1]["code"]
-                    )
-                    acontacts = contact_lines[is_contacta]
-                    i = 0
-                    for (
-                        ind,
-                        acontact,
-                    ) in (
-                        acontacts.iterrows()
-                    ):  # loop through distinct linestrings for upper contact
-                        # if(bboxes_intersect(ddline.bounds,acontact[1].geometry.bounds)):
+    # cross each normal of formations without a full estimate with the basal contacts
+    # of every unit except the next higher one
+    job_point, job_upper = thickness_jobs(
+        transects["formation"].to_numpy(), all_sorts["code"].to_numpy()
+    )
+    not_found = ~np.isin(transects["formation"].to_numpy()[job_point], found_codes)
+    job, point, min_dist, crossx, crossy = closest_crossings(
+        crossings, line_units, job_point[not_found], job_upper[not_found], False
+    )
+    return thickness_estimates(
+        transects,
+        dtm,
+        point,
+        min_dist,
+        crossx,
+        crossy,
+        1,
+        config.run_flags["max_thickness_allowed"],
+        "min",
+    )
 
-                        if not str(acontact.geometry) == "None":
-                            if ddline.intersects(acontact.geometry):
-                                isects = ddline.intersection(acontact.geometry)
-                                if isects.geom_type == "MultiPoint":
-                                    for pt in isects.geoms:
-                                        if (
-                                            pt.distance(orig)
-                                            < config.run_flags["thickness_buffer"] * 2
-                                        ):
-                                            # print(i,",", pt.x, ",",pt.y,",",apair[1]['code'],",",apair[1]['group'])
-                                            crossings[i, 0] = i
-                                            crossings[i, 1] = int(apair["index"])
-                                            crossings[i, 2] = 0
-                                            crossings[i, 3] = pt.x
-                                            crossings[i, 4] = pt.y
-                                            i = i + 1
-                                else:
-                                    if not isects.geom_type == "GeometryCollection":
-                                        if (
-                                            isects.distance(orig)
-                                            < config.run_flags["thickness_buffer"] * 2
-                                        ):
-                                            # print(i,",", isects.x,",", isects.y,",",apair[1]['code'],",",apair[1]['group'])
-                                            crossings[i, 0] = i
-                                            crossings[i, 1] = int(apair["index"])
-                                            crossings[i, 2] = 0
-                                            crossings[i, 3] = isects.x
-                                            crossings[i, 4] = isects.y
-                                            i = i + 1
 
-                                if (
-                                    i > 0
-                                ):  # if we found any intersections with base of next higher unit
-                                    min_dist = 1e8
-                                    # min_pt = 0
-                                    for f in range(0, i):  # find closest hit
-                                        this_dist = m2l_utils.ptsdist(
-                                            crossings[f, 3],
-                                            crossings[f, 4],
-                                            cx[k],
-                                            cy[k],
-                                        )
-                                        if this_dist < min_dist:
-                                            min_dist = this_dist
-                                            # min_pt = f
-                                            crossx = crossings[f, 3]
-                                            crossy = crossings[f, 4]
-                                    # if not too far, add to output
-                                    if (
-                                        min_dist
-                                        < config.run_flags["max_thickness_allowed"]
-                                        and min_dist > 1
-                                    ):
-                                        locations = [(cx[k], cy[k])]
-                                        zbase = float(
-                                            m2l_utils.value_from_dtm_dtb(
-                                                dtm, "", "", False, locations
-                                            )
-                                        )
-                                        locations = [(crossx, crossy)]
-                                        zcross = float(
-                                            m2l_utils.value_from_dtm_dtb(
-                                                dtm, "", "", False, locations
-                                            )
-                                        )
-                                        delz = fabs(zcross - zbase)
-                                        slope_dip = degrees(atan(delz / min_dist))
-                                        slope_length = sqrt(
-                                            (min_dist * min_dist) + (delz * delz)
-                                        )
-                                        if slope_dip < dip_mean and zbase > zcross:
-                                            surf_dip = dip_mean - slope_dip
-                                        elif slope_dip < dip_mean and zbase < zcross:
-                                            surf_dip = dip_mean + slope_dip
-                                        elif slope_dip > dip_mean and zbase > zcross:
-                                            surf_dip = slope_dip - dip_mean
-                                        else:
-                                            surf_dip = 180 - (dip_mean + slope_dip)
+@beartype.beartype
+def calc_thickness_with_grid(config: Config, map_data: MapData):
+    transects, line_units, all_sorts, crossings = thickness_inputs(config, map_data)
+    estimates = full_thickness_estimates(
+        config, map_data, transects, line_units, all_sorts, crossings
+    )
+    estimates.to_csv(
+        os.path.join(config.output_path, "formation_thicknesses.csv"), index=False
+    )
 
-                                        true_thick = slope_length * sin(
-                                            radians(surf_dip)
-                                        )
-                                        if (
-                                            not isnan(true_thick)
-                                            and true_thick > 0
-                                            and true_thick
-                                            < config.run_flags["max_thickness_allowed"]
-                                        ):
-                                            ostr = "{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{}\n".format(
-                                                cx[k],
-                                                cy[k],
-                                                ctextcode[k],
-                                                min_dist,
-                                                int(true_thick),
-                                                cl[k],
-                                                cm[k],
-                                                p1.x,
-                                                p1.y,
-                                                p2.x,
-                                                p2.y,
-                                                dip_mean,
-                                                "min",
-                                                slope_dip,
-                                                slope_length,
-                                                delz,
-                                                zbase,
-                                                zcross,
-                                            )
-                                            # ostr = str(cx[k])+','+str(cy[k])+','+ctextcode[k]+','+str(int(true_thick))+\
-                                            #    ','+str(cl[k])+','+str(cm[k])+','+str(lm)+','+str(mm)+','+str(nm)+','+\
-                                            #    str(p1.x)+','+str(p1.y)+','+str(p2.x)+','+str(p2.y)+','+str(dip_mean)+'\n'
-                                            fth.write(ostr)
-                                            n_est = n_est + 1
+    if config.verbose_level != VerboseLevel.NONE:
+        print(
+            len(estimates),
+            "thickness estimates saved as",
+            os.path.join(config.output_path, "formation_thicknesses.csv"),
+        )
+
+
+@beartype.beartype
+def calc_min_thickness_with_grid(config: Config, map_data: MapData):
+    transects, line_units, all_sorts, crossings = thickness_inputs(config, map_data)
+
+    sum_thick = pd.read_csv(
+        os.path.join(config.output_path, "formation_thicknesses.csv")
+    )
+    found_codes = sum_thick["formation"].unique()
+    if config.verbose_level != VerboseLevel.NONE:
+        print(found_codes, "already processed")
+    estimates = min_thickness_estimates(
+        config, map_data, transects, line_units, all_sorts, crossings, found_codes
+    )
+    estimates.to_csv(
+        os.path.join(config.output_path, "formation_thicknesses.csv"),
+        mode="a",
+        header=False,
+        index=False,
+    )
 
-            g = g + 1
     if config.verbose_level != VerboseLevel.NONE:
         print(
-            n_est,
+            len(estimates),
             "min thickness estimates appended to",
             os.path.join(config.output_path, "formation_thicknesses.csv"),
         )
-    fth.close()
+
+
+####################################################
+# Calculate full and minimum formation thickness estimates in one pass
+#
+# calc_full_and_min_thickness_with_grid(config,map_data)
+#
+# Same output as calc_thickness_with_grid() followed by calc_min_thickness_with_grid(),
+# but the inputs are loaded and the transects crossed with the basal contacts only once
+####################################################
+
+
+@beartype.beartype
+def calc_full_and_min_thickness_with_grid(config: Config, map_data: MapData):
+    transects, line_units, all_sorts, crossings = thickness_inputs(config, map_data)
+    full_estimates = full_thickness_estimates(
+        config, map_data, transects, line_units, all_sorts, crossings
+    )
+    found_codes = full_estimates["formation"].unique()
+    min_estimates = min_thickness_estimates(
+        config, map_data, transects, line_units, all_sorts, crossings, found_codes
+    )
+    pd.concat([full_estimates, min_estimates]).to_csv(
+        os.path.join(config.output_path, "formation_thicknesses.csv"), index=False
+    )
+
+    if config.verbose_level != VerboseLevel.NONE:
+        print(
+            len(full_estimates),
+            "thickness estimates and",
+            len(min_estimates),
+            "min thickness estimates saved as",
+            os.path.join(config.output_path, "formation_thicknesses.csv"),
+        )
 
 
 ####################################
 # Normalise thickness for each estimate to median for that formation
 #
-# normalise_thickness(output_path)
+# normalise_thickness(output_path,chunksize,bins)
 # Args:
 # output_path path to m2l output directory
+# chunksize number of rows of formation_thicknesses.csv read at a time
+# bins number of histogram bins used to narrow down each median
 #
 # Normalises previously calculated formation thickness by dviding by median value for that formation
+# formation_thicknesses.csv is read in chunks. The first pass keeps a count, sum, min and max of the
+# non-zero thicknesses of each formation, later passes histogram the values between the current
+# bounds of each median until no more than bins candidates are left, which are then kept and sorted.
+# The std comes from the squared deviations from the mean, summed during the first histogram pass.
+# Normalised estimates are streamed through per formation spill files, so memory use depends on
+# chunksize, bins and the number of formations, not on the number of estimates
 ####################################
-def normalise_thickness(output_path):
-    thickness = pd.read_csv(
-        os.path.join(output_path, "formation_thicknesses.csv"), sep=","
-    )
+def normalise_thickness(output_path, chunksize=1000000, bins=1024):
+    thickness_file = os.path.join(output_path, "formation_thicknesses.csv")
 
-    codes = thickness.formation.unique()
-    f = open(os.path.join(output_path, "formation_thicknesses_norm.csv"), "w")
-    f.write("x,y,formation,app_th,thickness,norm_th\n")
+    def read_thicknesses(columns):
+        return pd.read_csv(
+            thickness_file,
+            sep=",",
+            usecols=columns,
+            dtype={"formation": str},
+            chunksize=chunksize,
+        )
+
+    # first pass, count, sum, min, max and first type of the non-zero thicknesses of each formation
+    stats = {}
+    start = 0
+    for chunk in read_thicknesses(["formation", "thickness", "type"]):
+        thickness = chunk["thickness"].to_numpy(dtype=float)
+        estimate_type = chunk["type"].to_numpy()
+        groups = chunk.groupby("formation", sort=False).indices
+        for formation in chunk["formation"].dropna().unique():
+            index = groups[formation]
+            index = index[thickness[index] != 0]
+            stat = stats.setdefault(formation, [0, 0.0, np.inf, -np.inf, None])
+            if len(index) > 0:
+                value = thickness[index]
+                stat[0] += len(index)
+                stat[1] += value.sum()
+                stat[2] = np.minimum(stat[2], value.min())
+                stat[3] = np.maximum(stat[3], value.max())
+                if stat[4] is None:
+                    stat[4] = (start + index[0], estimate_type[index[0]])
+        start += len(chunk)
+
+    # estimates for a code are those whose formation contains it
+    codes = list(stats)
+    matches = {code: [f for f in codes if code in f] for code in codes}
+    counts = {}
+    means = {}
+    first_types = {}
+    # each target is [lower bound, upper bound, rank within bounds, count within bounds, value]
+    targets = {}
+    for code in codes:
+        stat = [stats[f] for f in matches[code]]
+        count = sum(s[0] for s in stat)
+        if count > 2:
+            counts[code] = count
+            means[code] = sum(s[1] for s in stat) / count
+            first_types[code] = min(s[4] for s in stat if s[4] is not None)[1]
+            if np.isfinite(means[code]):
+                lo = np.min([s[2] for s in stat])
+                hi = np.max([s[3] for s in stat])
+                targets[code] = [
+                    [lo, hi, rank, count, lo if lo == hi else None]
+                    for rank in sorted({(count - 1) // 2, count // 2})
+                ]
+    deviations = dict.fromkeys(targets, 0.0)
+
+    # selection passes, narrow each median down to one histogram bin at a time
+    first = len(targets) > 0
+    while first or any(t[4] is None for ts in targets.values() for t in ts):
+        candidates = {}
+        histograms = {}
+        for code, ts in targets.items():
+            for j, t in enumerate(ts):
+                if t[4] is None and t[3] <= bins:
+                    candidates[code, j] = []
+                elif t[4] is None:
+                    histograms[code, j] = (
+                        np.zeros(bins, dtype=int),
+                        np.full(bins, np.inf),
+                        np.full(bins, -np.inf),
+                    )
+        for chunk in read_thicknesses(["formation", "thickness"]):
+            thickness = chunk["thickness"].to_numpy(dtype=float)
+            groups = chunk.groupby("formation", sort=False).indices
+            for code, ts in targets.items():
+                index = [groups[f] for f in matches[code] if f in groups]
+                if len(index) == 0:
+                    continue
+                value = thickness[np.concatenate(index)]
+                value = value[value != 0]
+                if first:
+                    deviations[code] += np.sum((value - means[code]) ** 2)
+                for j, (lo, hi, rank, count, found) in enumerate(ts):
+                    if found is not None:
+                        continue
+                    inside = value[(value >= lo) & (value <= hi)]
+                    if (code, j) in candidates:
+                        candidates[code, j].append(inside)
+                        continue
+                    slot = ((inside - lo) / (hi - lo) * bins).astype(int)
+                    slot = np.minimum(slot, bins - 1)
+                    bin_count, bin_min, bin_max = histograms[code, j]
+                    bin_count += np.bincount(slot, minlength=bins)
+                    np.minimum.at(bin_min, slot, inside)
+                    np.maximum.at(bin_max, slot, inside)
+        first = False
+        for (code, j), value in candidates.items():
+            t = targets[code][j]
+            t[4] = np.partition(np.concatenate(value), t[2])[t[2]]
+        for (code, j), (bin_count, bin_min, bin_max) in histograms.items():
+            t = targets[code][j]
+            below = np.cumsum(bin_count)
+            b = np.searchsorted(below, t[2], side="right")
+            t[:4] = [
+                bin_min[b],
+                bin_max[b],
+                t[2] - below[b] + bin_count[b],
+                bin_count[b],
+            ]
+            if t[0] == t[1]:
+                t[4] = t[0]
+
+    medians = {}
     fs = open(os.path.join(output_path, "formation_summary_thicknesses.csv"), "w")
     fs.write("formation,thickness median,thickness std,method\n")
-    for code in codes:
-        is_code = thickness.formation.str.contains(code, regex=False)
-        all_thick = thickness[is_code]
-        all_thick2 = all_thick[all_thick["thickness"] != 0]
-        thicknesses = np.asarray(all_thick2.loc[:, "thickness"], dtype=float)
-
-        if len(all_thick2) > 2:
-            med = np.median(thicknesses)
-            std = np.std(thicknesses)
-            # print(code, med, std)
-            ostr = "{},{},{},{}\n".format(code, med, std, all_thick2.iloc[0]["type"])
-            # ostr = str(code)+","+str(all_thick2.loc[:,"thickness"].median())+","+str(all_thick2.loc[:,"thickness"].std())+"\n"
-            fs.write(ostr)
+    for code in counts:
+        if code in targets:
+            med = np.mean([t[4] for t in targets[code]])
+            std = np.sqrt(deviations[code] / counts[code])
+        else:
+            med = std = np.float64(np.nan)
+        ostr = "{},{},{},{}\n".format(code, med, std, first_types[code])
+        fs.write(ostr)
+        if med > 0:
+            medians[code] = med
+    fs.close()
 
-            thick = all_thick2.to_numpy()
-
-            for i in range(len(thick)):
-                if med > 0:
-                    ostr = "{},{},{},{},{},{}\n".format(
-                        thick[i, 0],
-                        thick[i, 1],
-                        thick[i, 2],
-                        thick[i, 3],
-                        thick[i, 4],
-                        thicknesses[i] / med,
-                    )
-                    # ostr = str(thick[i,0])+","+str(thick[i,1])+","+str(thick[i,2])+","+str(thick[i,3])+","+str(thick[i,3]/med)+"\n"
-                    f.write(ostr)
+    # last pass, normalised estimates are written grouped by code
+    f = open(os.path.join(output_path, "formation_thicknesses_norm.csv"), "w")
+    f.write("x,y,formation,app_th,thickness,norm_th\n")
+    with tempfile.TemporaryDirectory(dir=output_path) as spill_path:
+        spill_files = {
+            code: os.path.join(spill_path, "{}.csv".format(c))
+            for c, code in enumerate(medians)
+        }
+        for chunk in pd.read_csv(
+            thickness_file,
+            sep=",",
+            usecols=range(5),
+            dtype={"formation": str},
+            chunksize=chunksize,
+        ):
+            thickness = chunk.iloc[:, 4].to_numpy(dtype=float)
+            groups = chunk.groupby("formation", sort=False).indices
+            for code, med in medians.items():
+                index = [groups[f] for f in matches[code] if f in groups]
+                if len(index) == 0:
+                    continue
+                index = np.sort(np.concatenate(index))
+                index = index[thickness[index] != 0]
+                thick = chunk.iloc[index].assign(norm_th=thickness[index] / med)
+                thick.to_csv(spill_files[code], mode="a", header=False, index=False)
+        for code in medians:
+            if os.path.exists(spill_files[code]):
+                with open(spill_files[code]) as spill:
+                    shutil.copyfileobj(spill, f)
     f.close()
-    fs.close()
 
 
 ####################################################
@@ -3089,18 +3136,14 @@ def normalise_thickness(output_path):
 def save_fold_axial_traces_orientations(
     config: Config, map_data: MapData, workflow: dict
 ):
-    dtm = map_data.get_map_data(Datatype.DTM).open()
+    dtm = map_data.get_map_data(Datatype.DTM)
     geology = gpd.read_file(os.path.join(config.tmp_path, "geol_clip.shp"))
     # contacts = np.genfromtxt(os.path.join(config.tmp_path,'interpolation_contacts_'+config.run_flags['interpolation_scheme']+'.csv'),delimiter = ',',dtype = 'float')
-    f = open(
-        os.path.join(config.output_path, "fold_axial_trace_orientations2.csv"), "w"
-    )
-    f.write("X,Y,Z,azimuth,dip,polarity,formation,group\n")
+    f_rows = []
     folds_clip = map_data.get_map_data(Datatype.FOLD).copy()
     # folds_clip = gpd.read_file(path_folds,)
     folds_clip = folds_clip.dropna(subset=["geometry"])
-    fo = open(os.path.join(config.output_path, "fold_axial_traces.csv"), "w")
-    fo.write("X,Y,Z,code,type\n")
+    fo_rows = []
     dummy = []
     dummy.append(1)
     for indx, fold in folds_clip.iterrows():
@@ -3121,23 +3164,13 @@ def save_fold_axial_traces_orientations(
                                 or i == int((len(fold_ls.coords) - 1) / 2)
                                 or i == len(fold_ls.coords) - 1
                             ):
-                                locations = [(afs[0], afs[1])]
-                                height = m2l_utils.value_from_dtm_dtb(
-                                    dtm,
-                                    map_data.dtb,
-                                    map_data.dtb_null,
-                                    workflow["cover_map"],
-                                    locations,
-                                )
-                                ostr = "{},{},{},FA_{},{}\n".format(
-                                    afs[0],
-                                    afs[1],
-                                    height,
-                                    fold_name,
-                                    fold["TYPE"].replace(",", ""),
+                                fo_rows.append(
+                                    (
+                                        (afs[0], afs[1]),
+                                        fold_name,
+                                        fold["TYPE"].replace(",", ""),
+                                    )
                                 )
-                                # ostr = str(afs[0])+','+str(afs[1])+','+str(height)+','+'FA_'+fold_name+','+fold['TYPE'].replace(',','')+'\n'
-                                fo.write(ostr)
                                 # calculate FAT normal offsets
                                 first = False
                                 lastx = afs[0]
@@ -3191,28 +3224,22 @@ def save_fold_axial_traces_orientations(
                                             not str(structure_code.iloc[0]["UNIT_NAME"])
                                             == "nan"
                                         ):
-                                            locations = [(midxr, midyr)]
-                                            height = m2l_utils.value_from_dtm_dtb(
-                                                dtm,
-                                                map_data.dtb,
-                                                map_data.dtb_null,
-                                                workflow["cover_map"],
-                                                locations,
-                                            )
-                                            ostr = "{},{},{},{},{},{},{},{}\n".format(
-                                                midxr,
-                                                midyr,
-                                                height,
-                                                dipdir2,
-                                                int(dip),
-                                                1,
-                                                str(structure_code.iloc[0]["UNIT_NAME"])
-                                                .replace(" ", "_")
-                                                .replace("-", "_"),
-                                                structure_code.iloc[0]["GROUP"],
+                                            f_rows.append(
+                                                (
+                                                    (midxr, midyr),
+                                                    dipdir2,
+                                                    int(dip),
+                                                    1,
+                                                    str(
+                                                        structure_code.iloc[0][
+                                                            "UNIT_NAME"
+                                                        ]
+                                                    )
+                                                    .replace(" ", "_")
+                                                    .replace("-", "_"),
+                                                    structure_code.iloc[0]["GROUP"],
+                                                )
                                             )
-                                            # ostr = str(midxr)+','+str(midyr)+','+str(height)+','+str(dipdir)+','+str(int(dip))+',1,'+str(structure_code.iloc[0]['UNIT_NAME']).replace(" ","_").replace("-","_")+','+str(structure_code.iloc[0]['GROUP])+'\n'
-                                            f.write(ostr)
 
                                         geometry = [Point(midxl, midyl)]
                                         gdf = gpd.GeoDataFrame(
@@ -3227,28 +3254,22 @@ def save_fold_axial_traces_orientations(
                                             not str(structure_code.iloc[0]["UNIT_NAME"])
                                             == "nan"
                                         ):
-                                            locations = [(midxl, midyl)]
-                                            height = m2l_utils.value_from_dtm_dtb(
-                                                dtm,
-                                                map_data.dtb,
-                                                map_data.dtb_null,
-                                                workflow["cover_map"],
-                                                locations,
-                                            )
-                                            ostr = "{},{},{},{},{},{},{},{}\n".format(
-                                                midxl,
-                                                midyl,
-                                                height,
-                                                dipdir2 + 180,
-                                                int(dip),
-                                                1,
-                                                str(structure_code.iloc[0]["UNIT_NAME"])
-                                                .replace(" ", "_")
-                                                .replace("-", "_"),
-                                                structure_code.iloc[0]["GROUP"],
+                                            f_rows.append(
+                                                (
+                                                    (midxl, midyl),
+                                                    dipdir2 + 180,
+                                                    int(dip),
+                                                    1,
+                                                    str(
+                                                        structure_code.iloc[0][
+                                                            "UNIT_NAME"
+                                                        ]
+                                                    )
+                                                    .replace(" ", "_")
+                                                    .replace("-", "_"),
+                                                    structure_code.iloc[0]["GROUP"],
+                                                )
                                             )
-                                            # ostr = str(midxl)+','+str(midyl)+','+str(height)+','+str(dipdir+180)+','+str(int(dip))+',1,'+str(structure_code.iloc[0]['UNIT_NAME']).replace(" ","_").replace("-","_")+','+str(structure_code.iloc[0]['GROUP'])+'\n'
-                                            f.write(ostr)
 
                         i = i + 1
             else:
@@ -3264,23 +3285,13 @@ def save_fold_axial_traces_orientations(
                             or i == int((len(fold_ls.coords) - 1) / 2)
                             or i == len(fold_ls.coords) - 1
                         ):
-                            locations = [(afs[0], afs[1])]
-                            height = m2l_utils.value_from_dtm_dtb(
-                                dtm,
-                                map_data.dtb,
-                                map_data.dtb_null,
-                                workflow["cover_map"],
-                                locations,
-                            )
-                            ostr = "{},{},{},FA_{},{}\n".format(
-                                afs[0],
-                                afs[1],
-                                height,
-                                fold_name,
-                                fold["TYPE"].replace(",", ""),
+                            fo_rows.append(
+                                (
+                                    (afs[0], afs[1]),
+                                    fold_name,
+                                    fold["TYPE"].replace(",", ""),
+                                )
                             )
-                            # ostr = str(afs[0])+','+str(afs[1])+','+str(height)+','+'FA_'+fold_name+','+fold['TYPE'].replace(',','')+'\n'
-                            fo.write(ostr)
                             # calculate FAT normal offsets
                             if not first:
                                 l, m = m2l_utils.pts2dircos(
@@ -3329,28 +3340,18 @@ def save_fold_axial_traces_orientations(
                                         not str(structure_code.iloc[0]["UNIT_NAME"])
                                         == "nan"
                                     ):
-                                        locations = [(midxr, midyr)]
-                                        height = m2l_utils.value_from_dtm_dtb(
-                                            dtm,
-                                            map_data.dtb,
-                                            map_data.dtb_null,
-                                            workflow["cover_map"],
-                                            locations,
-                                        )
-                                        ostr = "{},{},{},{},{},{},{},{}\n".format(
-                                            midxr,
-                                            midyr,
-                                            height,
-                                            dipdir2,
-                                            int(dip),
-                                            1,
-                                            str(structure_code.iloc[0]["UNIT_NAME"])
-                                            .replace(" ", "_")
-                                            .replace("-", "_"),
-                                            structure_code.iloc[0]["GROUP"],
+                                        f_rows.append(
+                                            (
+                                                (midxr, midyr),
+                                                dipdir2,
+                                                int(dip),
+                                                1,
+                                                str(structure_code.iloc[0]["UNIT_NAME"])
+                                                .replace(" ", "_")
+                                                .replace("-", "_"),
+                                                structure_code.iloc[0]["GROUP"],
+                                            )
                                         )
-                                        # ostr = str(midxr)+','+str(midyr)+','+str(height)+','+str(dipdir)+','+str(int(dip))+',1,'+str(structure_code.iloc[0]['UNIT_NAME']).replace(" ","_").replace("-","_")+','+str(structure_code.iloc[0]['GROUP'])+'\n'
-                                        f.write(ostr)
 
                                     geometry = [Point(midxl, midyl)]
                                     gdf = gpd.GeoDataFrame(
@@ -3365,34 +3366,52 @@ def save_fold_axial_traces_orientations(
                                         not str(structure_code.iloc[0]["UNIT_NAME"])
                                         == "nan"
                                     ):
-                                        locations = [(midxl, midyl)]
-                                        height = m2l_utils.value_from_dtm_dtb(
-                                            dtm,
-                                            map_data.dtb,
-                                            map_data.dtb_null,
-                                            workflow["cover_map"],
-                                            locations,
-                                        )
-                                        ostr = "{},{},{},{},{},{},{},{}\n".format(
-                                            midxl,
-                                            midyl,
-                                            height,
-                                            dipdir2 + 180,
-                                            int(dip),
-                                            1,
-                                            str(structure_code.iloc[0]["UNIT_NAME"])
-                                            .replace(" ", "_")
-                                            .replace("-", "_"),
-                                            structure_code.iloc[0]["GROUP"],
+                                        f_rows.append(
+                                            (
+                                                (midxl, midyl),
+                                                dipdir2 + 180,
+                                                int(dip),
+                                                1,
+                                                str(structure_code.iloc[0]["UNIT_NAME"])
+                                                .replace(" ", "_")
+                                                .replace("-", "_"),
+                                                structure_code.iloc[0]["GROUP"],
+                                            )
                                         )
-                                        # ostr = str(midxl)+','+str(midyl)+','+str(height)+','+str(dipdir+180)+','+str(int(dip))+',1,'+str(structure_code.iloc[0]['UNIT_NAME']).replace(" ","_").replace("-","_")+','+str(structure_code.iloc[0]['GROUP'])+'\n'
-                                        f.write(ostr)
                             first = False
                             lastx = afs[0]
                             lasty = afs[1]
                     i = i + 1
 
+    # sample heights for all trace points and orientations in one pass over the dtm
+    heights = m2l_utils.values_from_dtm_dtb(
+        dtm,
+        map_data.dtb,
+        map_data.dtb_null,
+        workflow["cover_map"],
+        [row[0] for row in fo_rows],
+    )
+    fo = open(os.path.join(config.output_path, "fold_axial_traces.csv"), "w")
+    fo.write("X,Y,Z,code,type\n")
+    for row, height in zip(fo_rows, heights):
+        fo.write("{},{},{},FA_{},{}\n".format(row[0][0], row[0][1], height, *row[1:]))
     fo.close()
+
+    heights = m2l_utils.values_from_dtm_dtb(
+        dtm,
+        map_data.dtb,
+        map_data.dtb_null,
+        workflow["cover_map"],
+        [row[0] for row in f_rows],
+    )
+    f = open(
+        os.path.join(config.output_path, "fold_axial_trace_orientations2.csv"), "w"
+    )
+    f.write("X,Y,Z,azimuth,dip,polarity,formation,group\n")
+    for row, height in zip(f_rows, heights):
+        f.write(
+            "{},{},{},{},{},{},{},{}\n".format(row[0][0], row[0][1], height, *row[1:])
+        )
     f.close()
     if config.verbose_level != VerboseLevel.NONE:
         print(
@@ -3476,7 +3495,7 @@ def extract_section(
     surface_cut=2000,
 ):
     faults = map_data.get_map_data(Datatype.FAULT)
-    dtm = map_data.get_map_data(Datatype.DTM).open()
+    dtm = map_data.get_map_data(Datatype.DTM)
     all_sorts = pd.read_csv(os.path.join(config.tmp_path, "all_sorts2.csv"), sep=",")
     sf = open(os.path.join(config.output_path, "seismic_faults.csv"), "w")
     sf.write("X,Y,Z,formation\n")
@@ -3564,134 +3583,70 @@ def save_orientations_with_polarity(config: Config, map_data: MapData):
         os.path.join(config.output_path, "orientations.csv"), sep=","
     )
     codes = all_sorts["code"].unique()
-    # all_sorts.set_index('code',  inplace=True)
+    strat_index = all_sorts.drop_duplicates("code").set_index("code")["index"]
 
-    f = open(os.path.join(config.output_path, "orientations_polarity.csv"), "w")
-    f.write("X,Y,Z,azimuth,dip,polarity,formation\n")
+    x = orientations["X"].to_numpy(dtype=float)
+    y = orientations["Y"].to_numpy(dtype=float)
+    l, m, n = m2l_utils.ddd2dircos_arr(
+        orientations["dip"].to_numpy(dtype=float),
+        orientations["azimuth"].to_numpy(dtype=float) + 90.0,
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        l2 = l / np.sqrt((l * l) + (m * m))
+        m2 = m / np.sqrt((l * l) + (m * m))
+
+    # transects run buffer from each orientation towards dipdir +180 (sign 1) and then
+    # towards dipdir (sign 0), the closest crossing wins and the first one wins a tie
+    start = np.column_stack((x, y))
+    transects = shapely.linestrings(
+        np.stack(
+            [
+                np.stack([start, start + np.column_stack((m2, -l2)) * buffer], axis=1),
+                np.stack([start, start + np.column_stack((-m2, l2)) * buffer], axis=1),
+            ],
+            axis=1,
+        ).reshape(-1, 2, 2)
+    )
+    is_code = (
+        contact_lines["UNIT_NAME"].isin(codes) & contact_lines.geometry.notna()
+    ).to_numpy()
+    line_geometry = contact_lines.geometry.to_numpy()[is_code]
+    line_units = contact_lines["UNIT_NAME"].to_numpy()[is_code]
+    tree = shapely.STRtree(line_geometry)
+    pair_transect, pair_line = tree.query(transects, predicate="intersects")
+    order = np.lexsort((pair_line, pair_transect))
+    pair_transect = pair_transect[order]
+    pair_line = pair_line[order]
+
+    isects = shapely.intersection(transects[pair_transect], line_geometry[pair_line])
+    is_points = np.isin(shapely.get_type_id(isects), [0, 4])
+    parts, part_pair = shapely.get_parts(isects[is_points], return_index=True)
+    part_pair = np.flatnonzero(is_points)[part_pair]
+    part_transect = pair_transect[part_pair]
+    part_ori = part_transect // 2
+    px, py = shapely.get_coordinates(parts).T
+    dist = np.sqrt((x[part_ori] - px) ** 2 + (y[part_ori] - py) ** 2)
+    near = dist < buffer * 2
+    closest = np.flatnonzero(near)[np.lexsort((dist[near], part_ori[near]))]
+    closest = closest[np.unique(part_ori[closest], return_index=True)[1]]
+
+    close_ori = part_ori[closest]
+    close_dist = dist[closest]
+    sign = part_transect[closest] % 2 == 0
+    close_fm = line_units[pair_line[part_pair[closest]]]
+    ori_index = orientations["formation"].map(strat_index).to_numpy()[close_ori]
+    close_index = strat_index.reindex(close_fm).to_numpy()
+    polarity = np.full(len(orientations), -999)
+    polarity[close_ori] = np.where(
+        sign,
+        np.where((ori_index <= close_index) & (close_dist < buffer * 2), 1, 0),
+        np.where((ori_index < close_index) & (close_dist < buffer * 2), 0, 1),
+    )
 
-    for indx, anori in orientations.iterrows():  # loop through orientations
-        l, m, n = m2l_utils.ddd2dircos(
-            float(anori["dip"]), float(anori["azimuth"]) + 90.0
-        )
-        l2 = l / sqrt((l * l) + (m * m))
-        m2 = m / sqrt((l * l) + (m * m))
-
-        dx1 = 0
-        dy1 = 0
-        dx2 = m2 * buffer
-        dy2 = -l2 * buffer
-        p1 = Point((dx1 + float(anori["X"]), dy1 + float(anori["Y"])))
-        p2 = Point((dx2 + float(anori["X"]), dy2 + float(anori["Y"])))
-        ddline = LineString((p1, p2))
-        orig = Point((float(anori["X"]), float(anori["Y"])))
-
-        close_dist = 1e9
-        close_fm = ""
-        # close_x = 0
-        # close_y = 0
-
-        for (
-            indx2,
-            acontact,
-        ) in contact_lines.iterrows():  # loop through distinct linestrings dipdir +180
-            if acontact["UNIT_NAME"] in codes:
-                if not str(acontact.geometry) == "None":
-                    isects = ddline.intersection(acontact.geometry)
-                    if isects.geom_type == "MultiPoint":
-                        for pt in isects:
-                            if pt.distance(orig) < buffer * 2:
-                                dist = m2l_utils.ptsdist(
-                                    float(anori["X"]), float(anori["Y"]), pt.x, pt.y
-                                )
-                                if dist < close_dist:
-                                    close_dist = dist
-                                    close_fm = acontact["UNIT_NAME"]
-                                    # close_x = pt.x
-                                    # close_y = pt.y
-                                    sign = 1
-                    elif isects.geom_type == "Point":
-                        if isects.distance(orig) < buffer * 2:
-                            dist = m2l_utils.ptsdist(
-                                float(anori["X"]), float(anori["Y"]), isects.x, isects.y
-                            )
-                            if dist < close_dist:
-                                close_dist = dist
-                                close_fm = acontact["UNIT_NAME"]
-                                # close_x = isects.x
-                                # close_y = isects.y
-                                sign = 1
-
-        dx2 = -m2 * buffer
-        dy2 = l2 * buffer
-        p1 = Point((dx1 + float(anori["X"]), dy1 + float(anori["Y"])))
-        p2 = Point((dx2 + float(anori["X"]), dy2 + float(anori["Y"])))
-        ddline = LineString((p1, p2))
-
-        for (
-            indx2,
-            acontact,
-        ) in contact_lines.iterrows():  # loop through distinct linestrings dipdir
-            if acontact["UNIT_NAME"] in codes:
-                if not str(acontact.geometry) == "None":
-                    isects = ddline.intersection(acontact.geometry)
-                    if isects.geom_type == "MultiPoint":
-                        for pt in isects:
-                            if pt.distance(orig) < buffer * 2:
-                                dist = m2l_utils.ptsdist(
-                                    float(anori["X"]), float(anori["Y"]), pt.x, pt.y
-                                )
-                                if dist < close_dist:
-                                    close_dist = dist
-                                    close_fm = acontact["UNIT_NAME"]
-                                    # close_x = pt.x
-                                    # close_y = pt.y
-                                    sign = 0
-                    elif isects.geom_type == "Point":
-                        if isects.distance(orig) < buffer * 2:
-                            dist = m2l_utils.ptsdist(
-                                float(anori["X"]), float(anori["Y"]), isects.x, isects.y
-                            )
-                            if dist < close_dist:
-                                close_dist = dist
-                                close_fm = acontact["UNIT_NAME"]
-                                # close_x = isects.x
-                                # close_y = isects.y
-                                sign = 0
-
-        if not close_fm == "":
-            # print(sign,anori["formation"],close_fm,int(all_sorts.loc[anori["formation"]]["index"]),int(all_sorts.loc[close_fm]["index"]))
-            if sign == 1:
-                if (
-                    int(all_sorts.loc[anori["formation"]]["index"])
-                    <= int(all_sorts.loc[close_fm]["index"])
-                    and close_dist < buffer * 2
-                ):
-                    polarity = 1
-                else:
-                    polarity = 0
-            else:
-                if (
-                    int(all_sorts.loc[anori["formation"]]["index"])
-                    < int(all_sorts.loc[close_fm]["index"])
-                    and close_dist < buffer * 2
-                ):
-                    polarity = 0
-                else:
-                    polarity = 1
-        else:  # failed to find contact close enough defined by buffer
-            polarity = -999
-        ostr = "{},{},{},{},{},{},{}\n".format(
-            anori["X"],
-            anori["Y"],
-            anori["Z"],
-            anori["azimuth"],
-            anori["dip"],
-            polarity,
-            anori["formation"],
-        )
-        # ostr = str(anori['X'])+","+str(anori['Y'])+","+str(anori['Z'])+","+str(anori['azimuth'])+","+str(anori['dip'])+","+str(polarity)+","+str(anori['formation'])+"\n"
-        f.write(ostr)
-    f.close()
+    orientations["polarity"] = polarity
+    orientations[["X", "Y", "Z", "azimuth", "dip", "polarity", "formation"]].to_csv(
+        os.path.join(config.output_path, "orientations_polarity.csv"), index=False
+    )
     if config.verbose_level != VerboseLevel.NONE:
         print(
             "orientations saved to",
@@ -3727,68 +3682,28 @@ def fault_strat_offset(config: Config, map_data: MapData):
     local_faults = map_data.get_map_data(Datatype.FAULT).copy()
     local_geology = map_data.get_map_data(Datatype.GEOLOGY).copy()
 
-    als_thick = [
-        [
-            "index",
-            "group number",
-            "index in group",
-            "number in group",
-            "code",
-            "group",
-            "uctype",
-            "thickness median",
-        ]
-    ]
-    index = 0
-    for ias, als in all_sorts.iterrows():
-        found = False
-        for ifm, fm in fm_thick.iterrows():
-            if als["code"] == fm["formation"]:
-                als_thick += [
-                    [
-                        index,
-                        als["group number"],
-                        als["index in group"],
-                        als["number in group"],
-                        als["code"],
-                        als["group"],
-                        "erode",
-                        fm["thickness median"],
-                    ]
-                ]
-                index = index + 1
-                found = True
-                break
-        if not found:
-            als_thick += [
-                [
-                    index,
-                    als["group number"],
-                    als["index in group"],
-                    als["number in group"],
-                    als["code"],
-                    als["group"],
-                    "erode",
-                    0,
-                ]
-            ]
-            index = index + 1
-
-    column_names = als_thick.pop(0)
-    new_als = pd.DataFrame(als_thick, columns=column_names)
+    # median thickness of each sorted unit, zero for units without a thickness estimate
+    new_als = all_sorts[
+        ["group number", "index in group", "number in group", "code", "group"]
+    ].merge(
+        fm_thick.drop_duplicates(subset="formation")[["formation", "thickness median"]],
+        how="left",
+        left_on="code",
+        right_on="formation",
+    )
+    new_als.insert(0, "index", np.arange(len(new_als)))
+    new_als["uctype"] = "erode"
+    new_als["thickness median"] = new_als["thickness median"].where(
+        new_als["formation"].notna(), 0
+    )
     fm_no = len(new_als)
 
-    # create and fill array proving mimimum displacement for all possible strat combinations
+    # create and fill array proving mimimum displacement for all possible strat combinations,
+    # entry [i, j] sums the thicknesses of the units strictly between i and j
+    thickness = new_als["thickness median"].to_numpy(dtype=float)
+    between = np.triu(np.tile(thickness[:-1], (fm_no, 1)), k=1)
     fm_thick_arr = np.zeros((fm_no, fm_no))
-
-    for i in range(0, fm_no - 1):
-        thick_diff = 0
-        fm_thick_arr[i, 0] = 0
-        fm_thick_arr[i, 1] = 0
-
-        for j in range(i + 1, fm_no - 1):
-            thick_diff = thick_diff + new_als.iloc[j]["thickness median"]
-            fm_thick_arr[i, j + 1] = thick_diff
+    fm_thick_arr[:, 1:] = np.cumsum(between, axis=1)
 
     np.savetxt(
         os.path.join(config.output_path, "fault_strat_offset_array.csv"),
@@ -3796,7 +3711,7 @@ def fault_strat_offset(config: Config, map_data: MapData):
         delimiter=",",
     )
 
-    new_als.set_index("code", inplace=True)
+    code_index = new_als.drop_duplicates(subset="code").set_index("code")["index"]
 
     all_long_faults = np.genfromtxt(
         os.path.join(config.output_path, "fault_dimensions.csv"),
@@ -3804,8 +3719,8 @@ def fault_strat_offset(config: Config, map_data: MapData):
         dtype="U100",
     )
 
-    data = []
     columns = ["X", "Y", "id", "left_fm", "right_fm", "min_offset", "strat_offset"]
+    df = pd.DataFrame(columns=columns)
     if len(all_long_faults) > 0:
         fault_names = all_long_faults[1:, :1]
 
@@ -3816,115 +3731,72 @@ def fault_strat_offset(config: Config, map_data: MapData):
                 "faults",
             )
 
-        # Create lists of fault segment mid points, and points 10m to the left and right of the
-        # mid points, also build a corresponding list of faultIds for those points
-        lgeomList = []
-        rgeomList = []
-        xmidsList = []
-        ymidsList = []
-        faultIds = []
-        for index, fault in local_faults.iterrows():
-            if "Fault_" + str(fault["GEOMETRY_OBJECT_ID"]) in fault_names:
-                L = fault.geometry.coords
-                avg = lambda x0, x1: (x0 + x1) / 2
-                xmids = [
-                    avg(pts[0][0], pts[1][0])
-                    for pts in [L[index : index + 2] for index in range(len(L) - 1)]
-                ]
-                ymids = [
-                    avg(pts[0][1], pts[1][1])
-                    for pts in [L[index : index + 2] for index in range(len(L) - 1)]
-                ]
-                xdiffs = [
-                    pts[1][0] - pts[0][0]
-                    for pts in [L[index : index + 2] for index in range(len(L) - 1)]
-                ]
-                ydiffs = [
-                    pts[1][1] - pts[0][1]
-                    for pts in [L[index : index + 2] for index in range(len(L) - 1)]
-                ]
-
-                length = lambda p0, p1: Point(p0).distance(Point(p1))
-                seg_lens = [
-                    length(pts[0], pts[1])
-                    for pts in [L[index : index + 2] for index in range(len(L) - 1)]
-                ]
-
-                m = [ydiff / seglen for ydiff, seglen in zip(ydiffs, seg_lens)]
-                l = [xdiff / seglen for xdiff, seglen in zip(xdiffs, seg_lens)]
-
-                lcomb = lambda midx, midy, l, m: Point(midx + (10 * m), midy - (10 * l))
-                rcomb = lambda midx, midy, l, m: Point(midx - (10 * m), midy + (10 * l))
-                lgeomList += [
-                    lcomb(x, y, l1, m1) for x, y, l1, m1 in zip(xmids, ymids, l, m)
-                ]
-                rgeomList += [
-                    rcomb(x, y, l1, m1) for x, y, l1, m1 in zip(xmids, ymids, l, m)
-                ]
-                xmidsList += xmids
-                ymidsList += ymids
-                faultIds += [fault["GEOMETRY_OBJECT_ID"]] * len(xmids)
-
-        # Create geometry from left and right points list and join with geology to
+        # Fault segment mid points, and points 10m to the left and right of the
+        # mid points, with the faultIds for those points
+        local_faults = local_faults[
+            np.isin(
+                "Fault_" + local_faults["GEOMETRY_OBJECT_ID"].astype(str), fault_names
+            )
+        ]
+        xy, vertex_fault = shapely.get_coordinates(
+            local_faults.geometry.values, return_index=True
+        )
+        segment = np.flatnonzero(vertex_fault[1:] == vertex_fault[:-1])
+        xmids = (xy[segment, 0] + xy[segment + 1, 0]) / 2
+        ymids = (xy[segment, 1] + xy[segment + 1, 1]) / 2
+        xdiffs = xy[segment + 1, 0] - xy[segment, 0]
+        ydiffs = xy[segment + 1, 1] - xy[segment, 1]
+        seg_lens = np.sqrt((xdiffs * xdiffs) + (ydiffs * ydiffs))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            m = ydiffs / seg_lens
+            l = xdiffs / seg_lens
+        faultIds = local_faults["GEOMETRY_OBJECT_ID"].to_numpy()[vertex_fault[segment]]
+
+        # Create geometry from left and right points and join with geology to
         # find which formation the point lands in
-        lgdf = gpd.GeoDataFrame(crs=map_data.working_projection, geometry=lgeomList)
-        rgdf = gpd.GeoDataFrame(crs=map_data.working_projection, geometry=rgeomList)
+        lgdf = gpd.GeoDataFrame(
+            crs=map_data.working_projection,
+            geometry=gpd.points_from_xy(xmids + (10 * m), ymids - (10 * l)),
+        )
+        rgdf = gpd.GeoDataFrame(
+            crs=map_data.working_projection,
+            geometry=gpd.points_from_xy(xmids - (10 * m), ymids + (10 * l)),
+        )
         lcode = gpd.sjoin(lgdf, local_geology, how="left", predicate="within")
         lcode = lcode[~lcode.index.duplicated(keep="first")]
         rcode = gpd.sjoin(rgdf, local_geology, how="left", predicate="within")
         rcode = rcode[~rcode.index.duplicated(keep="first")]
 
-        # For each set of joined points fill a 2D list (data) with point information and
-        # what formation is left and right of it, (also list strat column difference and
-        # thus minimum throw for the fault at that position)
-        for i in range(0, len(lcode)):
-            if (
-                not str(lcode.iloc[i]["UNIT_NAME"]) == "nan"
-                and not str(rcode.iloc[i]["UNIT_NAME"]) == "nan"
-            ):
-                lcode_fm = lcode.iloc[i]["UNIT_NAME"]
-                rcode_fm = rcode.iloc[i]["UNIT_NAME"]
-
-                if lcode_fm in codes and rcode_fm in codes:
-                    fm_l = int(new_als.loc[lcode_fm]["index"])
-                    fm_r = int(new_als.loc[rcode_fm]["index"])
-
-                    if fm_l > fm_r:
-                        t = fm_l
-                        fm_l = fm_r
-                        fm_r = t
-                    diff = fm_r - fm_l
-                    number_string = str(diff)
-                    diff = number_string.zfill(3)
-                    if lcode_fm in formations and rcode_fm in formations:
-                        min_offset = fm_thick_arr[fm_l, fm_r]
-                    else:
-                        min_offset = -1
-                    data.append(
-                        [
-                            xmidsList[i],
-                            ymidsList[i],
-                            "Fault_" + str(faultIds[i]),
-                            lcode_fm,
-                            rcode_fm,
-                            min_offset,
-                            diff,
-                        ]
-                    )
-                else:
-                    data.append(
-                        [
-                            xmidsList[i],
-                            ymidsList[i],
-                            "Fault_" + str(faultIds[i]),
-                            "",
-                            "",
-                            -1,
-                            -1,
-                        ]
-                    )
+        # For each joined point list what formation is left and right of it, (also list
+        # strat column difference and thus minimum throw for the fault at that position)
+        lcode_fm = lcode["UNIT_NAME"].to_numpy(dtype=object)
+        rcode_fm = rcode["UNIT_NAME"].to_numpy(dtype=object)
+        found = pd.notna(lcode_fm) & pd.notna(rcode_fm)
+        in_codes = found & np.isin(lcode_fm, codes) & np.isin(rcode_fm, codes)
+        fm_l = code_index.reindex(lcode_fm).fillna(0).to_numpy(dtype=int)
+        fm_r = code_index.reindex(rcode_fm).fillna(0).to_numpy(dtype=int)
+        fm_l, fm_r = np.minimum(fm_l, fm_r), np.maximum(fm_l, fm_r)
+        min_offset = np.where(
+            np.isin(lcode_fm, formations) & np.isin(rcode_fm, formations),
+            fm_thick_arr[fm_l, fm_r],
+            -1,
+        )
+        df = pd.DataFrame(
+            {
+                "X": xmids,
+                "Y": ymids,
+                "id": "Fault_" + faultIds.astype(str).astype(object),
+                "left_fm": np.where(in_codes, lcode_fm, ""),
+                "right_fm": np.where(in_codes, rcode_fm, ""),
+                "min_offset": np.where(in_codes, min_offset, -1).astype(object),
+                "strat_offset": np.where(
+                    in_codes,
+                    np.char.zfill((fm_r - fm_l).astype(str), 3).astype(object),
+                    -1,
+                ),
+            }
+        )[found].infer_objects()
     # Convert list to Dataframe and output to csv
-    df = pd.DataFrame(data, columns=columns)
     df.to_csv(
         os.path.join(config.output_path, "fault_strat_offset3.csv"),
         index=False,
@@ -3951,15 +3823,42 @@ def process_cover(
     use_vector: bool = True,
     use_grid: bool = True,
 ):
+    bbox = config.bbox
+    bbox3D = config.bbox_3d
+    spacing = config.run_flags["cover_spacing"]
+    dtm = map_data.get_map_data(Datatype.DTM)
+    cover = map_data.get_map_data(Datatype.COVER_MAP)
+
+    # heights of every cover polygon vertex, sampled in one pass and looked up by position
+    if use_vector:
+        cover_xy = cover.geometry.get_coordinates().to_numpy()
+        vertex_heights = dict(
+            zip(
+                map(tuple, cover_xy),
+                m2l_utils.values_from_dtm_dtb(
+                    dtm, map_data.dtb, map_data.dtb_null, False, cover_xy
+                ),
+            )
+        )
+        vertex_heights_cover = dict(
+            zip(
+                map(tuple, cover_xy),
+                m2l_utils.values_from_dtm_dtb(
+                    dtm,
+                    map_data.dtb,
+                    map_data.dtb_null,
+                    workflow["cover_map"],
+                    cover_xy,
+                ),
+            )
+        )
+
     if (
         use_grid and use_vector
     ):  # assumes a grid of depth to cover, with a defined null value for no cover, and a vector description of cover limits
         if config.verbose_level != VerboseLevel.NONE:
             print("use_vector, use_grid", use_vector, use_grid)
 
-        bbox = config.bbox
-        bbox3D = config.bbox_3d
-        spacing = config.run_flags["cover_spacing"]
         nx = int((bbox[2] - bbox[0]) / spacing)
         ny = int((bbox[3] - bbox[1]) / spacing)
         x = np.linspace(bbox[0], bbox[2], nx)
@@ -3973,10 +3872,7 @@ def process_cover(
         cover_pts = gpd.GeoDataFrame(df, geometry="coords")
         cover_pts.crs = map_data.working_projection
 
-        cover = map_data.get_map_data(Datatype.COVER_MAP)
-        cover_buffered = gpd.GeoDataFrame(
-            geometry=map_data.get_map_data(Datatype.COVER_MAP).buffer(-1500)
-        )
+        cover_buffered = gpd.GeoDataFrame(geometry=cover.buffer(-1500))
 
         actual_cover = gpd.sjoin(
             cover_pts, cover_buffered, how="inner", predicate="within"
@@ -3986,12 +3882,14 @@ def process_cover(
             print("df,actual_cover", len(df), len(actual_cover))
         allpts = open(os.path.join(config.output_path, "cover_grid.csv"), "w")
         allpts.write("X,Y,Z,formation\n")
-        dtm = map_data.get_map_data(Datatype.DTM).open()
-        for indx, pt in actual_cover.iterrows():
-            locations = [(pt["X"], pt["Y"])]
-            height = m2l_utils.value_from_dtm_dtb(
-                dtm, map_data.dtb, map_data.dtb_null, workflow["cover_map"], locations
-            )
+        heights = m2l_utils.values_from_dtm_dtb(
+            dtm,
+            map_data.dtb,
+            map_data.dtb_null,
+            workflow["cover_map"],
+            actual_cover[["X", "Y"]].to_numpy(),
+        )
+        for (indx, pt), height in zip(actual_cover.iterrows(), heights):
             ostr = "{},{},{},{}\n".format(pt["X"], pt["Y"], height, "cover")
             allpts.write(ostr)
             if (
@@ -4005,7 +3903,7 @@ def process_cover(
                 )
                 allpts.write(ostr)
 
-        for indx, cpoly in map_data.get_map_data(Datatype.COVER_MAP).iterrows():
+        for indx, cpoly in cover.iterrows():
             # need to ignore points outside bbox and make poly os bbox
             coords = extract_poly_coords(cpoly.geometry, 0)
             k = 0
@@ -4022,11 +3920,7 @@ def process_cover(
                         and pt[1] > bbox[1]
                         and pt[1] < bbox[3]
                     ):
-                        locations = [(pt[0], pt[1])]
-
-                        height = m2l_utils.value_from_dtm_dtb(
-                            dtm, map_data.dtb, map_data.dtb_null, False, locations
-                        )
+                        height = vertex_heights[(pt[0], pt[1])]
                         ostr = "{},{},{},{}\n".format(pt[0], pt[1], height, "cover")
                         # ostr = str(pt[0])+","+str(pt[1])+","+height+",cover\n"
                         allpts.write(ostr)
@@ -4058,15 +3952,7 @@ def process_cover(
                                     and pt[1] > bbox[1]
                                     and pt[1] < bbox[3]
                                 ):
-                                    locations = [(pt[0], pt[1])]
-
-                                    height = m2l_utils.value_from_dtm_dtb(
-                                        dtm,
-                                        map_data.dtb,
-                                        map_data.dtb_null,
-                                        False,
-                                        locations,
-                                    )
+                                    height = vertex_heights[(pt[0], pt[1])]
                                     ostr = "{},{},{},{}\n".format(
                                         pt[0], pt[1], height, "cover"
                                     )
@@ -4108,11 +3994,14 @@ def process_cover(
         allpts = open(os.path.join(config.output_path, "cover_grid.csv"), "w")
         allpts.write("X,Y,Z,formation\n")
 
-        for indx, pt in cover_pts.iterrows():
-            locations = [(pt["X"], pt["Y"])]
-            height = m2l_utils.value_from_dtm_dtb(
-                dtm, map_data.dtb, map_data.dtb_null, workflow["cover_map"], locations
-            )
+        heights = m2l_utils.values_from_dtm_dtb(
+            dtm,
+            map_data.dtb,
+            map_data.dtb_null,
+            workflow["cover_map"],
+            cover_pts[["X", "Y"]].to_numpy(),
+        )
+        for (indx, pt), height in zip(cover_pts.iterrows(), heights):
             ostr = "{},{},{},{}\n".format(pt["X"], pt["Y"], height, "cover")
             # ostr = str(pt['X'])+','+str(pt['Y'])+','+str(height)+',cover\n'
             allpts.write(ostr)
@@ -4145,7 +4034,6 @@ def process_cover(
                     lasty = pt[1]
                     first = False
                 # decimate to reduce number of points, but also take second and third point of a series
-                locations = [(pt[0], pt[1])]
                 if (
                     k % config.run_flags["contact_decimate"] == 0
                     or k == int((len(coords["exterior_coords"]) - 1) / 2)
@@ -4165,14 +4053,7 @@ def process_cover(
                             lsx = dlsx / sqrt((dlsx * dlsx) + (dlsy * dlsy))
                             lsy = dlsy / sqrt((dlsx * dlsx) + (dlsy * dlsy))
 
-                            locations = [(pt[0], pt[1])]
-                            height = m2l_utils.value_from_dtm_dtb(
-                                dtm,
-                                map_data.dtb,
-                                map_data.dtb_null,
-                                workflow["cover_map"],
-                                locations,
-                            )
+                            height = vertex_heights_cover[(pt[0], pt[1])]
                             # normal to line segment
                             azimuth = (180 + degrees(atan2(lsy, -lsx))) % 360
                             # pt just a bit in/out from line
@@ -4226,7 +4107,6 @@ def process_cover(
                                 lasty = pt[1]
                                 first = False
                             # decimate to reduce number of points, but also take second and third point of a series
-                            locations = [(pt[0], pt[1])]
                             if (
                                 k % config.run_flags["contact_decimate"] == 0
                                 or k == int((len(coords["interior_coords"]) - 1) / 2)
@@ -4246,14 +4126,7 @@ def process_cover(
                                         lsx = dlsx / sqrt((dlsx * dlsx) + (dlsy * dlsy))
                                         lsy = dlsy / sqrt((dlsx * dlsx) + (dlsy * dlsy))
 
-                                        locations = [(pt[0], pt[1])]
-                                        height = m2l_utils.value_from_dtm_dtb(
-                                            dtm,
-                                            map_data.dtb,
-                                            map_data.dtb_null,
-                                            workflow["cover_map"],
-                                            locations,
-                                        )
+                                        height = vertex_heights_cover[(pt[0], pt[1])]
                                         # normal to line segment
                                         azimuth = (
                                             180 + degrees(atan2(lsy, -lsx))
@@ -4342,7 +4215,7 @@ def save_basal_contacts_orientations_csv(
     f.write("X,Y,Z,azimuth,dip,polarity,formation\n")
     contacts = map_data.basal_contacts_no_faults
     first_geom = contacts.iloc[0].geometry
-    dtm = map_data.get_map_data(Datatype.DTM).open()
+    dtm = map_data.get_map_data(Datatype.DTM)
     for index, contact in contacts[:-1].iterrows():
         i = 0
         # print(contact['UNIT_NAME'])
@@ -1,5 +1,7 @@
 import numpy as np
 from scipy.interpolate import Rbf
+from scipy import linalg
+from scipy.linalg import LinAlgWarning
 import matplotlib.pyplot as plt
 from math import (
     atan2,
@@ -16,6 +18,10 @@ from math import (
 import geopandas as gpd
 import pandas as pd
 import os
+import hashlib
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from shapely.geometry import LineString, Point, MultiLineString
 from . import m2l_utils
 import rasterio
@@ -121,6 +127,100 @@ def scipy_CT(x, y, z, xi, yi):  # actually CloughTocher2DInterpolator
     return interp(xi, yi)
 
 
+######################################
+# inverse distance weighting of the nearest observations only
+#
+# kdtree_idw(x, y, z, xi, yi, neighbours)
+# Args:
+# x,y coordinates of points to be interpolated
+# z value to be interpolated, or (len(x), k) array of values
+# xi,yi grid of points where interpolation of z will be calculated
+# neighbours number of nearest observations used for each interpolated point
+#
+# Same weighting as simple_idw, but the k nearest observations are found with a kd-tree so cost
+# scales as O(M log N) rather than building the full observation x grid distance matrix
+######################################
+
+
+def kdtree_idw_interpolator(x, y, z, neighbours=32):
+    from scipy.spatial import cKDTree
+
+    tree = cKDTree(np.column_stack((np.ravel(x), np.ravel(y))))
+    z = np.asarray(z, dtype=np.float64)
+    k = int(min(neighbours, len(z)))
+
+    return partial(kdtree_idw_evaluate, tree, z, k)
+
+
+def kdtree_idw_evaluate(tree, z, k, xi, yi):
+    dist, idx = tree.query(np.column_stack((np.ravel(xi), np.ravel(yi))), k=k)
+    if k == 1:
+        dist = dist[:, np.newaxis]
+        idx = idx[:, np.newaxis]
+
+    with np.errstate(divide="ignore"):
+        weights = 1.0 / dist
+    # points sitting on an observation take its value
+    exact = dist == 0
+    on_obs = exact.any(axis=1)
+    weights[on_obs] = exact[on_obs]
+    weights /= weights.sum(axis=1, keepdims=True)
+
+    return np.einsum("ij,ij...->i...", weights, z[idx])
+
+
+def kdtree_idw(x, y, z, xi, yi, neighbours=32):
+    interp = kdtree_idw_interpolator(x, y, z, neighbours)
+    return interp(xi, yi)
+
+
+######################################
+# radial basis function interpolation from the nearest observations only
+#
+# local_rbf(x, y, z, xi, yi, neighbours)
+# Args:
+# x,y coordinates of points to be interpolated
+# z value to be interpolated, or (len(x), k) array of values
+# xi,yi grid of points where interpolation of z will be calculated
+# neighbours number of nearest observations used for each interpolated point
+#
+# Multiquadric rbf with the same shape parameter and smoothing as scipy_rbf, but each point is
+# solved from its k nearest observations so large structure datasets don't need an N x N system
+######################################
+
+
+def local_rbf_interpolator(x, y, z, neighbours=32):
+    from scipy.interpolate import RBFInterpolator
+
+    xy = np.column_stack((np.ravel(x), np.ravel(y))).astype(np.float64)
+
+    # scipy Rbf default epsilon, the average distance between nodes
+    edges = np.ptp(xy, axis=0)
+    edges = edges[np.nonzero(edges)]
+    epsilon = np.power(np.prod(edges) / len(xy), 1.0 / edges.size)
+
+    rbf = RBFInterpolator(
+        xy,
+        np.asarray(z, dtype=np.float64),
+        neighbors=int(min(neighbours, len(xy))),
+        kernel="multiquadric",
+        epsilon=1.0 / epsilon,
+        smoothing=0.15,
+        degree=0,
+    )
+
+    return partial(local_rbf_evaluate, rbf)
+
+
+def local_rbf_evaluate(rbf, xi, yi):
+    return rbf(np.column_stack((np.ravel(xi), np.ravel(yi))))
+
+
+def local_rbf(x, y, z, xi, yi, neighbours=32):
+    interp = local_rbf_interpolator(x, y, z, neighbours)
+    return interp(xi, yi)
+
+
 ######################################
 # calculate all distances between to arrays of points
 # Make a distance matrix between pairwise observations
@@ -167,11 +267,16 @@ def plot(x, y, z, grid):
 # x,y coordinates of points to be interpolated
 # z value to be interpolated
 # xi,yi grid of points where interpolation of z will be calculated - sci_py version of Simple Inverse Distance Weighting interpolation of observations z at x,y locations returned at locations defined by xi,yi arrays
+# neighbours number of nearest observations used by the kdtree_idw and local_rbf schemes
 #
 ######################################
-def interpolator_switch(calc, x, y, z, xi, yi):
+def interpolator_switch(calc, x, y, z, xi, yi, neighbours=32):
     if calc == "simple_idw":
         val = simple_idw(x, y, z, xi, yi)
+    elif calc == "kdtree_idw":
+        val = kdtree_idw(x, y, z, xi, yi, neighbours)
+    elif calc == "local_rbf":
+        val = local_rbf(x, y, z, xi, yi, neighbours)
     elif calc == "scipy_idw":
         val = scipy_idw(x, y, z, xi, yi)
     elif calc == "scipy_LNDI":
@@ -186,31 +291,32 @@ def interpolator_switch(calc, x, y, z, xi, yi):
 ######################################
 # interpolate three data arrays using various schemes
 #
-# call_interpolator(calc,x,y,l,m,n,xi,yi,nx,ny,fault_flag)
+# call_interpolator(calc,x,y,l,m,n,xi,yi,nx,ny,fault_flag,neighbours)
 # Args:
 # calc calculation mode, one of 'simple_idw', 'scipy_idw', 'scipy_rbf'
 # l,m,n arrays of direction cosines of pole to plane
 # xi,yi arrays of locations of interpolated locations (assumes a grid for plotting, otherwise doesn't matter)
 # nx,ny number of x,y elemnts in grid
 # fault_flag toggle whether calc for near-fault orientations or not
+# neighbours number of nearest observations used by the kdtree_idw and local_rbf schemes
 #
 # Call interpolator defined by calc for arrays of arbitrary location x,y located observations as triple or double arrays of 3D or 2D direction cosine arrays (l,m,n) and returns grid of nx ,ny interpolated values for points defined by xi,yi locations. Inspired by https://stackoverflow.com/questions/3104781/inverse-distance-weighted-idw-interpolation-with-python
 ######################################
 
 
-def call_interpolator(calc, x, y, l, m, n, xi, yi, nx, ny, fault_flag):
+def call_interpolator(calc, x, y, l, m, n, xi, yi, nx, ny, fault_flag, neighbours=32):
     # Calculate IDW or other interpolators
 
-    ZIl = interpolator_switch(calc, x, y, l, xi, yi)
+    ZIl = interpolator_switch(calc, x, y, l, xi, yi, neighbours)
     if not fault_flag:
         ZIl = ZIl.reshape((ny, nx))
 
-    ZIm = interpolator_switch(calc, x, y, m, xi, yi)
+    ZIm = interpolator_switch(calc, x, y, m, xi, yi, neighbours)
     if not fault_flag:
         ZIm = ZIm.reshape((ny, nx))
 
     if type(n) is not int:
-        ZIn = interpolator_switch(calc, x, y, n, xi, yi)
+        ZIn = interpolator_switch(calc, x, y, n, xi, yi, neighbours)
         if not fault_flag:
             ZIn = ZIn.reshape((ny, nx))
     else:
@@ -221,7 +327,7 @@ def call_interpolator(calc, x, y, l, m, n, xi, yi, nx, ny, fault_flag):
 ######################################
 # Interpolate dipd,dipdirection data from shapefile
 #
-# interpolate_orientations(structure_file,tmp_path,bbox,c_l,use_gcode,scheme,gridx,gridy,fault_flag)
+# interpolate_orientations(structure_file,tmp_path,bbox,c_l,use_gcode,scheme,gridx,gridy,fault_flag,neighbours)
 # Args:
 # structure_file path to orientation layer
 # tmp_path directory of temporary outputs from m2l
@@ -231,6 +337,7 @@ def call_interpolator(calc, x, y, l, m, n, xi, yi, nx, ny, fault_flag):
 # scheme interpolation scheme one of 'simple_idw', 'scipy_idw', 'scipy_rbf'
 # gridx,gridy number of cols & rows in interpolation grid
 # fault_flag toggle whether calc for near-fault orientations or not
+# neighbours number of nearest observations used by the kdtree_idw and local_rbf schemes
 #
 # Interpolate orientation layer to produce regular grid of l,m,n direction cosines
 # Can choose between various RBF and IDW options
@@ -242,7 +349,16 @@ def call_interpolator(calc, x, y, l, m, n, xi, yi, nx, ny, fault_flag):
 
 
 def interpolate_orientations(
-    structure_file, output_path, bbox, c_l, this_gcode, calc, gridx, gridy, fault_flag
+    structure_file,
+    output_path,
+    bbox,
+    c_l,
+    this_gcode,
+    calc,
+    gridx,
+    gridy,
+    fault_flag,
+    neighbours=32,
 ):
     structure = gpd.read_file(structure_file, bbox=bbox)
 
@@ -307,11 +423,11 @@ def interpolate_orientations(
 
     if fault_flag:
         ZIl, ZIm, ZIn = call_interpolator(
-            calc, x, y, l, m, n, gridx, gridy, nx, ny, fault_flag
+            calc, x, y, l, m, n, gridx, gridy, nx, ny, fault_flag, neighbours
         )
     else:
         ZIl, ZIm, ZIn = call_interpolator(
-            calc, x, y, l, m, n, xi, yi, nx, ny, fault_flag
+            calc, x, y, l, m, n, xi, yi, nx, ny, fault_flag, neighbours
         )
 
     # Comparisons...
@@ -469,7 +585,7 @@ def interpolate_orientations(
 ######################################
 # Interpolate 2D contact data from shapefile
 #
-# interpolate_contacts(geology_file,tmp_path,dtm,bbox,c_l,use_gcode,scheme,gridx,gridy,fault_flag)
+# interpolate_contacts(geology_file,tmp_path,dtm,bbox,c_l,use_gcode,scheme,gridx,gridy,fault_flag,neighbours)
 # Args:
 # geology_file path to basal contacts layer
 # tmp_path directory of temporary outputs from m2l
@@ -480,6 +596,7 @@ def interpolate_orientations(
 # scheme interpolation scheme one of 'simple_idw', 'scipy_idw', 'scipy_rbf'
 # gridx,gridy number of cols & rows in interpolation grid
 # fault_flag toggle whether calc for near-fault orientations or not
+# neighbours number of nearest observations used by the kdtree_idw and local_rbf schemes
 #
 # Interpolate basal contacts layer to produce regular grid of l,m direction cosines
 ######################################
@@ -499,6 +616,7 @@ def interpolate_contacts(
     gridx,
     gridy,
     fault_flag,
+    neighbours=32,
 ):
     geol_file = gpd.read_file(geology_file, bbox=bbox)
     # print(len(geol_file))
@@ -693,10 +811,22 @@ def interpolate_contacts(
             nx,
             ny,
             fault_flag,
+            neighbours,
         )
     else:
         ZIl, ZIm, ZIn = call_interpolator(
-            calc, x[:npts], y[:npts], l[:npts], m[:npts], 0, xi, yi, nx, ny, fault_flag
+            calc,
+            x[:npts],
+            y[:npts],
+            l[:npts],
+            m[:npts],
+            0,
+            xi,
+            yi,
+            nx,
+            ny,
+            fault_flag,
+            neighbours,
         )
 
     # Comparisons...
@@ -816,7 +946,7 @@ def interpolate_contacts(
 @beartype.beartype
 def save_contact_vectors(config: Config, map_data, workflow: dict):
     geol_file = map_data.basal_contacts_no_faults
-    dtm = map_data.get_map_data(Datatype.DTM).open()
+    dtm = map_data.get_map_data(Datatype.DTM)
 
     npts = 0
     i = 0
@@ -1184,8 +1314,9 @@ def interpolate_orientations_with_fat(
 
 ####################################################
 # For each fault string:
-# process_fault_throw_and_near_orientations(tmp_path,output_path,dtm_reproj_file,c_l,use_gcode,use_gcode2,dst_crs,bbox,scheme)
+# process_fault_throw_and_near_orientations(tmp_path,output_path,dtm_reproj_file,c_l,use_gcode,use_gcode2,dst_crs,bbox,scheme,neighbours)
 # Args:
+# neighbours number of nearest observations used by the kdtree_idw and local_rbf schemes (interpolation_neighbours run flag)
 #
 #    incementally advance along polyline every at each inter-node (no point in doing more?)
 #    find local stratigraphy 10m to left and right of fault
@@ -1214,6 +1345,7 @@ def process_fault_throw_and_near_orientations(
     dst_crs,
     bbox,
     scheme,
+    neighbours=32,
 ):
     fault_file = os.path.join(tmp_path, "faults_clip.shp")
     geology_file = os.path.join(tmp_path, "geol_clip.shp")
@@ -1714,7 +1846,7 @@ def process_fault_throw_and_near_orientations(
 
     # first calculate interpolation for fault displacement calcs
     interpolate_orientations(
-        structure_file, tmp_path, bbox, c_l, use_gcode, scheme, xi, yi, True
+        structure_file, tmp_path, bbox, c_l, use_gcode, scheme, xi, yi, True, neighbours
     )
     # then for near-fault calcs
     interpolate_orientations(
@@ -1727,6 +1859,7 @@ def process_fault_throw_and_near_orientations(
         all_coords_x,
         all_coords_y,
         True,
+        neighbours,
     )
 
     basal_contacts_file = os.path.join(tmp_path, "basal_contacts.shp")
@@ -1745,6 +1878,7 @@ def process_fault_throw_and_near_orientations(
         xi,
         yi,
         True,
+        neighbours,
     )
     interpolate_contacts(
         basal_contacts_file,
@@ -1760,6 +1894,7 @@ def process_fault_throw_and_near_orientations(
         all_coords_x,
         all_coords_y,
         True,
+        neighbours,
     )
 
     combo_file = os.path.join(tmp_path, "f_combo.csv")
@@ -1921,50 +2056,259 @@ def process_fault_throw_and_near_orientations(
     )
 
 
-def call_interpolator_grid(calc, x, y, l, m, n, xi, yi):
-    # Calculate IDW or other interpolators
+######################################
+# fit an interpolation scheme once to several value arrays sharing the same locations
+#
+# fit_interpolator(calc, x, y, values)
+# Args:
+# calc string naming the interpolator to use
+# x,y coordinates of points to be interpolated
+# values list of value arrays to be interpolated, one per component (e.g. l,m,n)
+# neighbours number of nearest observations used by the kdtree_idw and local_rbf schemes
+#
+# Returns a function f(xi, yi) giving an (len(xi), len(values)) array of interpolated values.
+# The radial basis schemes only depend on the observation locations, so a single vector valued
+# fit replaces one fit per component.
+######################################
+def fit_interpolator(calc, x, y, values, neighbours=32):
+    x = np.asarray(x, dtype=np.float64).ravel()
+    y = np.asarray(y, dtype=np.float64).ravel()
+    z = np.column_stack([np.asarray(v, dtype=np.float64).ravel() for v in values])
+
+    if calc == "simple_idw":
+        return partial(simple_idw, x, y, z)
+    elif calc == "kdtree_idw":
+        return kdtree_idw_interpolator(x, y, z, neighbours)
+    elif calc == "local_rbf":
+        return local_rbf_interpolator(x, y, z, neighbours)
+    elif calc == "scipy_idw":
+        return fit_rbf(x, y, z, function="linear")
+    elif calc == "scipy_LNDI":
+        from scipy.interpolate import LinearNDInterpolator
+
+        return LinearNDInterpolator(list(zip(x, y)), z)
+    elif calc == "scipy_CT":
+        from scipy.interpolate import CloughTocher2DInterpolator
+
+        return CloughTocher2DInterpolator(list(zip(x, y)), z, rescale=True)
+    else:
+        return fit_rbf(x, y, z, function="multiquadric", smooth=0.15)
+
+
+def fit_rbf(x, y, z, **kwargs):
+    # one factorisation of the kernel matrix serves every column of z
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", LinAlgWarning)
+        interp = Rbf(x, y, z, mode="N-D", **kwargs)
+    if not np.all(np.isfinite(interp.nodes)):
+        # repeated observation locations make the kernel matrix singular, fall back on
+        # the same solver a single component Rbf uses
+        interp.nodes = linalg.solve(interp.A, z)
+    return interp
+
+
+######################################
+# number of observations each interpolated point is evaluated against
+#
+# interpolation_footprint(calc, n_obs, neighbours)
+# Args:
+# calc string naming the interpolator to use
+# n_obs number of observations the interpolator was fitted to
+# neighbours number of nearest observations used by the kdtree_idw and local_rbf schemes
+#
+# The global schemes touch every observation, kdtree_idw its k neighbours and local_rbf solves a
+# k x k system per point
+######################################
+def interpolation_footprint(calc, n_obs, neighbours=32):
+    k = min(n_obs, neighbours)
+    if calc == "kdtree_idw":
+        return k
+    elif calc == "local_rbf":
+        return k * k
+    else:
+        return n_obs
+
+
+######################################
+# number of grid points that can be evaluated at once within a memory ceiling
+#
+# interpolation_chunk_size(n_obs, memory_limit)
+# Args:
+# n_obs number of observations each point is evaluated against, see interpolation_footprint()
+# memory_limit memory ceiling in megabytes
+#
+# Evaluating the rbf and idw schemes builds (grid points x observations) float64 arrays for the
+# distances, kernel values and weights, so the chunk is sized to keep three of these under the limit
+######################################
+def interpolation_chunk_size(n_obs, memory_limit):
+    bytes_per_point = 3 * 8 * max(int(n_obs), 1)
+    return max(int(memory_limit * 1024 * 1024 / bytes_per_point), 1)
+
+
+######################################
+# evaluate a fitted interpolator over a set of points in memory bounded chunks
+#
+# evaluate_interpolator(interp, n_obs, ncomp, xi, yi, memory_limit)
+# Args:
+# interp function returned by fit_interpolator()
+# n_obs number of observations each point is evaluated against, see interpolation_footprint()
+# ncomp number of interpolated components
+# xi,yi locations where the interpolation will be calculated
+# memory_limit memory ceiling in megabytes for each chunk
+#
+# Returns (len(xi), ncomp) array of interpolated values
+######################################
+def evaluate_interpolator(interp, n_obs, ncomp, xi, yi, memory_limit=1024):
+    xi = np.asarray(xi, dtype=np.float64).ravel()
+    yi = np.asarray(yi, dtype=np.float64).ravel()
+    zi = np.empty((len(xi), ncomp))
+    chunk = interpolation_chunk_size(n_obs, memory_limit)
+    for start in range(0, len(xi), chunk):
+        stop = start + chunk
+        zi[start:stop] = np.reshape(interp(xi[start:stop], yi[start:stop]), (-1, ncomp))
+    return zi
+
+
+######################################
+# evaluate several fitted interpolators, optionally spread over a pool of worker processes
+#
+# evaluate_interpolators(jobs, memory_limit, n_workers)
+# Args:
+# jobs list of (interp, n_obs, ncomp, xi, yi) tuples as taken by evaluate_interpolator()
+# memory_limit memory ceiling in megabytes for each chunk, held once per worker
+# n_workers number of worker processes, 1 or less evaluates everything in this process
+#
+# Returns list of (len(xi), ncomp) arrays in the same order as jobs. The jobs are handed to each
+# worker once as it starts, so each chunk task only carries (job, start, stop) indices
+######################################
+def evaluate_interpolators(jobs, memory_limit=1024, n_workers=1):
+    jobs = [
+        (
+            interp,
+            n_obs,
+            ncomp,
+            np.asarray(xi, dtype=np.float64).ravel(),
+            np.asarray(yi, dtype=np.float64).ravel(),
+        )
+        for interp, n_obs, ncomp, xi, yi in jobs
+    ]
+    if n_workers <= 1:
+        return [evaluate_interpolator(*job, memory_limit) for job in jobs]
+
+    results = []
+    tasks = []
+    for j, (interp, n_obs, ncomp, xi, yi) in enumerate(jobs):
+        results.append(np.empty((len(xi), ncomp)))
+        # split each job at least n_workers ways so one large supergroup still uses the pool
+        chunk = interpolation_chunk_size(n_obs, memory_limit)
+        chunk = max(min(chunk, -(-len(xi) // n_workers)), 1)
+        tasks += [(j, start, start + chunk) for start in range(0, len(xi), chunk)]
+
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        initializer=init_interpolation_worker,
+        initargs=(jobs,),
+    ) as pool:
+        for (j, start, stop), zi in zip(
+            tasks, pool.map(evaluate_interpolation_task, tasks)
+        ):
+            results[j][start:stop] = zi
+
+    return results
+
+
+_worker_jobs = []
+
+
+def init_interpolation_worker(jobs):
+    global _worker_jobs
+    _worker_jobs = jobs
+
 
-    ZIl = interpolator_switch(calc, x, y, l, xi, yi)
-    ZIm = interpolator_switch(calc, x, y, m, xi, yi)
+def evaluate_interpolation_task(task):
+    j, start, stop = task
+    interp, n_obs, ncomp, xi, yi = _worker_jobs[j]
+    return np.reshape(interp(xi[start:stop], yi[start:stop]), (-1, ncomp))
+
+
+######################################
+# fit an interpolator and package it with the points it is to be evaluated at
+#
+# fit_interpolation_job(calc, x, y, values, xi, yi, neighbours)
+#
+# Returns (interp, n_obs, ncomp, xi, yi) tuple as taken by evaluate_interpolator() and
+# evaluate_interpolators()
+######################################
+def fit_interpolation_job(calc, x, y, values, xi, yi, neighbours=32):
+    interp = fit_interpolator(calc, x, y, values, neighbours)
+    n_obs = interpolation_footprint(calc, len(x), neighbours)
+    return (interp, n_obs, len(values), xi, yi)
+
+
+def call_interpolator_grid(
+    calc, x, y, l, m, n, xi, yi, memory_limit=1024, neighbours=32
+):
+    # Fit the interpolator once for all components and evaluate in chunks
     if type(n) is not int:
-        ZIn = interpolator_switch(calc, x, y, n, xi, yi)
+        values = [l, m, n]
+    else:
+        values = [l, m]
+
+    job = fit_interpolation_job(calc, x, y, values, xi, yi, neighbours)
+    ZI = evaluate_interpolator(*job, memory_limit)
+
+    ZIl = ZI[:, 0]
+    ZIm = ZI[:, 1]
+    if type(n) is not int:
+        ZIn = ZI[:, 2]
     else:
         ZIn = 0
 
     return (ZIl, ZIm, ZIn)
 
 
-def interpolate_orientation_grid(structures, calc, xcoords, ycoords, c_l):
+def interpolate_orientation_grid(
+    structures,
+    calc,
+    xcoords,
+    ycoords,
+    c_l,
+    memory_limit=1024,
+    neighbours=32,
+    seed=None,
+):
+    x, y, l, m, n = orientation_grid_observations(structures, c_l, seed)
+
+    ZIl, ZIm, ZIn = call_interpolator_grid(
+        calc, x, y, l, m, n, xcoords, ycoords, memory_limit, neighbours
+    )
+
+    return orientation_grid_from_lmn(ZIl, ZIm, ZIn)
+
+
+def orientation_grid_observations(structures, c_l, seed=None):
     npts = len(structures)
-    x = np.zeros(npts)
-    y = np.zeros(npts)
-    dip = np.zeros(npts)
-    dipdir = np.zeros(npts)
 
-    i = 0
-    l = np.zeros(npts)
-    m = np.zeros(npts)
-    n = np.zeros(npts)
-    for a_pt in structures.iterrows():
-        x[i] = a_pt[1]["geometry"].x + (np.random.ranf())
-        y[i] = a_pt[1]["geometry"].y + (np.random.ranf())
-        dip[i] = a_pt[1]["DIP"]
+    # sub-metre jitter keeps coincident observations from making the rbf system singular,
+    # drawn from its own generator when seeded so the grids are repeatable between runs
+    if seed is None:
+        jitter = np.random.ranf((npts, 2))
+    else:
+        jitter = np.random.default_rng(seed).random((npts, 2))
+    x = structures.geometry.x.to_numpy() + jitter[:, 0]
+    y = structures.geometry.y.to_numpy() + jitter[:, 1]
 
-        # All orientation have been converted to dipdir
-        dipdir[i] = a_pt[1]["DIPDIR"]
+    # All orientation have been converted to dipdir
+    l, m, n = m2l_utils.ddd2dircos_arr(
+        structures["DIP"].to_numpy(), structures["DIPDIR"].to_numpy()
+    )
 
-        i = i + 1
+    polarity = np.where(structures["POLARITY"].to_numpy() == c_l["btype"], -1, 1)
 
-    for i in range(0, npts):
-        l[i], m[i], n[i] = m2l_utils.ddd2dircos(dip[i], dipdir[i])
-        # this code is now in the right place?
-        if structures.iloc[i]["POLARITY"] == c_l["btype"]:
-            l[i] = -l[i]
-            m[i] = -m[i]
-            n[i] = -n[i]
+    return (x, y, l * polarity, m * polarity, n * polarity)
 
-    ZIl, ZIm, ZIn = call_interpolator_grid(calc, x, y, l, m, n, xcoords, ycoords)
 
+def orientation_grid_from_lmn(ZIl, ZIm, ZIn):
     l2 = ZIl / np.sqrt(ZIl**2 + ZIm**2 + ZIn**2)
     m2 = ZIm / np.sqrt(ZIl**2 + ZIm**2 + ZIn**2)
     n2 = ZIn / np.sqrt(ZIl**2 + ZIm**2 + ZIn**2)
@@ -1985,27 +2329,36 @@ def pts2dircos_arr(p1x, p1y, p2x, p2y):
     return (dx, dy)
 
 
-def interpolate_contacts_grid(contacts, calc, xcoords_group, ycoords_group):
-    decimate = 1
-    i = 0
-    listarray = []
-    for (
-        indx,
-        acontact,
-    ) in contacts.iterrows():  # loop through distinct linestrings in MultiLineString
-        if acontact.geometry.geom_type == "MultiLineString":
-            for line in acontact.geometry.geoms:
-                if i % decimate == 0:
-                    listarray.append([line.coords[0][0], line.coords[0][1]])
-                i = i + 1
-        else:
-            if 1 % decimate == 0:
-                listarray.append(
-                    [acontact.geometry.coords[0][0], acontact.geometry.coords[0][1]]
-                )
-            i = i + 1
+def interpolate_contacts_grid(
+    contacts, calc, xcoords_group, ycoords_group, memory_limit=1024, neighbours=32
+):
+    x, y, l, m = contact_grid_observations(contacts)
+
+    if len(x) > 2:
+        ZIl, ZIm, ZIn = call_interpolator_grid(
+            calc,
+            x,
+            y,
+            l,
+            m,
+            0,
+            xcoords_group,
+            ycoords_group,
+            memory_limit,
+            neighbours,
+        )
+
+        return contact_grid_from_lm(ZIl, ZIm)
+    else:
+        return (0, 0, 0)
+
+
+def contact_grid_observations(contacts):
+    # first vertex of each distinct linestring, MultiLineStrings contribute one per part
+    lines = contacts.geometry.explode(index_parts=False, ignore_index=True)
+    vertices = lines.get_coordinates()
+    coords = vertices[~vertices.index.duplicated()].to_numpy()
 
-    coords = np.array(listarray)
     if len(coords) & 0x1:
         coords2 = coords[: len(coords) - 1, :].reshape((int(len(coords) / 2), 4))
     else:
@@ -2032,17 +2385,15 @@ def interpolate_contacts_grid(contacts, calc, xcoords_group, ycoords_group):
     # m=np.where(l<0, -m, m)
     # l=np.where(l<0, -l, l)
 
-    if len(x) > 2:
-        ZIl, ZIm, ZIn = call_interpolator_grid(
-            calc, x, y, l, m, 0, xcoords_group, ycoords_group
-        )
-        l2 = ZIl / np.sqrt(ZIl**2 + ZIm**2)
-        m2 = ZIm / np.sqrt(ZIl**2 + ZIm**2)
-        S = np.degrees(np.arctan2(l2, m2))
+    return (x, y, l, m)
 
-        return (l2, m2, S)
-    else:
-        return (0, 0, 0)
+
+def contact_grid_from_lm(ZIl, ZIm):
+    l2 = ZIl / np.sqrt(ZIl**2 + ZIm**2)
+    m2 = ZIm / np.sqrt(ZIl**2 + ZIm**2)
+    S = np.degrees(np.arctan2(l2, m2))
+
+    return (l2, m2, S)
 
 
 @beartype.beartype
@@ -2068,13 +2419,33 @@ def interpolation_grids(
     if spacing < 0:
         spacing = -(config.bbox[2] - config.bbox[0]) / spacing
 
+    # grids only depend on these inputs, so a previous run's results can be reused as long
+    # as the jitter is seeded
+    cache_path = config.run_flags["interpolation_cache_path"]
+    cache_key = None
+    if cache_path and config.run_flags["interpolation_seed"] is not None:
+        cache_key = interpolation_cache_key(
+            config,
+            map_data.working_projection,
+            geology,
+            orientations,
+            contacts,
+            super_groups,
+            spacing,
+        )
+        cached = load_interpolation_cache(cache_path, cache_key)
+        if cached is not None:
+            if config.verbose_level != VerboseLevel.NONE:
+                print("interpolation grids loaded from cache", cache_key)
+            return cached
+
     # x = (config.bbox[2] - config.bbox[0]) / spacing
     # y = (config.bbox[3] - config.bbox[1]) / spacing
 
     xcoords = np.arange(config.bbox[0], config.bbox[2], spacing)
     ycoords = np.arange(config.bbox[1], config.bbox[3], spacing)
     xcoords, ycoords = np.meshgrid(xcoords, ycoords)
-    bsh = xcoords.shape
+    grid_shape = xcoords.shape
     xcoords, ycoords = xcoords.flatten(), ycoords.flatten()
 
     xycoords = np.vstack((xcoords, ycoords)).transpose()
@@ -2087,99 +2458,116 @@ def interpolation_grids(
     nodes_code = gpd.sjoin(nodes, geology, how="left", predicate="within")
     # orientations = gpd.sjoin(structures, geology, how="left", predicate="within")
     orientations = orientations[orientations["DIP"] != 0]
-    first_supergroup = True
-    # avoids massive memory rbf calcs by splitting calc into (non-threaded) chunks, maybe try dask + masks??
-    split = 25000
-    # print('split',split,'bsh[0]',bsh[0],'bsh[1]',bsh[1],'spacing',spacing,'xdim',config.bbox[2]-config.bbox[0],'ydim',config.bbox[3]-config.bbox[1])
-    for i in np.arange(0, bsh[0] * bsh[1], split):
-        min = i
-        max = i + split
-        if max > bsh[0] * bsh[1]:
-            max = bsh[0] * bsh[1] + 1
-        # print('rbf_split', min, max)
-        nodes_code_row = nodes_code[min:max]
-        for groups in super_groups:
-            if config.verbose_level != VerboseLevel.NONE:
-                print(groups)
-            first = True
-            for group in groups:
-                if first:
-                    all_nodes = nodes_code_row[nodes_code_row["GROUP"] == group]
-                    all_structures = orientations[orientations["GROUP"] == group]
-                    all_contacts = contacts[
-                        contacts["GROUP"] == group.replace(" ", "_").replace("-", "_")
-                    ]
-                    first = False
-                else:
-                    another_node = nodes_code_row[nodes_code_row["GROUP"] == group]
-                    all_nodes = pd.concat([all_nodes, another_node], sort=False)
-
-                another_contact = contacts[
+    # each supergroup's interpolator is fitted once and evaluated over all of its grid nodes
+    # in chunks sized to stay under the interpolation_memory_limit ceiling (in MB), shared
+    # out over n_workers processes when more than one is requested
+    memory_limit = config.run_flags["interpolation_memory_limit"]
+    neighbours = config.run_flags["interpolation_neighbours"]
+    n_workers = config.run_flags["n_workers"]
+    seed = config.run_flags["interpolation_seed"]
+    jobs = []
+    supergroup_jobs = []
+    for groups in super_groups:
+        if config.verbose_level != VerboseLevel.NONE:
+            print(groups)
+        first = True
+        for group in groups:
+            if first:
+                all_nodes = nodes_code[nodes_code["GROUP"] == group]
+                all_structures = orientations[orientations["GROUP"] == group]
+                all_contacts = contacts[
                     contacts["GROUP"] == group.replace(" ", "_").replace("-", "_")
                 ]
-                all_contacts = pd.concat([all_contacts, another_contact], sort=False)
-
-                another_structure = orientations[orientations["GROUP"] == group]
-                all_structures = pd.concat(
-                    [all_structures, another_structure], sort=False
+                first = False
+            else:
+                another_node = nodes_code[nodes_code["GROUP"] == group]
+                all_nodes = pd.concat([all_nodes, another_node], sort=False)
+
+            another_contact = contacts[
+                contacts["GROUP"] == group.replace(" ", "_").replace("-", "_")
+            ]
+            all_contacts = pd.concat([all_contacts, another_contact], sort=False)
+
+            another_structure = orientations[orientations["GROUP"] == group]
+            all_structures = pd.concat([all_structures, another_structure], sort=False)
+
+        xcoords_group = all_nodes.geometry.x.to_numpy()
+        ycoords_group = all_nodes.geometry.y.to_numpy()
+
+        if len(xcoords_group) > 0:
+            structure_job = None
+            contact_job = None
+            if len(all_structures) > 2:
+                x, y, l, m, n = orientation_grid_observations(
+                    all_structures, config.c_l, seed
                 )
-
-            xcoords_group = all_nodes.geometry.x
-            ycoords_group = all_nodes.geometry.y
-
-            if len(xcoords_group) > 0:
-                if len(all_structures) > 2:
-                    l, m, n, d, dd = interpolate_orientation_grid(
-                        all_structures, scheme, xcoords_group, ycoords_group, config.c_l
+                structure_job = len(jobs)
+                jobs.append(
+                    fit_interpolation_job(
+                        scheme,
+                        x,
+                        y,
+                        [l, m, n],
+                        xcoords_group,
+                        ycoords_group,
+                        neighbours,
                     )
-                    xy_lmn = np.vstack(
-                        (xcoords_group, ycoords_group, l, m, n, d, dd)
-                    ).transpose()
-                    xy_lmn = xy_lmn.reshape(len(l), 7)
-                else:
-                    if config.verbose_level != VerboseLevel.NONE:
-                        print(groups, "has no structures")
+                )
+            else:
+                if config.verbose_level != VerboseLevel.NONE:
+                    print(groups, "has no structures")
+
+            if len(all_contacts) > 0:
+                x, y, l, m = contact_grid_observations(all_contacts)
+                if len(x) > 2:
+                    contact_job = len(jobs)
+                    jobs.append(
+                        fit_interpolation_job(
+                            scheme,
+                            x,
+                            y,
+                            [l, m],
+                            xcoords_group,
+                            ycoords_group,
+                            neighbours,
+                        )
+                    )
+            else:
+                if config.verbose_level != VerboseLevel.NONE:
+                    print(groups, "has no contacts")
+
+            supergroup_jobs.append(
+                (all_nodes.index.to_numpy(), structure_job, contact_job)
+            )
 
-                    xy_lmn = np.zeros((5, len(xcoords_group)))
-                    xy_lmn = np.vstack(
-                        (xcoords_group, ycoords_group, xy_lmn)
-                    ).transpose()
-                    xy_lmn = xy_lmn.reshape(len(xcoords_group), 7)
+    results = evaluate_interpolators(jobs, memory_limit, n_workers)
+
+    # results are written straight into arrays preallocated for the whole grid, at each
+    # node's flat grid index (preserved by the sjoin), so no stacking or sorting is needed
+    xy_lmn_all = np.zeros((len(xcoords), 7))
+    xy_lmn_all[:, 0] = xcoords
+    xy_lmn_all[:, 1] = ycoords
+    xy_lm_contacts_all = np.zeros((len(xcoords), 5))
+    xy_lm_contacts_all[:, 0] = xcoords
+    xy_lm_contacts_all[:, 1] = ycoords
+    filled = np.zeros(len(xcoords), dtype=bool)
+
+    for node_index, structure_job, contact_job in supergroup_jobs:
+        filled[node_index] = True
+        if structure_job is not None:
+            ZI = results[structure_job]
+            l, m, n, d, dd = orientation_grid_from_lmn(ZI[:, 0], ZI[:, 1], ZI[:, 2])
+            xy_lmn_all[node_index, 2:] = np.column_stack((l, m, n, d, dd))
+
+        if contact_job is not None:
+            ZI = results[contact_job]
+            l, m, S = contact_grid_from_lm(ZI[:, 0], ZI[:, 1])
+            xy_lm_contacts_all[node_index, 2:] = np.column_stack((l, m, S))
+
+    # read the nodes out in x then y order, the grid itself is stored y then x
+    order = np.arange(len(xcoords)).reshape(grid_shape).transpose().ravel()
+    order = order[filled[order]]
 
-                if len(all_contacts) > 0:
-                    l, m, S = interpolate_contacts_grid(
-                        all_contacts, scheme, xcoords_group, ycoords_group
-                    )
-                    if type(l) is not int:
-                        xy_lm_contacts = np.vstack(
-                            (xcoords_group, ycoords_group, l, m, S)
-                        ).transpose()
-                        xy_lm_contacts = xy_lm_contacts.reshape(len(l), 5)
-                    else:
-                        xy_lm_contacts = np.zeros((3, len(xcoords_group)))
-                        xy_lm_contacts = np.vstack(
-                            (xcoords_group, ycoords_group, xy_lm_contacts)
-                        ).transpose()
-                        xy_lm_contacts = xy_lm_contacts.reshape(len(xcoords_group), 5)
-                else:
-                    if config.verbose_level != VerboseLevel.NONE:
-                        print(groups, "has no contacts")
-
-                    xy_lm_contacts = np.zeros((3, len(xcoords_group)))
-                    xy_lm_contacts = np.vstack(
-                        (xcoords_group, ycoords_group, xy_lm_contacts)
-                    ).transpose()
-                    xy_lm_contacts = xy_lm_contacts.reshape(len(xcoords_group), 5)
-
-                if first_supergroup:
-                    first_supergroup = False
-                    xy_lmn_all = np.copy(xy_lmn)
-                    xy_lm_contacts_all = np.copy(xy_lm_contacts)
-                else:
-                    xy_lmn_all = np.vstack((xy_lmn_all, xy_lmn))
-                    xy_lm_contacts_all = np.vstack((xy_lm_contacts_all, xy_lm_contacts))
-
-    # sort to get back to x,y grid ordering
     dt = [
         ("X", xy_lmn_all.dtype),
         ("Y", xy_lmn_all.dtype),
@@ -2189,9 +2577,7 @@ def interpolation_grids(
         ("dip", xy_lmn_all.dtype),
         ("dip_dir", xy_lmn_all.dtype),
     ]
-    # assert xy_lmn_all.flags['C_CONTIGUOUS']
-    orientation_interp = xy_lmn_all.ravel().view(dt)
-    orientation_interp.sort(order=["X", "Y", "l", "m", "n", "dip", "dip_dir"])
+    orientation_interp = xy_lmn_all[order].ravel().view(dt)
 
     dt = [
         ("X", xy_lm_contacts_all.dtype),
@@ -2200,9 +2586,7 @@ def interpolation_grids(
         ("m", xy_lm_contacts_all.dtype),
         ("angle", xy_lm_contacts_all.dtype),
     ]
-    # assert xy_lm_contacts_all.flags['C_CONTIGUOUS']
-    contact_interp = xy_lm_contacts_all.ravel().view(dt)
-    contact_interp.sort(order=["X", "Y", "l", "m", "angle"])
+    contact_interp = xy_lm_contacts_all[order].ravel().view(dt)
 
     scale = np.sqrt(1 - (orientation_interp["n"] ** 2))
     lscaled = -scale * contact_interp["m"]
@@ -2238,12 +2622,98 @@ def interpolation_grids(
         )
     ).transpose()
 
-    orientation_interp = pd.DataFrame(orientation_interp)
     contact_interp = pd.DataFrame(contact_interp)
     combo_interp = pd.DataFrame(combo_interp)
+
+    if cache_key is not None:
+        save_interpolation_cache(cache_path, cache_key, contact_interp, combo_interp)
+
+    return (contact_interp, combo_interp)
+
+
+######################################
+# content address for the inputs of interpolation_grids()
+#
+# interpolation_cache_key(config, crs, geology, orientations, contacts, super_groups, spacing)
+# Args:
+# config Config whose interpolation run_flags and c_l apply
+# crs working projection of the grid
+# geology, orientations, contacts GeoDataFrames used to build the grids
+# super_groups list of lists of groups interpolated together
+# spacing grid spacing in metres
+#
+# Returns sha256 hex digest of everything that changes the interpolated grids
+######################################
+def interpolation_cache_key(
+    config, crs, geology, orientations, contacts, super_groups, spacing
+):
+    key = hashlib.sha256()
+    settings = [
+        "interpolation_grids 1",
+        str(crs),
+        repr(tuple(float(b) for b in config.bbox)),
+        repr(float(spacing)),
+        config.run_flags["interpolation_scheme"],
+        repr(config.run_flags["interpolation_neighbours"]),
+        repr(config.run_flags["interpolation_seed"]),
+        config.c_l["btype"],
+        repr(super_groups),
+    ]
+    key.update("\n".join(settings).encode())
+
+    for df, columns in (
+        (geology, ["GROUP"]),
+        (orientations, ["DIP", "DIPDIR", "POLARITY", "GROUP"]),
+        (contacts, ["GROUP"]),
+    ):
+        key.update(str(len(df)).encode())
+        key.update(
+            pd.util.hash_pandas_object(df[columns], index=False).to_numpy().tobytes()
+        )
+        key.update(b"".join(df.geometry.to_wkb()))
+
+    return key.hexdigest()
+
+
+######################################
+# read interpolation_grids() results saved under a cache key
+#
+# load_interpolation_cache(cache_path, cache_key)
+#
+# Returns (contact_interp, combo_interp) DataFrames backed by memory mapped .npy files, or None
+######################################
+def load_interpolation_cache(cache_path, cache_key):
+    contact_file = os.path.join(cache_path, cache_key + "_contact_interp.npy")
+    combo_file = os.path.join(cache_path, cache_key + "_combo_interp.npy")
+    if not (os.path.isfile(contact_file) and os.path.isfile(combo_file)):
+        return None
+
+    contact_interp = pd.DataFrame(
+        np.load(contact_file, mmap_mode="r"), columns=["X", "Y", "l", "m", "angle"]
+    )
+    combo_interp = pd.DataFrame(np.load(combo_file, mmap_mode="r"))
     return (contact_interp, combo_interp)
 
 
+######################################
+# save interpolation_grids() results under a cache key
+#
+# save_interpolation_cache(cache_path, cache_key, contact_interp, combo_interp)
+######################################
+def save_interpolation_cache(cache_path, cache_key, contact_interp, combo_interp):
+    os.makedirs(cache_path, exist_ok=True)
+    for name, df in (
+        ("contact_interp", contact_interp),
+        ("combo_interp", combo_interp),
+    ):
+        filename = os.path.join(cache_path, cache_key + "_" + name + ".npy")
+        # write then rename so a concurrent run never reads a partial file
+        tmp_filename = filename + "." + str(os.getpid()) + ".tmp"
+        with open(tmp_filename, "wb") as f:
+            np.save(f, df.to_numpy(dtype=np.float64))
+        os.replace(tmp_filename, filename)
+
+
 @beartype.beartype
 def process_fault_throw_and_near_faults_from_grid(
     config: Config, map_data, workflow, dip_grid, dip_dir_grid
@@ -2251,7 +2721,7 @@ def process_fault_throw_and_near_faults_from_grid(
     local_faults = map_data.get_map_data(Datatype.FAULT)
     local_faults = local_faults.dropna(subset=["geometry"])
     geology = map_data.get_map_data(Datatype.GEOLOGY)
-    dtm = map_data.get_map_data(Datatype.DTM).open()
+    dtm = map_data.get_map_data(Datatype.DTM)
 
     all_long_faults = np.genfromtxt(
         os.path.join(config.output_path, "fault_dimensions.csv"),
@@ -2274,41 +2744,41 @@ def process_fault_throw_and_near_faults_from_grid(
     # All faults should be LineStrings but just in case they aren't filter for
     # only LineStrings
     local_faults = local_faults[local_faults.geometry.geom_type == "LineString"]
-    lgeomList = []
-    rgeomList = []
-    faultIds = []
-    indexList = []
-    # Looping through each fault
-    for _, fault in local_faults.iterrows():
-        if "Fault_" + str(fault["GEOMETRY_OBJECT_ID"]) in fault_names:
-            lcoords = []
-            rcoords = []
-
-            # make a list of points paralleling the fault, offset by m_step
-            for i in range(0, len(fault.geometry.coords) - 1):
-                l, m = m2l_utils.pts2dircos(
-                    fault.geometry.coords[i][0],
-                    fault.geometry.coords[i][1],
-                    fault.geometry.coords[i + 1][0],
-                    fault.geometry.coords[i + 1][1],
-                )
-                dx = m_step * m
-                dy = m_step * l
-                for inc in np.arange(0.1, 1, 0.01):
-                    midx = fault.geometry.coords[i][0] + (
-                        (fault.geometry.coords[i + 1][0] - fault.geometry.coords[i][0])
-                        * inc
-                    )
-                    midy = fault.geometry.coords[i][1] + (
-                        (fault.geometry.coords[i + 1][1] - fault.geometry.coords[i][1])
-                        * inc
-                    )
-                    lcoords.append([(midx + dx, midy - dy)])
-                    rcoords.append([(midx - dx, midy + dy)])
-            lgeomList += [Point(xy) for xy in lcoords]
-            rgeomList += [Point(xy) for xy in rcoords]
-            faultIds += [fault["GEOMETRY_OBJECT_ID"]] * len(lcoords)
-            indexList += list(np.arange(len(lcoords)))
+
+    # make arrays of points paralleling each fault, offset by m_step either side, at
+    # fractions inc along every segment of every fault, all faults at once
+    long_faults = local_faults[
+        np.isin("Fault_" + local_faults["GEOMETRY_OBJECT_ID"].astype(str), fault_names)
+    ]
+    vertices = long_faults.geometry.reset_index(drop=True).get_coordinates()
+    owner = vertices.index.to_numpy()
+    vx = vertices["x"].to_numpy()
+    vy = vertices["y"].to_numpy()
+
+    # segments are consecutive vertices belonging to the same fault
+    is_segment = owner[:-1] == owner[1:]
+    x0 = vx[:-1][is_segment]
+    y0 = vy[:-1][is_segment]
+    x1 = vx[1:][is_segment]
+    y1 = vy[1:][is_segment]
+    segment_owner = owner[:-1][is_segment]
+
+    l, m = m2l_utils.segment_dircos_arr(x0, y0, x1, y1)
+    inc = np.arange(0.1, 1, 0.01)
+    dx = np.repeat(m_step * m, len(inc))
+    dy = np.repeat(m_step * l, len(inc))
+    midx = (x0[:, np.newaxis] + ((x1 - x0)[:, np.newaxis] * inc)).ravel()
+    midy = (y0[:, np.newaxis] + ((y1 - y0)[:, np.newaxis] * inc)).ravel()
+
+    sample_owner = np.repeat(segment_owner, len(inc))
+    faultIds = long_faults["GEOMETRY_OBJECT_ID"].to_numpy()[sample_owner]
+    # position of each sample along its own fault
+    samples_per_fault = np.bincount(sample_owner, minlength=len(long_faults))
+    first_sample = np.cumsum(samples_per_fault) - samples_per_fault
+    indexList = np.arange(len(sample_owner)) - first_sample[sample_owner]
+
+    lgeomList = gpd.points_from_xy(midx + dx, midy - dy)
+    rgeomList = gpd.points_from_xy(midx - dx, midy + dy)
 
     # As creation of new GeoDataFrames and each sjoin are very expensive per call
     # ensure these are outside of loop by multiplexing a list of points and then
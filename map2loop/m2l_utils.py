@@ -6,6 +6,7 @@ from map2loop.m2l_enums import Datatype
 from shapely.geometry.polygon import Polygon
 from shapely.geometry.multipolygon import MultiPolygon
 import numpy as np
+import shapely
 import rasterio
 import rasterio.warp
 import rasterio.mask
@@ -210,6 +211,92 @@ def value_from_dtm_dtb(dtm, dtb, dtb_null, cover_map, locations):
         return str(value_dtm)
 
 
+############################################
+# bilinearly interpolate a band of pixel centred values at many x,y locations at once
+#
+# bilinear_from_band(band,bounds,x,y)
+# Args:
+# band 2D array of raster values (row 0 at the top of the raster)
+# bounds rasterio style bounds (left, bottom, right, top) of the band
+# x,y arrays of locations in the same coordinate system as bounds
+# Returns:
+# array of interpolated values, boolean array flagging locations whose four
+# neighbouring pixel centres all lie strictly inside bounds, and the minimum of
+# those four neighbouring values (used to detect null cells)
+############################################
+
+
+def bilinear_from_band(band, bounds, x, y):
+    nrows, ncols = band.shape
+    xscale = (bounds.right - bounds.left) / ncols
+    yscale = (bounds.top - bounds.bottom) / nrows
+    col = np.floor((x - bounds.left - (xscale / 2)) / xscale)
+    row = np.floor((y - bounds.bottom - (yscale / 2)) / yscale)
+    delx = (x - (bounds.left + (col * xscale) + (xscale / 2))) / xscale
+    dely = (y - (bounds.bottom + (row * yscale) + (yscale / 2))) / yscale
+    inside = (col >= 0) & (col + 1 < ncols) & (row >= 0) & (row + 1 < nrows)
+
+    # lower left pixel centre of each location, counted from the bottom of the band
+    col = np.where(inside, col, 0).astype(np.int64)
+    row = np.where(inside, row, 0).astype(np.int64)
+    z00 = band[nrows - 1 - row, col].astype(np.float64)
+    z10 = band[nrows - 1 - row, col + 1].astype(np.float64)
+    z01 = band[nrows - 2 - row, col].astype(np.float64)
+    z11 = band[nrows - 2 - row, col + 1].astype(np.float64)
+    values = bilinear_interpolation(delx, dely, z01, z11, z00, z10)
+    return values, inside, np.minimum.reduce([z00, z10, z01, z11])
+
+
+############################################
+# get values from two rasterio rasters (dtm and depth to basement) at many locations at once
+#
+# values_from_dtm_dtb(dtm,dtb,dtb_null,cover_map,locations)
+# Args:
+# dtm rasterio format georeferenced dtm grid
+# dtb rasterio format georeferenced dtb grid
+# dtb_null value when zero cover thickness
+# cover_map boolean wrt to use of dtb
+# locations N x 2 array (or list of x,y tuples) in same coordinate system as the grids
+# Returns:
+# float64 array of N heights, -999 where a location cannot be sampled
+#
+# Batch equivalent of value_from_dtm_dtb, each raster is read once and all locations
+# are interpolated together instead of sampling the raster four times per point.
+############################################
+
+
+def values_from_dtm_dtb(dtm, dtb, dtb_null, cover_map, locations):
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    x = locations[:, 0]
+    y = locations[:, 1]
+    heights = np.full(len(locations), -999.0)
+    if len(locations) == 0:
+        return heights
+
+    value_dtm, valid, _ = bilinear_from_band(dtm.read(1), dtm.bounds, x, y)
+
+    if cover_map:
+        valid &= (
+            (x > dtm.bounds[0])
+            & (x < dtm.bounds[2])
+            & (y > dtm.bounds[1])
+            & (y < dtm.bounds[3])
+            & (x > dtb.bounds[0])
+            & (x < dtb.bounds[2])
+            & (y > dtb.bounds[1])
+            & (y < dtb.bounds[3])
+        )
+        value_dtb, dtb_valid, dtb_min = bilinear_from_band(
+            dtb.read(1), dtb.bounds, x, y
+        )
+        valid &= dtb_valid
+        value_dtb = np.where(dtb_min < -10000, 0.0, value_dtb)
+        heights[valid] = value_dtm[valid] - value_dtb[valid]
+    else:
+        heights[valid] = value_dtm[valid]
+    return heights
+
+
 ############################################
 # turn a simple list into a list of paired data
 #
@@ -935,6 +1022,29 @@ def ddd2dircos(dip, dipdir):
     return (l, m, n)
 
 
+####################################################
+# calculate 3D direction cosines from arrays of dip, dipdirection
+#
+# ddd2dircos_arr(dip,dipdir)
+# Args:
+# dip array of dips of bedding from horizontal
+# dipdir array of clockwise degrees from North of dip direction
+# Returns:
+# l,m,n arrays of direction cosines of pole to plane
+#
+# Vectorised ddd2dircos()
+####################################################
+
+
+def ddd2dircos_arr(dip, dipdir):
+    dipdir = np.radians(np.asarray(dipdir, dtype=np.float64))
+    colatitude = np.radians(90 - np.asarray(dip, dtype=np.float64))
+    l = np.sin(dipdir) * np.cos(colatitude)
+    m = np.cos(dipdir) * np.cos(colatitude)
+    n = np.sin(colatitude)
+    return (l, m, n)
+
+
 ####################################################
 # calculate dip, dipdirection from 3D direction cosines
 #
@@ -982,6 +1092,73 @@ def pts2dircos(p1x, p1y, p2x, p2y):
     return (l, m)
 
 
+####################################################
+# Calulate 2D direction cosines from arrays of pairs of points
+#
+# segment_dircos_arr(p1x,p1y,p2x,p2y)
+# Args:
+# p1x,p1y arrays of points
+# p2x,p2y arrays of other points
+# Returns:
+# l,m arrays of 2D direction cosines of line segments
+#
+# Vectorised pts2dircos(), zero length segments return 0,0
+####################################################
+
+
+def segment_dircos_arr(p1x, p1y, p2x, p2y):
+    dlsx = np.asarray(p1x, dtype=np.float64) - p2x
+    dlsy = np.asarray(p1y, dtype=np.float64) - p2y
+    length = np.sqrt((dlsx * dlsx) + (dlsy * dlsy))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        l = np.where(length > 0, dlsx / length, 0.0)
+        m = np.where(length > 0, dlsy / length, 0.0)
+    return (l, m)
+
+
+####################################################
+# Sample points at a fixed spacing along an array of lines
+#
+# resample_lines(geometries,spacing)
+# Args:
+# geometries array of shapely LineString, MultiLineString, Polygon or MultiPolygon geometries
+# spacing distance between sampled points along each line
+# Returns:
+# x,y arrays of sampled point coordinates
+# index array of the position in geometries each point was sampled from
+#
+# Polygons are sampled along their boundary, and each part of a multipart geometry is
+# sampled separately starting from its first vertex. The end of each line is not sampled.
+# Other geometry types contribute no points.
+####################################################
+
+
+def resample_lines(geometries, spacing):
+    geometries = np.asarray(geometries, dtype=object)
+    type_id = shapely.get_type_id(geometries)
+    targets = geometries.copy()
+    is_polygon = (type_id == 3) | (type_id == 6)
+    targets[is_polygon] = shapely.boundary(geometries[is_polygon])
+
+    # split multipart geometries into their parts, keeping them in input order
+    single = np.flatnonzero((type_id == 1) | (type_id == 3))
+    multi = np.flatnonzero((type_id == 5) | (type_id == 6))
+    parts, part_index = shapely.get_parts(targets[multi], return_index=True)
+    parts = np.concatenate([targets[single], parts])
+    index = np.concatenate([single, multi[part_index]])
+    order = np.argsort(index, kind="stable")
+    parts = parts[order]
+    index = index[order]
+
+    # same distances as np.arange(0, length, spacing)[:-1] along each part
+    npts = np.maximum(np.ceil(shapely.length(parts) / spacing).astype(np.int64) - 1, 0)
+    first = np.cumsum(npts) - npts
+    distances = (np.arange(npts.sum()) - np.repeat(first, npts)) * spacing
+    points = shapely.line_interpolate_point(np.repeat(parts, npts), distances)
+    coords = shapely.get_coordinates(points)
+    return (coords[:, 0], coords[:, 1], np.repeat(index, npts))
+
+
 ####################################################
 # calculate distance between two points
 # duplicated in m2l_geometry, don't know why!
@@ -1026,6 +1203,30 @@ def tri_angle(p1x, p1y, p2x, p2y, p3x, p3y):
     return angle
 
 
+###########################################
+# Apical angles between arrays of three points, first point is at apex
+#
+# Args:
+# p1 Nx2 array of apical points
+# p2 Nx2 array of other points
+# p3 Nx2 array of third points
+#
+# Caluclates angles of each set of three points, coincident points give nan
+###########################################
+
+
+def tri_angle_arr(p1, p2, p3):
+    p12 = np.sqrt(np.sum((p1 - p2) ** 2, axis=1))
+    p13 = np.sqrt(np.sum((p1 - p3) ** 2, axis=1))
+    p23 = np.sqrt(np.sum((p2 - p3) ** 2, axis=1))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cosine = (p12**2 + p13**2 - p23**2) / (2 * p12 * p13)
+    return np.where(
+        np.fabs(cosine) > 1.0, 180.0, np.degrees(np.arccos(np.clip(cosine, -1, 1)))
+    )
+
+
 ###########################################
 # plot_points on map
 ###########################################
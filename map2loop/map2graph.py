@@ -4,12 +4,11 @@ import pandas as pd
 import geopandas as gpd
 import numpy as np
 import networkx as nx
+import shapely
 from geopandas import GeoDataFrame
 from pandas import DataFrame
-from shapely.geometry import Point
 from shapely.ops import snap
 from map2loop import m2l_utils
-from math import acos, degrees
 
 close_f = 1000
 close_b = 1000
@@ -366,166 +365,124 @@ class Map2Graph(object):
     ):
 
         Gfault = nx.DiGraph()
-        fault_intersections = []
-
-        for ind, f in fault_clean.iterrows():
-            Gloop.add_node("Fault_" + f["GEOMETRY_OBJECT_ID"])
-            Gloop.nodes["Fault_" + f["GEOMETRY_OBJECT_ID"]]["ntype"] = "fault"
-            Gloop.nodes["Fault_" + f["GEOMETRY_OBJECT_ID"]]["weight"] = fault_weight
-            Gfault.add_node("Fault_" + f["GEOMETRY_OBJECT_ID"])
-            Gfault.nodes["Fault_" + f["GEOMETRY_OBJECT_ID"]]["ntype"] = "fault"
-            for ind2, f2 in fault_clean.iterrows():
-                if (
-                    not fault_clean.iloc[ind]["GEOMETRY_OBJECT_ID"]
-                    >= fault_clean.iloc[ind2]["GEOMETRY_OBJECT_ID"]
-                ):
-                    if f.geometry.intersects(f2.geometry):
-                        fault_intersections.append(
-                            [
-                                fault_clean.iloc[ind]["GEOMETRY_OBJECT_ID"],
-                                fault_clean.iloc[ind2]["GEOMETRY_OBJECT_ID"],
-                                f.geometry.intersection(f2.geometry),
-                            ]
-                        )
+        fault_ids = fault_clean["GEOMETRY_OBJECT_ID"].to_numpy()
+        geometry = fault_clean.geometry.values
+
+        for fault_id in fault_ids:
+            Gloop.add_node("Fault_" + fault_id)
+            Gloop.nodes["Fault_" + fault_id]["ntype"] = "fault"
+            Gloop.nodes["Fault_" + fault_id]["weight"] = fault_weight
+            Gfault.add_node("Fault_" + fault_id)
+            Gfault.nodes["Fault_" + fault_id]["ntype"] = "fault"
+
+        # candidate fault pairs from the spatial index, each pair once in fault order
+        fault1, fault2 = shapely.STRtree(geometry).query(
+            geometry, predicate="intersects"
+        )
+        keep = fault_ids[fault1] < fault_ids[fault2]
+        order = np.lexsort((fault2[keep], fault1[keep]))
+        fault1 = fault1[keep][order]
+        fault2 = fault2[keep][order]
+        fault_intersections = shapely.intersection(geometry[fault1], geometry[fault2])
 
-        fault_name = fault_clean.set_index("GEOMETRY_OBJECT_ID")
         eps = 0.01
         min_ang = 30
-        for ind, f in fault_name.iterrows():
-            for e in fault_intersections:
-                if e[0] == f.name:
-                    other = e[1]
-                else:
-                    other = e[0]
-                if e[2].distance(Point(f.geometry.coords[0])) < eps:
-                    ind2 = 0
-                    for pt in fault_name.loc[other].geometry.coords[1:-1]:
-                        if Point(pt).distance(e[2]) < eps:
-                            l1, m1 = m2l_utils.pts2dircos(
-                                f.geometry.coords[0][0],
-                                f.geometry.coords[0][1],
-                                f.geometry.coords[1][0],
-                                f.geometry.coords[1][1],
-                            )
-                            l2, m2 = m2l_utils.pts2dircos(
-                                fault_name.loc[other].geometry.coords[ind2 - 1][0],
-                                fault_name.loc[other].geometry.coords[ind2 - 1][1],
-                                fault_name.loc[other].geometry.coords[ind2 + 1][0],
-                                fault_name.loc[other].geometry.coords[ind2 + 1][1],
-                            )
-                            ang = degrees(acos(l1 * l2 + m1 * m2))
-                            if ang > 90:
-                                ang = 180 - ang
-                            if ang < min_ang:
-                                ang_code = "T"
-                            else:
-                                ang_code = "X"
-
-                            Gloop.add_edge("Fault_" + other, "Fault_" + f.name)
-                            Gloop["Fault_" + other]["Fault_" + f.name][
-                                "etype"
-                            ] = "fault_fault"
-                            Gloop["Fault_" + other]["Fault_" + f.name]["fault1"] = (
-                                "Fault_" + other
-                            )
-                            Gloop["Fault_" + other]["Fault_" + f.name]["fault2"] = (
-                                "Fault_" + f.name
-                            )
-                            Gloop["Fault_" + other]["Fault_" + f.name]["angle"] = int(
-                                ang
-                            )
-                            Gloop["Fault_" + other]["Fault_" + f.name][
-                                "topol"
-                            ] = ang_code
-                            Gloop["Fault_" + other]["Fault_" + f.name][
-                                "weight"
-                            ] = fault_fault_weight
-
-                            Gfault.add_edge("Fault_" + other, "Fault_" + f.name)
-                            Gfault["Fault_" + other]["Fault_" + f.name][
-                                "etype"
-                            ] = "fault_fault"
-                            Gfault["Fault_" + other]["Fault_" + f.name]["fault1"] = (
-                                "Fault_" + other
-                            )
-                            Gfault["Fault_" + other]["Fault_" + f.name]["fault2"] = (
-                                "Fault_" + f.name
-                            )
-                            Gfault["Fault_" + other]["Fault_" + f.name]["angle"] = int(
-                                ang
-                            )
-                            Gfault["Fault_" + other]["Fault_" + f.name][
-                                "topol"
-                            ] = ang_code
-                        ind2 = ind2 + 1
-
-                elif e[2].distance(Point(f.geometry.coords[-1])) < eps:
-                    ind2 = 0
-                    for pt in fault_name.loc[other].geometry.coords[1:-1]:
-                        if Point(pt).distance(e[2]) < eps:
-                            l1, m1 = m2l_utils.pts2dircos(
-                                f.geometry.coords[-1][0],
-                                f.geometry.coords[-1][1],
-                                f.geometry.coords[-2][0],
-                                f.geometry.coords[-2][1],
-                            )
-                            l2, m2 = m2l_utils.pts2dircos(
-                                fault_name.loc[other].geometry.coords[ind2 - 1][0],
-                                fault_name.loc[other].geometry.coords[ind2 - 1][1],
-                                fault_name.loc[other].geometry.coords[ind2 + 1][0],
-                                fault_name.loc[other].geometry.coords[ind2 + 1][1],
-                            )
-                            ang = degrees(acos(l1 * l2 + m1 * m2))
-                            if ang > 90:
-                                ang = 180 - ang
-                            if ang < min_ang:
-                                ang_code = "T"
-                            else:
-                                ang_code = "X"
-                            Gloop.add_edge("Fault_" + other, "Fault_" + f.name)
-                            Gloop["Fault_" + other]["Fault_" + f.name][
-                                "etype"
-                            ] = "fault_fault"
-                            Gloop["Fault_" + other]["Fault_" + f.name]["fault1"] = (
-                                "Fault_" + other
-                            )
-                            Gloop["Fault_" + other]["Fault_" + f.name]["fault2"] = (
-                                "Fault_" + f.name
-                            )
-                            Gloop["Fault_" + other]["Fault_" + f.name]["angle"] = int(
-                                ang
-                            )
-                            Gloop["Fault_" + other]["Fault_" + f.name][
-                                "topol"
-                            ] = ang_code
-                            Gloop["Fault_" + other]["Fault_" + f.name][
-                                "weight"
-                            ] = fault_fault_weight
-
-                            Gfault.add_edge("Fault_" + other, "Fault_" + f.name)
-                            Gfault["Fault_" + other]["Fault_" + f.name][
-                                "etype"
-                            ] = "fault_fault"
-                            Gfault["Fault_" + other]["Fault_" + f.name]["fault1"] = (
-                                "Fault_" + other
-                            )
-                            Gfault["Fault_" + other]["Fault_" + f.name]["fault2"] = (
-                                "Fault_" + f.name
-                            )
-                            Gfault["Fault_" + other]["Fault_" + f.name]["angle"] = int(
-                                ang
-                            )
-                            Gfault["Fault_" + other]["Fault_" + f.name][
-                                "topol"
-                            ] = ang_code
-
-                        ind2 = ind2 + 1
-
-            nx.write_gml(
-                Gfault, os.path.join(output_path, "pre_loop_fault_network.gml")
+        # intersections that touch the start, or failing that the end, of each fault
+        intersection_tree = shapely.STRtree(fault_intersections)
+        xy, vertex_fault = shapely.get_coordinates(geometry, return_index=True)
+        nvertex = np.bincount(vertex_fault, minlength=len(geometry))
+        first_vertex = np.cumsum(nvertex) - nvertex
+        last_vertex = first_vertex + nvertex - 1
+        matches = []
+        for end_vertex, next_vertex in (
+            (first_vertex, first_vertex + 1),
+            (last_vertex, last_vertex - 1),
+        ):
+            end_point = shapely.points(xy[end_vertex])
+            fault, e = intersection_tree.query(
+                end_point, predicate="dwithin", distance=eps
+            )
+            near = shapely.distance(fault_intersections[e], end_point[fault]) < eps
+            fault = fault[near]
+            matches.append((fault, e[near], end_vertex[fault], next_vertex[fault]))
+        at_start = np.isin(
+            matches[1][0] * len(fault_intersections) + matches[1][1],
+            matches[0][0] * len(fault_intersections) + matches[0][1],
+        )
+        fault, e, end_vertex, next_vertex = (
+            np.concatenate((start, end[~at_start])) for start, end in zip(*matches)
+        )
+        other = np.where(fault1[e] == fault, fault2[e], fault1[e])
+
+        # interior vertices of the other fault lying on the intersection
+        ninterior = np.maximum(nvertex[other] - 2, 0)
+        candidate = np.repeat(np.arange(len(other)), ninterior)
+        vertex = (
+            np.arange(len(candidate))
+            - np.repeat(np.cumsum(ninterior) - ninterior, ninterior)
+            + first_vertex[other][candidate]
+            + 1
+        )
+        on_intersection = (
+            shapely.distance(
+                shapely.points(xy[vertex]), fault_intersections[e[candidate]]
+            )
+            < eps
+        )
+        candidate = candidate[on_intersection]
+        vertex = vertex[on_intersection]
+        order = np.lexsort((vertex, e[candidate], fault[candidate]))
+        candidate = candidate[order]
+        vertex = vertex[order]
+
+        l1, m1 = m2l_utils.segment_dircos_arr(
+            xy[end_vertex[candidate], 0],
+            xy[end_vertex[candidate], 1],
+            xy[next_vertex[candidate], 0],
+            xy[next_vertex[candidate], 1],
+        )
+        l2, m2 = m2l_utils.segment_dircos_arr(
+            xy[vertex - 1, 0], xy[vertex - 1, 1], xy[vertex + 1, 0], xy[vertex + 1, 1]
+        )
+        ang = np.degrees(np.arccos(np.clip(l1 * l2 + m1 * m2, -1, 1)))
+        ang = np.where(ang > 90, 180 - ang, ang)
+
+        for fault_id, other_id, angle in zip(
+            fault_ids[fault[candidate]], fault_ids[other[candidate]], ang
+        ):
+            if angle < min_ang:
+                ang_code = "T"
+            else:
+                ang_code = "X"
+
+            Gloop.add_edge("Fault_" + other_id, "Fault_" + fault_id)
+            Gloop["Fault_" + other_id]["Fault_" + fault_id]["etype"] = "fault_fault"
+            Gloop["Fault_" + other_id]["Fault_" + fault_id]["fault1"] = (
+                "Fault_" + other_id
+            )
+            Gloop["Fault_" + other_id]["Fault_" + fault_id]["fault2"] = (
+                "Fault_" + fault_id
+            )
+            Gloop["Fault_" + other_id]["Fault_" + fault_id]["angle"] = int(angle)
+            Gloop["Fault_" + other_id]["Fault_" + fault_id]["topol"] = ang_code
+            Gloop["Fault_" + other_id]["Fault_" + fault_id][
+                "weight"
+            ] = fault_fault_weight
+
+            Gfault.add_edge("Fault_" + other_id, "Fault_" + fault_id)
+            Gfault["Fault_" + other_id]["Fault_" + fault_id]["etype"] = "fault_fault"
+            Gfault["Fault_" + other_id]["Fault_" + fault_id]["fault1"] = (
+                "Fault_" + other_id
             )
+            Gfault["Fault_" + other_id]["Fault_" + fault_id]["fault2"] = (
+                "Fault_" + fault_id
+            )
+            Gfault["Fault_" + other_id]["Fault_" + fault_id]["angle"] = int(angle)
+            Gfault["Fault_" + other_id]["Fault_" + fault_id]["topol"] = ang_code
+
+        nx.write_gml(Gfault, os.path.join(output_path, "pre_loop_fault_network.gml"))
 
-            return Gloop
+        return Gloop
 
     def fault_formation_intersections(
         Gloop,
@@ -615,6 +572,31 @@ class Map2Graph(object):
             ] = "group_formation"
         return Gloop
 
+    def deposit_counts(features, deposits, commodities, c_l, radius):
+        # count deposits of each commodity closer than radius to each feature
+        counts = np.zeros((len(features), len(commodities)), dtype=int)
+        if len(features) == 0 or len(deposits) == 0:
+            return counts
+        geometry = features.geometry.values
+        deposit_geometry = deposits.geometry.values
+        commodity_index = (
+            deposits[c_l["mscm"]]
+            .map({com: k for k, com in enumerate(commodities)})
+            .to_numpy()
+        )
+        feature, deposit = shapely.STRtree(deposit_geometry).query(
+            geometry, predicate="dwithin", distance=radius
+        )
+        close = (
+            shapely.distance(geometry[feature], deposit_geometry[deposit]) < radius
+        ) & ~np.isnan(commodity_index[deposit])
+        np.add.at(
+            counts,
+            (feature[close], commodity_index[deposit[close]].astype(int)),
+            1,
+        )
+        return counts
+
     def mineralisation_proximity(
         Gloop,
         output_path,
@@ -629,71 +611,31 @@ class Map2Graph(object):
         commodities = commodity.split(",")
         if "NONE" not in commodity:
             commodities.append("NONE")
-        fault_tmp = fault.copy()
-        b_contacts_gdf_tmp = b_contacts_gdf.copy()
-        i_contacts_gdf_tmp = i_contacts_gdf.copy()
         mindep_geology = gpd.sjoin(mindep, geology, how="left", predicate="within")
 
-        first = True
-        for com in commodities:
-            if not com == "NONE":
-                if first:
-                    mindep_sub = mindep[mindep[c_l["mscm"]] == com].copy()
-                    first = False
-                else:
-                    mindep_sub = pd.concat(
-                        [mindep_sub, mindep[mindep[c_l["mscm"]] == com]], sort=False
-                    )
-
-        for ind, m in mindep_sub.iterrows():
-            fault_tmp["d_" + str(ind)] = fault_tmp.distance(Point(m.geometry))
-
-        for ind, m in mindep_sub.iterrows():
-            if len(b_contacts_gdf_tmp) > 0:
-                b_contacts_gdf_tmp["d_" + str(ind)] = b_contacts_gdf_tmp.distance(
-                    Point(m.geometry)
-                )
-
-        for ind, m in mindep_sub.iterrows():
-            if len(i_contacts_gdf_tmp) > 0:
-                i_contacts_gdf_tmp["d_" + str(ind)] = i_contacts_gdf_tmp.distance(
-                    Point(m.geometry)
-                )
+        deposit_commodities = list(
+            dict.fromkeys(com for com in commodities if not com == "NONE")
+        )
+        b_counts = Map2Graph.deposit_counts(
+            b_contacts_gdf, mindep, deposit_commodities, c_l, close_b
+        )
+        f_counts = Map2Graph.deposit_counts(
+            fault, mindep, deposit_commodities, c_l, close_f
+        )
+        i_counts = Map2Graph.deposit_counts(
+            i_contacts_gdf, mindep, deposit_commodities, c_l, close_i
+        )
 
         for com in commodities:
             if not com == "NONE":
 
-                mindep_com = mindep_sub[mindep_sub[c_l["mscm"]] == com]
+                k = deposit_commodities.index(com)
                 if len(mindep) > 0:
-
-                    bc = []
-                    for ind, b in b_contacts_gdf_tmp.iterrows():
-                        basal_count = 0
-                        for ind2, m in mindep_com.iterrows():
-                            if b["d_" + str(ind2)] < close_b:
-                                basal_count = basal_count + 1
-                        bc.append(basal_count)
-                    if len(b_contacts_gdf_tmp) > 0:
-                        b_contacts_gdf[com + "_min"] = bc
-
-                    fc = []
-                    for ind, f in fault_tmp.iterrows():
-                        fault_count = 0
-                        for ind2, m in mindep_com.iterrows():
-                            if f["d_" + str(ind2)] < close_f:
-                                fault_count = fault_count + 1
-                        fc.append(fault_count)
-                    fault[com + "_min"] = fc
-
-                    ic = []
-                    for ind, i in i_contacts_gdf_tmp.iterrows():
-                        igneous_count = 0
-                        for ind2, m in mindep_com.iterrows():
-                            if i["d_" + str(ind2)] < close_i:
-                                igneous_count = igneous_count + 1
-                        ic.append(igneous_count)
-                    if len(i_contacts_gdf_tmp) > 0:
-                        i_contacts_gdf[com + "_min"] = ic
+                    if len(b_contacts_gdf) > 0:
+                        b_contacts_gdf[com + "_min"] = b_counts[:, k]
+                    fault[com + "_min"] = f_counts[:, k]
+                    if len(i_contacts_gdf) > 0:
+                        i_contacts_gdf[com + "_min"] = i_counts[:, k]
 
                     for ind, b in b_contacts_gdf.iterrows():
                         Gloop.nodes[b["UNIT_NAME"].replace(" ", "_").replace("-", "_")][
@@ -725,9 +667,9 @@ class Map2Graph(object):
                             com + "_min"
                         ] = -1
 
-                    if len(i_contacts_gdf_tmp) > 0:
+                    if len(i_contacts_gdf) > 0:
                         i_contacts_gdf[com + "_min"] = -1
-                    if len(b_contacts_gdf_tmp) > 0:
+                    if len(b_contacts_gdf) > 0:
                         b_contacts_gdf[com + "_min"] = -1
                     fault[com + "_min"] = -1
 
@@ -1305,41 +1247,30 @@ class Map2Graph(object):
         commodities = commodity.split(",")
         if "NONE" not in commodity:
             commodities.append("NONE")
-        fault_tmp = fault.copy()
-        geology_exploded_tmp = geology_exploded.copy()
-        geology_exploded_tmp.crs = geology_exploded.crs
         mindep_geology = gpd.sjoin(
             mindep, geology_exploded, how="left", predicate="within"
         )
 
+        deposit_commodities = list(
+            dict.fromkeys(com for com in commodities if not com == "NONE")
+        )
+        f_counts = Map2Graph.deposit_counts(
+            fault, mindep_geology, deposit_commodities, c_l, close_f
+        )
+
         for com in commodities:
             if not com == "NONE":
                 mindep_com = mindep_geology[mindep_geology[c_l["mscm"]] == com]
 
                 if len(mindep_com) > 0:
 
-                    for ind, m in mindep_com.iterrows():
-                        fault_tmp["d_" + str(ind)] = fault_tmp.distance(
-                            Point(m.geometry)
-                        )
-
-                    gc = []
-                    for ind, g in geology_exploded_tmp.iterrows():
-                        fm_count = 0
-                        for ind2, m in mindep_com.iterrows():
-                            if m["UNIT_NAME"] == g["UNIT_NAME"]:
-                                fm_count = fm_count + 1
-                        gc.append(fm_count)
-                    geology_exploded[com + "_min"] = gc
-
-                    fc = []
-                    for ind, f in fault_tmp.iterrows():
-                        fault_count = 0
-                        for ind2, m in mindep_com.iterrows():
-                            if f["d_" + str(ind2)] < close_f:
-                                fault_count = fault_count + 1
-                        fc.append(fault_count)
-                    fault[com + "_min"] = fc
+                    geology_exploded[com + "_min"] = (
+                        geology_exploded["UNIT_NAME"]
+                        .map(mindep_com["UNIT_NAME"].value_counts())
+                        .fillna(0)
+                        .astype(int)
+                    )
+                    fault[com + "_min"] = f_counts[:, deposit_commodities.index(com)]
 
                     for ind, b in geology_exploded.iterrows():
                         Gloop.nodes[str(ind)][com + "_min"] = b[com + "_min"]
@@ -14,6 +14,110 @@ import numpy
 import sys
 
 
+class CachedRaster:
+    """
+    A decoded, read-only, single band raster held in memory
+
+    Exposes the subset of the rasterio dataset interface used by map2loop (read, sample,
+    index, bounds, transform, profile) so it can be shared by every stage without
+    reopening or re-reading the underlying rasterio file
+
+    Attributes
+    ----------
+    array: numpy.ndarray
+        The read-only band values, row 0 at the top of the raster
+    transform: affine.Affine
+        The affine transform from pixel to world coordinates
+    nodata: float or None
+        The nodata value of the band
+    mask: numpy.ndarray
+        A read-only boolean array flagging nodata pixels
+    bounds: rasterio.coords.BoundingBox
+        The (left, bottom, right, top) bounds of the raster
+    crs: rasterio.crs.CRS
+        The coordinate reference system of the raster
+    profile: dict
+        The rasterio profile needed to write the raster back to file
+    """
+
+    def __init__(self, dataset):
+        """
+        Read band 1 and the georeferencing of an open rasterio dataset into memory
+
+        Args:
+            dataset (rasterio.DatasetReader): The open dataset to materialise
+        """
+        self.array = dataset.read(1)
+        self.array.flags.writeable = False
+        self.transform = dataset.transform
+        self.nodata = dataset.nodata
+        if self.nodata is None:
+            self.mask = numpy.zeros(self.array.shape, dtype=bool)
+        else:
+            self.mask = self.array == self.nodata
+        self.mask.flags.writeable = False
+        self.bounds = dataset.bounds
+        self.crs = dataset.crs
+        self.res = dataset.res
+        self.profile = dataset.profile.copy()
+        self.profile.update({"count": 1})
+
+    @classmethod
+    def from_memfile(cls, memfile):
+        """
+        Create a cached raster from a rasterio MemoryFile
+
+        Args:
+            memfile (rasterio.io.MemoryFile): The in memory raster file to decode
+
+        Returns:
+            CachedRaster: The decoded raster
+        """
+        with memfile.open() as dataset:
+            return cls(dataset)
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    @property
+    def height(self):
+        return self.array.shape[0]
+
+    @property
+    def width(self):
+        return self.array.shape[1]
+
+    def read(self, indexes=None):
+        if indexes is None:
+            return self.array[numpy.newaxis, :, :]
+        return self.array
+
+    def index(self, x, y):
+        return rasterio.transform.rowcol(self.transform, x, y)
+
+    def sample(self, xy):
+        for x, y in xy:
+            row, col = self.index(x, y)
+            if 0 <= row < self.height and 0 <= col < self.width:
+                yield self.array[row, col : col + 1]
+            else:
+                yield numpy.array([self.nodata], dtype=self.array.dtype)
+
+    def open(self):
+        # already decoded so opening is a no-op, kept so existing callers still work
+        return self
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
 class MapData:
     """
     A data structure containing all the map data loaded from map files
@@ -594,23 +698,24 @@ class MapData:
                 f"map2loop error: Could not access DTM server after {num_attempts} attempts"
             )
 
-        self.data[Datatype.DTM] = dtm
+        # decode once so every stage shares the same in memory array
+        self.data[Datatype.DTM] = CachedRaster.from_memfile(dtm)
+        dtm.close()
         self.dirtyflags[Datatype.DTM] = False
         self.data_states[Datatype.DTM] = Datastate.COMPLETE
         if self.config.verbose_level == VerboseLevel.ALL:
-            with dtm.open() as dtmtmp:
-                plt.imshow(
-                    dtmtmp.read(1),
-                    cmap="terrain",
-                    vmin=numpy.percentile(dtmtmp.read(1), 5),
-                    vmax=numpy.percentile(dtmtmp.read(1), 95),
-                )
-                plt.title("DTM Reprojected")
-                plt.show()
+            dtm_array = self.data[Datatype.DTM].read(1)
+            plt.imshow(
+                dtm_array,
+                cmap="terrain",
+                vmin=numpy.percentile(dtm_array, 5),
+                vmax=numpy.percentile(dtm_array, 95),
+            )
+            plt.title("DTM Reprojected")
+            plt.show()
 
     @beartype.beartype
     def calc_depth_grid(self, workflow: dict):
-        # dtm = self.get_map_data(Datatype.DTM).open()
         if self.get_map_data(Datatype.DTB_GRID) is None:
             self.dtb = 0
             self.dtb_null = 0
@@ -714,7 +819,7 @@ class MapData:
 
     @beartype.beartype
     def export_dtm(self, filename: str):
-        with self.get_map_data(Datatype.DTM).open() as dtm:
-            if dtm is not None:
-                with rasterio.open(os.path.join(filename), "w", **(dtm.profile)) as dst:
-                    dst.write(dtm.read())
+        dtm = self.get_map_data(Datatype.DTM)
+        if dtm is not None:
+            with rasterio.open(os.path.join(filename), "w", **(dtm.profile)) as dst:
+                dst.write(dtm.read())
@@ -1,6 +1,7 @@
 import geopandas as gpd
 import numpy as np
 import pandas as pd
+from scipy import sparse
 
 
 def extract_basal_contacts(geology_polygons,column_names):
@@ -33,21 +34,24 @@ def extract_basal_contacts(geology_polygons,column_names):
     # now change the index back to the original index
     lines = lines.set_index('index')
     # calculate the intersection of the lines to determine
-    # which lines are in contact with each other
-    intersection_matrix = np.zeros((len(lines),len(lines)),dtype=bool)
-    for i in range(intersection_matrix.shape[0]):
-        intersection_matrix[i,:] = lines.intersects(lines.loc[i,'geometry'])
-    # now we want to create a dataframe with the lines that are in contact
-    linestrings = []
-    data = []
-    for i in range(intersection_matrix.shape[0]):
-        intersection_matrix[i,i] = False
-        for j in lines.loc[intersection_matrix[i,:]].index:
-            # if lines[i,['age']]
-            l = lines.loc[j,'geometry']
-            linestrings.append(lines.loc[i,:].geometry.intersection(
-                                            l))
-            data.append([])
+    # which lines are in contact with each other, the spatial index
+    # returns every candidate pair in one query and only the touching
+    # pairs are kept in a sparse adjacency matrix
+    line_i, line_j = lines.sindex.query(lines.geometry, predicate="intersects")
+    not_self = line_i != line_j
+    adjacency = sparse.csr_matrix(
+        (
+            np.ones(np.count_nonzero(not_self), dtype=bool),
+            (line_i[not_self], line_j[not_self]),
+        ),
+        shape=(len(lines), len(lines)),
+    )
+    adjacency.sort_indices()
+    # now we want to create a dataframe with the lines that are in contact,
+    # intersecting only the pairs in the adjacency matrix
+    line_i, line_j = adjacency.nonzero()
+    geometry = lines.geometry.values
+    linestrings = geometry[line_i].intersection(geometry[line_j])
 
-    basal_contacts = gpd.gpd.GeoSeries(linestrings)
+    basal_contacts = gpd.GeoSeries(linestrings)
     return basal_contacts
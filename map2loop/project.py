@@ -896,9 +896,7 @@ class Project(object):
             self.config, self.map_data, self.workflow
         )
 
-        # TODO: multi thread / numba jit
-        m2l_geometry.calc_thickness_with_grid(self.config, self.map_data)
-        m2l_geometry.calc_min_thickness_with_grid(self.config, self.map_data)
+        m2l_geometry.calc_full_and_min_thickness_with_grid(self.config, self.map_data)
 
         m2l_geometry.normalise_thickness(self.config.output_path)
 
@@ -6,6 +6,7 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import geopandas as gpd
 import numpy as np
+from scipy import sparse
 from math import degrees, acos
 import warnings
 import beartype
@@ -475,18 +476,30 @@ class Topology(object):
         df[0] = list(df[0].str.replace("^[0-9]*, ", "", regex=True))
         df[0] = list(df[0].str.replace(", ", ""))
         df[1] = list(df[1].str.replace("}", "", regex=False))
-        df.loc[:, 1] = df.loc[:, 1].str.split(",")
+        df[1] = df[1].str.split(",")
         df.rename(columns={0: "code", 1: "FaultList"}, inplace=True)
 
-        # Populate Fault columns with intersections
-        for faultName in faultInfo["Fault"]:
-            df[faultName] = 0
-        for i in range(len(df)):
-            for j in range(len(faultInfo)):
-                if faultInfo["FaultId"][j] in df.loc[i, "FaultList"]:
-                    df.loc[i, faultInfo["Fault"][j]] = 1
-        df.drop(columns="FaultList", inplace=True)
-        unitFaultIntersections = df.set_index("code")
+        # Populate sparse unit x fault incidence with intersections
+        incidence = (
+            df["FaultList"]
+            .explode()
+            .rename("FaultId")
+            .reset_index()
+            .merge(faultInfo, on="FaultId", suffixes=("_unit", "_fault"))
+            .drop_duplicates(subset=["index_unit", "index_fault"])
+        )
+        unitFaultIncidence = sparse.csr_matrix(
+            (
+                np.ones(len(incidence), dtype=np.int64),
+                (incidence["index_unit"], incidence["index_fault"]),
+            ),
+            shape=(len(df), len(faultInfo)),
+        )
+        unitFaultIntersections = pd.DataFrame(
+            unitFaultIncidence.toarray(),
+            index=pd.Index(df["code"], name="code"),
+            columns=faultInfo["Fault"].to_list(),
+        )
         unitFaultIntersections.to_csv(
             os.path.join(config.output_path, "unit-fault-relationships.csv")
         )
@@ -495,27 +508,29 @@ class Topology(object):
         # TODO: Get these from strat column
         summary = pd.read_csv(os.path.join(config.tmp_path, "all_sorts_clean.csv"))
 
-        # Output group fault relationships table
-        df = unitFaultIntersections.join(
-            summary[["code", "group"]].set_index("code"), on="code"
-        )
-        df.set_index("group", inplace=True)
-        groupFaultIntersections = df.groupby("group", sort=False).max()
-        groupFaultIntersections.index.name = "group"
-        groupFaultIntersections.to_csv(
-            os.path.join(config.output_path, "group-fault-relationships.csv")
-        )
-
-        # Output supergroup fault relationships table
-        df = unitFaultIntersections.join(
-            summary[["code", "supergroup"]].set_index("code"), on="code"
-        )
-        df.set_index("supergroup", inplace=True)
-        supergroupFaultIntersections = df.groupby("supergroup", sort=False).max()
-        supergroupFaultIntersections.index.name = "supergroup"
-        supergroupFaultIntersections.to_csv(
-            os.path.join(config.output_path, "supergroup-fault-relationships.csv")
-        )
+        # Output group and supergroup fault relationships tables, a group
+        # intersects a fault if any of its units do
+        units = df[["code"]].reset_index()
+        for level in ["group", "supergroup"]:
+            unitLevels = units.merge(
+                summary[["code", level]], on="code", how="left"
+            ).dropna(subset=[level])
+            levelNames = pd.Index(unitLevels[level].unique(), name=level)
+            levelUnits = sparse.csr_matrix(
+                (
+                    np.ones(len(unitLevels), dtype=np.int64),
+                    (levelNames.get_indexer(unitLevels[level]), unitLevels["index"]),
+                ),
+                shape=(len(levelNames), len(df)),
+            )
+            levelFaultIntersections = pd.DataFrame(
+                ((levelUnits @ unitFaultIncidence).toarray() > 0).astype(np.int64),
+                index=levelNames,
+                columns=unitFaultIntersections.columns,
+            )
+            levelFaultIntersections.to_csv(
+                os.path.join(config.output_path, level + "-fault-relationships.csv")
+            )
 
         # Parse fault fault intersections from map2model output
         # Note: The faults in this file do not always match the unit fault intersection faults!!!
@@ -529,9 +544,13 @@ class Topology(object):
         df[0] = list(df[0].str.replace(" ", "", regex=False))
         df[0] = "Fault_" + df[0]
         df[1] = list(df[1].str.replace("}", "", regex=False))
-        df[1] = [re.findall("\(.*?\)", i) for i in df[1]]
-        for j in range(len(df)):
-            df[1][j] = [i.strip("()").replace(" ", "").split(",") for i in df[1][j]]
+        df[1] = [
+            [
+                i.strip("()").replace(" ", "").split(",")
+                for i in re.findall("\(.*?\)", j)
+            ]
+            for j in df[1]
+        ]
         df.set_index(0, inplace=True)
 
         # Export fault network edges (include to fault nodes that have been culled)
@@ -557,7 +576,7 @@ class Topology(object):
             df2[faultName] = 0
         for idx, row in faultIntersectionEdges.iterrows():
             if idx in df2.index and row["fault_2"] in df2.columns:
-                df2[row["fault_2"]][idx] = 1
+                df2.loc[idx, row["fault_2"]] = 1
         faultFaultIntersections = df2.copy()
         faultFaultIntersections.to_csv(
             os.path.join(config.output_path, "fault-fault-relationships.csv")
@@ -591,14 +610,12 @@ class Topology(object):
 
         # add angle and type of fault intersection to graph
         df = faultIntersectionEdges
-        for i in range(len(df)):
-            if (
-                G.has_node(df.index[i])
-                and G.has_node(df["fault_2"][i])
-                and G.has_edge(df.index[i], df["fault_2"][i])
-            ):
-                G[df.index[i]][df["fault_2"][i]]["angle"] = df["angle"][i]
-                G[df.index[i]][df["fault_2"][i]]["topol"] = df["topol"][i]
+        for fault1, fault2, angle, topol in zip(
+            df.index, df["fault_2"], df["angle"], df["topol"]
+        ):
+            if G.has_node(fault1) and G.has_node(fault2) and G.has_edge(fault1, fault2):
+                G[fault1][fault2]["angle"] = angle
+                G[fault1][fault2]["topol"] = topol
 
         # export graph of fault network to tmp path
         nx.write_gml(G, os.path.join(config.tmp_path, "fault_network.gml"))
@@ -1077,27 +1094,27 @@ class Topology(object):
         # add all geolocated data to a single unconnected node
         Gloop.add_node("Point_data", ntype="points", data=point_data)
 
-        with map_data.get_map_data(Datatype.DTM).open() as dtm:
-            dtm_data = dtm.read(1)
-            bounds = dtm.bounds
-            minx = bounds.left
-            miny = bounds.bottom
-            maxx = bounds.right
-            maxy = bounds.top
-            xscale = (maxx - minx) / dtm_data.shape[1]
-            yscale = (maxy - miny) / dtm_data.shape[0]
-            Gloop.add_node(
-                "DTM_data",
-                ntype="dtm",
-                data=str(dtm_data.tolist()),
-                shape=str(dtm_data.shape),
-                minx=minx,
-                miny=miny,
-                maxx=maxx,
-                maxy=maxy,
-                xscale=xscale,
-                yscale=yscale,
-            )
+        dtm = map_data.get_map_data(Datatype.DTM)
+        dtm_data = dtm.read(1)
+        bounds = dtm.bounds
+        minx = bounds.left
+        miny = bounds.bottom
+        maxx = bounds.right
+        maxy = bounds.top
+        xscale = (maxx - minx) / dtm_data.shape[1]
+        yscale = (maxy - miny) / dtm_data.shape[0]
+        Gloop.add_node(
+            "DTM_data",
+            ntype="dtm",
+            data=str(dtm_data.tolist()),
+            shape=str(dtm_data.shape),
+            minx=minx,
+            miny=miny,
+            maxx=maxx,
+            maxy=maxy,
+            xscale=xscale,
+            yscale=yscale,
+        )
 
         Gloop.add_node("bbox", ntype="bbox", data=str(config.bbox))
 